@@ -0,0 +1,162 @@
+from brownie import web3
+from .constants import (
+    Apr_report_config,
+    apr_report_config
+)
+from .lp_valuation import get_lp_token_amounts
+from .price_service import Price_service
+from .utils import (
+    COMMON_FUND_ID,
+    LOCKUP_FUND_ID,
+    batch_call,
+    get_config,
+    get_farms,
+    print_dict,
+    save_deployment_artifacts
+)
+
+ONE_YEAR = 365 * 86400
+
+
+def _to_percent(value, tvl):
+    return value * 100 / tvl if tvl else None
+
+
+def get_apr_report(conf, price_service, block):
+    """Compute the APR of all the registered farms
+
+    Farm state is read in batched multicalls and all the token prices are
+    fetched in a single pass of the price service.
+
+    Args:
+        conf (Apr_report_config): report configuration
+        price_service (Price_service): price service
+        block (int): block number the report is pinned to
+
+    Returns:
+        []dict: TVL and APRs of each farm
+    """
+    farms = get_farms(conf.farm_registry, block)
+    num_farms = len(farms)
+    farm_data = batch_call(
+        [(farm, 'getRewardTokens', []) for farm in farms] +
+        [(farm, 'getTokenAmounts', []) for farm in farms] +
+        [(farm, 'getRewardFunds', []) for farm in farms],
+        block
+    )
+    # getTokenAmounts reverts on BalancerV2Farm and on UniV2Farm over plain
+    # UniV2 pairs, the E20 farms missing it are valued from their LP pools.
+    missing = [
+        farms[i] for i in range(num_farms)
+        if farm_data[num_farms + i] is None
+    ]
+    if missing:
+        lp_amounts = get_lp_token_amounts(missing, block)
+        for i, farm in enumerate(farms):
+            if farm_data[num_farms + i] is None:
+                farm_data[num_farms + i] = lp_amounts.get(farm.address)
+    pairs = [
+        (i, token)
+        for i in range(num_farms)
+        for token in farm_data[i] or []
+    ]
+    rates = batch_call(
+        [(farms[i], 'getRewardRates', [token]) for i, token in pairs],
+        block
+    )
+
+    tokens = [token for _, token in pairs]
+    for amounts in farm_data[num_farms:2 * num_farms]:
+        if amounts is not None:
+            tokens += amounts[0]
+    prices = price_service.get_prices(tokens, block)
+    decimals = price_service.get_decimals(tokens)
+
+    def to_usd(token, amount):
+        token = token.lower()
+        if token not in prices:
+            return None
+        return prices[token].to_usd(amount, decimals.get(token))
+
+    report = []
+    for i, farm in enumerate(farms):
+        token_amounts = farm_data[num_farms + i]
+        funds = farm_data[2 * num_farms + i]
+        tvl = None
+        if token_amounts is not None:
+            values = [
+                to_usd(token, amount)
+                for token, amount in zip(*token_amounts)
+            ]
+            if None not in values:
+                tvl = sum(values)
+        common_rewards = 0
+        lockup_rewards = 0
+        for (j, token), rate in zip(pairs, rates):
+            if j != i or rate is None:
+                continue
+            common_rewards += to_usd(token, rate[COMMON_FUND_ID]) or 0
+            if len(rate) > LOCKUP_FUND_ID:
+                lockup_rewards += to_usd(token, rate[LOCKUP_FUND_ID]) or 0
+        entry = {
+            'farm': farm.address,
+            'tvl_usd': tvl,
+            'rewards_usd_per_year': (
+                (common_rewards + lockup_rewards) * ONE_YEAR
+            ),
+            'common_apr': None,
+            'lockup_apr': None
+        }
+        if tvl and funds:
+            entry['common_apr'] = _to_percent(common_rewards * ONE_YEAR, tvl)
+            if len(funds) > LOCKUP_FUND_ID and funds[COMMON_FUND_ID][0]:
+                # Lockup deposits earn from both funds on their share of TVL.
+                lockup_tvl = (
+                    tvl * funds[LOCKUP_FUND_ID][0] / funds[COMMON_FUND_ID][0]
+                )
+                entry['lockup_apr'] = entry['common_apr'] + (
+                    _to_percent(lockup_rewards * ONE_YEAR, lockup_tvl) or 0
+                )
+        report.append(entry)
+    return report
+
+
+def main():
+    config_name, conf = get_config(
+        'Select config for APR report',
+        apr_report_config
+    )
+    if type(conf) is not Apr_report_config:
+        print('Incorrect configuration data')
+        return
+    if conf.price_fixture is not None and conf.record_fixture is not None:
+        print('A report can not both serve from and record a fixture')
+        return
+    price_service = Price_service(
+        conf.oracle,
+        ttl=conf.price_ttl,
+        fixture=conf.price_fixture,
+        record=conf.record_fixture is not None
+    )
+    block = web3.eth.block_number if conf.block is None else conf.block
+    report = get_apr_report(conf, price_service, block)
+    if conf.record_fixture is not None:
+        price_service.save_fixture(conf.record_fixture)
+    for entry in report:
+        print_dict(
+            f'Farm {entry["farm"]}',
+            {key: str(value) for key, value in entry.items()},
+            20
+        )
+    print_dict('Price service stats', price_service.stats(), 20)
+    save_deployment_artifacts(
+        {
+            'type': 'AprReport',
+            'block_number': block,
+            'farms': report,
+            'config_name': config_name,
+            'config': conf
+        },
+        config_name,
+        'AprReport'
+    )
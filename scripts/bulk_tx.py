@@ -0,0 +1,247 @@
+from brownie import (
+    Contract,
+    chain,
+    web3
+)
+from .constants import (
+    Bulk_tx_config,
+    Step,
+    bulk_tx_config
+)
+from .deploy_and_upgrade import (
+    get_tx_info,
+    get_user,
+    resolve_args
+)
+from .utils import (
+    confirm,
+    get_config,
+    print_dict,
+    save_deployment_artifacts
+)
+import json
+
+GAS_BUFFER = 1.2
+
+
+def _get_fee_params():
+    """Get the fee fields for the planned transactions
+
+    Returns:
+        dict: EIP-1559 fee fields if supported by the chain else gasPrice
+    """
+    base_fee = web3.eth.get_block('latest').get('baseFeePerGas')
+    if base_fee is None:
+        return {'gasPrice': web3.eth.gas_price}
+    try:
+        priority_fee = web3.eth.max_priority_fee
+    except ValueError:
+        priority_fee = 0
+    return {
+        'maxFeePerGas': 2 * base_fee + priority_fee,
+        'maxPriorityFeePerGas': priority_fee
+    }
+
+
+def _estimate_gas(tx):
+    """Estimate gas for a planned transaction
+
+    Estimation runs against the current state, so transactions depending
+    on the state changes of earlier transactions of the same plan fail
+    like reverting ones, they have to be planned once those are mined.
+
+    Args:
+        tx (dict): transaction with from, to, data and value
+
+    Returns:
+        (int, str): gas limit for the transaction, None and the error if
+            the estimation reverted
+    """
+    try:
+        return int(web3.eth.estimate_gas(tx) * GAS_BUFFER), None
+    except ValueError as e:
+        return None, str(e)
+
+
+def build_plan(config_name, conf, sender):
+    """Build the unsigned transactions for a bulk config
+
+    Steps whose gas estimation reverts are not planned, they are reported
+    in the failed list of the plan and do not take a nonce.
+
+    Args:
+        config_name (str): name of the config
+        conf (Bulk_tx_config): bulk transaction config
+        sender (address): address which will sign the transactions
+
+    Returns:
+        dict: plan with nonces, gas and chain id for every transaction
+    """
+    contract_obj = Contract.from_abi(
+        config_name,
+        conf.contract_address,
+        conf.contract.abi
+    )
+    chain_id = web3.eth.chain_id
+    nonce = web3.eth.get_transaction_count(str(sender), 'pending')
+    fees = _get_fee_params()
+    transactions = []
+    failed = []
+    for step in conf.steps:
+        if type(step) is not Step or not step.transact:
+            print(f'Skipping non transaction step: {step.func}()')
+            continue
+        target = contract_obj
+        if step.contract is not None:
+            target = Contract.from_abi(
+                '',
+                step.contract_addr,
+                step.contract.abi
+            )
+        func = target.get_method_object(target.signatures[step.func])
+        step.args, res = resolve_args(step.args, target, sender)
+        tx = {
+            'from': str(sender),
+            'to': target.address,
+            'data': func.encode_input(*res),
+            'value': 0
+        }
+        tx['gas'], error = _estimate_gas(tx)
+        if tx['gas'] is None:
+            print(f'Gas estimation failed: {step.func}() ({error})')
+            failed.append({'step': step.func, 'to': tx['to'], 'error': error})
+            continue
+        tx.update(fees)
+        tx['chainId'] = chain_id
+        tx['nonce'] = nonce + len(transactions)
+        tx['step'] = step.func
+        transactions.append(tx)
+        print(f'Planned: {step.func}() nonce: {tx["nonce"]}')
+
+    return {
+        'type': 'BulkPlan',
+        'config_name': config_name,
+        'chain_id': chain_id,
+        'sender': str(sender),
+        'transactions': transactions,
+        'failed': failed
+    }
+
+
+def broadcast(signed_plan):
+    """Push pre-signed transactions to the node in a burst
+
+    Transactions already mined (nonce lower than the sender's current
+    nonce) are skipped so that a partially broadcasted file can be resent.
+
+    Args:
+        signed_plan (dict): plan signed by scripts/offline_signer.py
+
+    Returns:
+        []: transaction info of the broadcasted transactions
+    """
+    if signed_plan['chain_id'] != web3.eth.chain_id:
+        print('Signed plan is for a different chain')
+        return []
+    current_nonce = web3.eth.get_transaction_count(signed_plan['sender'])
+    pending = [
+        tx for tx in signed_plan['transactions']
+        if tx['nonce'] >= current_nonce
+    ]
+    skipped = len(signed_plan['transactions']) - len(pending)
+    if skipped:
+        print(f'Skipping {skipped} already mined transactions')
+    if not pending:
+        return []
+    if pending[0]['nonce'] != current_nonce:
+        print(
+            f'Nonce gap: sender nonce is {current_nonce}, plan continues '
+            f'from {pending[0]["nonce"]}'
+        )
+        return []
+
+    print(f'\nBroadcasting {len(pending)} transactions')
+    for tx in pending:
+        web3.eth.send_raw_transaction(tx['raw_tx'])
+
+    tx_list = []
+    for tx in pending:
+        receipt = chain.get_transaction(tx['tx_hash'])
+        receipt.wait(1)
+        tx_list.append(get_tx_info(tx['step'], receipt))
+    return tx_list
+
+
+def create_plan(deployer):
+    config_name, conf = get_config(
+        'Select config for bulk transactions',
+        bulk_tx_config
+    )
+    if type(conf) is not Bulk_tx_config:
+        print('Incorrect configuration data')
+        return
+    print(json.dumps(conf, default=lambda o: o.__dict__, indent=2))
+    confirm('Are the above configurations correct?')
+    plan = build_plan(config_name, conf, deployer)
+    print_dict(
+        'Printing plan data',
+        {
+            'sender': plan['sender'],
+            'chain_id': plan['chain_id'],
+            'num_transactions': len(plan['transactions']),
+            'num_failed': len(plan['failed'])
+        },
+        20
+    )
+    for entry in plan['failed']:
+        print_dict(f'Failed {entry["step"]}()', entry, 20)
+    if plan['failed']:
+        confirm('Save the plan without the failed transactions?')
+    save_deployment_artifacts(plan, config_name, 'BulkPlan')
+    print(
+        '\nSign the plan offline with:\n'
+        'python scripts/offline_signer.py <plan> <output> '
+        '--keystore <keystore>\n'
+    )
+
+
+def broadcast_plan():
+    file = input('Signed plan file: ')
+    with open(file) as signed_file:
+        signed_plan = json.load(signed_file)
+    confirm(
+        f'Broadcast {len(signed_plan["transactions"])} transactions '
+        f'from {signed_plan["sender"]}?'
+    )
+    tx_list = broadcast(signed_plan)
+    if not tx_list:
+        return
+    data = {
+        'type': 'BulkBroadcast',
+        'transactions': tx_list,
+        'config_name': signed_plan['config_name'],
+        'sender': signed_plan['sender']
+    }
+    save_deployment_artifacts(
+        data,
+        signed_plan['config_name'],
+        'BulkBroadcast'
+    )
+
+
+def main():
+    menu = '\nPlease select one of the following options: \n \
+    1. Build bulk transaction plan \n \
+    2. Broadcast signed plan \n \
+    3. Exit \n \
+    -> '
+    while True:
+        choice = input(menu)
+        if choice == '1':
+            create_plan(get_user('Signer account: '))
+        elif choice == '2':
+            broadcast_plan()
+        elif choice == '3':
+            break
+        else:
+            print('Please select a valid option')
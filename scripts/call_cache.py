@@ -0,0 +1,365 @@
+"""Cache of view calls shared by the scripts.
+
+Calls are split in two kinds of entries:
+- immutable: constants and values fixed at initialization (upper case
+  getters, getRewardTokens, farmToken, ...), cached forever and stored on
+  disk for live networks.
+- block-scoped: any other view call, cached by block number in an LRU
+  and only while reads are pinned to a block.
+
+Immutable entries are keyed by the ERC1967 implementation of the contract
+(zero for non proxies), so getters of upgradeable proxies are read again
+after an upgrade. Implementations are read once per pinned block, or once
+per session for unpinned reads, the missing ones in one batched request.
+invalidate() drops them after an upgrade sent by this process.
+
+New immutable entries are written to disk by flush(), at the end of each
+pin(), of each batch_call() and on exit.
+
+FarmDeployer's farmImplementation and farmId are owner updatable through
+updateFarmImplementation, they are block-scoped like any other view call.
+"""
+from brownie import (
+    network,
+    web3
+)
+from .utils import (
+    IMPLEMENTATION_SLOT,
+    _to_json,
+    batch_call,
+    batch_rpc,
+    is_local_network
+)
+from collections import OrderedDict
+from contextlib import contextmanager
+import atexit
+import eth_utils
+import json
+import os
+
+CACHE_DIR = '.call_cache'
+MAX_CACHE_SIZE = 4096
+IMMUTABLE_FUNCS = [
+    'getRewardTokens',
+    'farmToken',
+    'nftContract',
+    'uniswapPool',
+    'camelotPool',
+    'decimals',
+    'symbol',
+    'name'
+]
+
+
+def _is_view(method):
+    # Overloaded methods have no single abi and are not cached.
+    abi = getattr(method, 'abi', None)
+    return abi is not None and abi['stateMutability'] in ['view', 'pure']
+
+
+def _is_immutable(name):
+    # Upper case getters are constants and immutables by convention.
+    return name in IMMUTABLE_FUNCS or name.isupper()
+
+
+class Call_cache():
+    def __init__(self, max_size=MAX_CACHE_SIZE):
+        self.max_size = max_size
+        self.block = None
+        self.blocks = OrderedDict()
+        self.immutable = None
+        self.dirty = False
+        # Implementations of unpinned reads, kept for the session.
+        self.implementations = {}
+        self.hits = {'immutable': 0, 'block': 0}
+        self.misses = {'immutable': 0, 'block': 0, 'uncached': 0}
+
+    def _get_path(self):
+        # Local chains are reset between runs, their addresses can not
+        # be cached beyond the session.
+        if is_local_network():
+            return None
+        return os.path.join(CACHE_DIR, network.show_active() + '.json')
+
+    def _load(self):
+        if self.immutable is not None:
+            return
+        self.immutable = {}
+        path = self._get_path()
+        if path is not None and os.path.exists(path):
+            with open(path) as cache_file:
+                # Entries of older files are not keyed by implementation.
+                self.immutable = {
+                    key: val for key, val in json.load(cache_file).items()
+                    if '@' in key
+                }
+
+    def flush(self):
+        """Write the new immutable entries to disk"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        path = self._get_path()
+        if path is None:
+            return
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as cache_file:
+            json.dump(self.immutable, cache_file, default=_to_json, indent=4)
+        os.replace(tmp_path, path)
+
+    def _set_block_value(self, key, val):
+        self.blocks[key] = val
+        self.blocks.move_to_end(key)
+        while len(self.blocks) > self.max_size:
+            self.blocks.popitem(last=False)
+
+    def _get_key(self, contract_obj, name, args):
+        args = json.dumps(args, default=_to_json)
+        return f'{contract_obj.address.lower()}:{name}:{args}'
+
+    def _get_cached_implementation(self, address, block):
+        if block is None:
+            return self.implementations.get(address)
+        return self.blocks.get((block, address + ':' + IMPLEMENTATION_SLOT))
+
+    def _get_implementations(self, addresses, block):
+        """ERC1967 implementations of contracts, misses read in one batch
+
+        Args:
+            addresses ([]str): lower case contract addresses
+            block (int): block number of the reads, latest if None
+
+        Returns:
+            {str: str}: implementation by address
+        """
+        impls = {}
+        misses = []
+        for address in dict.fromkeys(addresses):
+            impl = self._get_cached_implementation(address, block)
+            if impl is None:
+                misses.append(address)
+            else:
+                impls[address] = impl
+        slots = batch_rpc(
+            'eth_getStorageAt',
+            [
+                [
+                    eth_utils.to_checksum_address(address),
+                    IMPLEMENTATION_SLOT,
+                    'latest' if block is None else hex(block)
+                ]
+                for address in misses
+            ]
+        )
+        for address, slot in zip(misses, slots):
+            if slot is None:
+                slot = web3.eth.get_storage_at(
+                    eth_utils.to_checksum_address(address),
+                    IMPLEMENTATION_SLOT,
+                    block_identifier=block
+                ).hex()
+            impl = '0x' + slot[-40:]
+            if block is None:
+                self.implementations[address] = impl
+            else:
+                self._set_block_value(
+                    (block, address + ':' + IMPLEMENTATION_SLOT),
+                    impl
+                )
+            impls[address] = impl
+        return impls
+
+    def _get_immutable_key(self, key, impls):
+        return impls[key.split(':', 1)[0]] + '@' + key
+
+    def call(self, contract_obj, func_sig, args, block=None):
+        """Run a view call through the cache
+
+        Args:
+            contract_obj (contract): contract to be called
+            func_sig (str): function selector
+            args ([]): resolved arguments
+            block (int): block number of the call, the pinned block if None
+
+        Returns:
+            val: return value of the call
+        """
+        block = self.block if block is None else block
+        method = contract_obj.get_method_object(func_sig)
+        name = method.abi['name']
+        key = self._get_key(contract_obj, func_sig, list(args))
+        if _is_immutable(name):
+            self._load()
+            key = self._get_immutable_key(
+                key,
+                self._get_implementations(
+                    [contract_obj.address.lower()],
+                    block
+                )
+            )
+            if key in self.immutable:
+                self.hits['immutable'] += 1
+                return self.immutable[key]
+            self.misses['immutable'] += 1
+            val = method.call(*args, block_identifier=block)
+            self.immutable[key] = val
+            self.dirty = True
+            return val
+        if block is None:
+            self.misses['uncached'] += 1
+            return method.call(*args)
+        block_key = (block, key)
+        if block_key in self.blocks:
+            self.hits['block'] += 1
+            self.blocks.move_to_end(block_key)
+            return self.blocks[block_key]
+        self.misses['block'] += 1
+        val = method.call(*args, block_identifier=block)
+        self._set_block_value(block_key, val)
+        return val
+
+    def batch_call(self, calls):
+        """Run view calls through the cache, misses in batched multicalls
+
+        Args:
+            calls ([(contract, str, [])]): contract, function name and args
+
+        Returns:
+            []: results in the order of calls, None for reverted calls
+        """
+        self._load()
+        impls = self._get_implementations(
+            [
+                contract_obj.address.lower()
+                for contract_obj, func_name, _ in calls
+                if _is_immutable(func_name)
+            ],
+            self.block
+        )
+        results = [None] * len(calls)
+        misses = []
+        for i, (contract_obj, func_name, args) in enumerate(calls):
+            func_sig = contract_obj.signatures[func_name]
+            key = self._get_key(contract_obj, func_sig, list(args))
+            if _is_immutable(func_name):
+                key = self._get_immutable_key(key, impls)
+                if key in self.immutable:
+                    self.hits['immutable'] += 1
+                    results[i] = self.immutable[key]
+                    continue
+                self.misses['immutable'] += 1
+            elif self.block is None:
+                self.misses['uncached'] += 1
+            elif (self.block, key) in self.blocks:
+                self.hits['block'] += 1
+                self.blocks.move_to_end((self.block, key))
+                results[i] = self.blocks[(self.block, key)]
+                continue
+            else:
+                self.misses['block'] += 1
+            misses.append((i, key, func_name))
+        values = batch_call(
+            [calls[i] for i, _, _ in misses],
+            self.block
+        )
+        for (i, key, func_name), val in zip(misses, values):
+            results[i] = val
+            if val is None:
+                continue
+            if _is_immutable(func_name):
+                self.immutable[key] = val
+                self.dirty = True
+            elif self.block is not None:
+                self._set_block_value((self.block, key), val)
+        self.flush()
+        return results
+
+    @contextmanager
+    def pin(self, block=None):
+        """Pin all the reads through the cache to one block
+
+        Args:
+            block (int): block number, latest if None
+        """
+        previous = self.block
+        self.block = web3.eth.block_number if block is None else block
+        try:
+            yield self.block
+        finally:
+            self.block = previous
+            self.flush()
+
+    def invalidate(self, address):
+        """Drop the cached values and implementation of a contract"""
+        self._load()
+        prefix = address.lower() + ':'
+        immutable = {
+            key: val for key, val in self.immutable.items()
+            if not key.split('@', 1)[1].startswith(prefix)
+        }
+        if len(immutable) != len(self.immutable):
+            self.immutable = immutable
+            self.dirty = True
+            self.flush()
+        self.implementations.pop(address.lower(), None)
+        for key in [k for k in self.blocks if k[1].startswith(prefix)]:
+            del self.blocks[key]
+
+    def stats(self):
+        return {
+            'immutable_hits': self.hits['immutable'],
+            'immutable_misses': self.misses['immutable'],
+            'block_hits': self.hits['block'],
+            'block_misses': self.misses['block'],
+            'uncached_calls': self.misses['uncached'],
+            'cached_blocks_entries': len(self.blocks)
+        }
+
+
+class Cached_contract():
+    """Contract wrapper sending its view calls through a Call_cache
+
+    View calls accept the block_identifier keyword, block numbers are part
+    of the cache key. Calls with a trailing tx dict (e.g. {'from': ...})
+    are not cached as they can depend on msg.sender.
+    """
+
+    def __init__(self, contract_obj, cache):
+        self.contract = contract_obj
+        self.cache = cache
+
+    def __getattr__(self, name):
+        attr = getattr(self.contract, name)
+        func_sig = self.contract.signatures.get(name)
+        if func_sig is None or not _is_view(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            unsupported = set(kwargs) - {'block_identifier'}
+            if unsupported:
+                raise TypeError(
+                    f'{name}() got unsupported keyword arguments: '
+                    f'{", ".join(sorted(unsupported))}'
+                )
+            block = kwargs.get('block_identifier')
+            # Tags like 'latest' are not cacheable block numbers.
+            if args and isinstance(args[-1], dict) or \
+                    block is not None and type(block) is not int:
+                return attr(*args, **kwargs)
+            return self.cache.call(
+                self.contract,
+                func_sig,
+                args,
+                block
+            )
+        return call
+
+
+call_cache = Call_cache()
+atexit.register(call_cache.flush)
+
+
+def cached(contract_obj):
+    """Wrap a contract so its view calls use the shared call cache"""
+    return Cached_contract(contract_obj, call_cache)
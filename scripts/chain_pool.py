@@ -0,0 +1,354 @@
+"""Pool of warm Anvil chains started from a captured chain state.
+
+The state and the address manifest are built once with
+`scripts/chain_state.py`. This module intentionally does not depend on
+brownie so that the pool can be served next to the scripts and tests using
+it:
+
+    python scripts/chain_pool.py serve chain_states/<name> --size 4 \\
+        --fork-url <rpc url>
+    python scripts/chain_pool.py acquire chain_states/<name>
+    python scripts/chain_pool.py release chain_states/<name> <port>
+
+Every chain is snapshotted right after it is started. A chain is leased by
+creating its lock file and is recycled on release by reverting it to the
+snapshot, which takes milliseconds instead of replaying the deployments.
+Locks left by dead processes are recycled and reused by the next acquire,
+lease decisions are serialized by a flock of each port.
+
+Brownie scripts use a leased chain through a network whose host is the
+lease rpc url, e.g.
+`brownie networks add Development anvil-pool-8600 host=http://127.0.0.1:8600
+cmd=anvil` then `brownie run <script> --network anvil-pool-8600`.
+"""
+from contextlib import contextmanager
+from urllib import request
+import argparse
+import fcntl
+import json
+import os
+import signal
+import subprocess
+import time
+
+BASE_PORT = 8600
+POOL_SIZE = 4
+START_TIMEOUT = 60
+ACQUIRE_TIMEOUT = 300
+POLL_INTERVAL = 0.05
+
+
+def _rpc(rpc_url, method, params):
+    payload = json.dumps({
+        'jsonrpc': '2.0',
+        'id': 1,
+        'method': method,
+        'params': params
+    }).encode()
+    req = request.Request(
+        rpc_url,
+        data=payload,
+        headers={'Content-Type': 'application/json'}
+    )
+    with request.urlopen(req) as res:
+        res = json.loads(res.read())
+    if 'error' in res:
+        raise RuntimeError(f'{method} failed: {res["error"]}')
+    return res.get('result')
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_json(path):
+    with open(path) as json_file:
+        return json.load(json_file)
+
+
+def _write_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as json_file:
+        json.dump(data, json_file, indent=4)
+    os.replace(tmp_path, path)
+
+
+class Chain_lease():
+    def __init__(self, state_dir, port, rpc_url, manifest):
+        self.state_dir = state_dir
+        self.port = port
+        self.rpc_url = rpc_url
+        self.manifest = manifest
+
+    @property
+    def addresses(self):
+        return self.manifest['addresses']
+
+    def release(self):
+        release(self.state_dir, self.port)
+
+
+def _get_pool_dir(state_dir):
+    return os.path.join(state_dir, 'pool')
+
+
+def _get_chain_path(state_dir, port):
+    return os.path.join(_get_pool_dir(state_dir), f'{port}.json')
+
+
+def _get_lock_path(state_dir, port):
+    return os.path.join(_get_pool_dir(state_dir), f'{port}.lock')
+
+
+def _snapshot(state_dir, port, rpc_url):
+    _write_json(
+        _get_chain_path(state_dir, port),
+        {'rpc_url': rpc_url, 'snapshot': _rpc(rpc_url, 'evm_snapshot', [])}
+    )
+
+
+def _recycle(state_dir, port):
+    """Revert a chain to its snapshot and take a new one
+
+    A chain failing to revert keeps its lock so that it is not handed out
+    again, the pool has to be restarted.
+    """
+    chain = _read_json(_get_chain_path(state_dir, port))
+    rpc_url = chain['rpc_url']
+    # Scripts turn automine off for batched rounds, restore the default.
+    _rpc(rpc_url, 'evm_setAutomine', [True])
+    if not _rpc(rpc_url, 'evm_revert', [chain['snapshot']]):
+        raise RuntimeError(f'Chain {port} could not be reverted')
+    _snapshot(state_dir, port, rpc_url)
+
+
+def _get_guard_path(state_dir, port):
+    return os.path.join(_get_pool_dir(state_dir), f'{port}.guard')
+
+
+def _read_pid(lock_path):
+    try:
+        return _read_json(lock_path)
+    except FileNotFoundError:
+        return None
+
+
+def _try_lock(state_dir, port, owner_pid):
+    """Lease a chain if it is free or if its lessee is dead
+
+    Leases are decided under an exclusive flock of the port, so that two
+    processes can not both take over the lease of a dead process.
+    """
+    lock_path = _get_lock_path(state_dir, port)
+    with open(_get_guard_path(state_dir, port), 'a') as guard:
+        fcntl.flock(guard, fcntl.LOCK_EX)
+        pid = _read_pid(lock_path)
+        if pid is not None and _is_alive(pid):
+            return False
+        _write_json(lock_path, owner_pid)
+    if _read_pid(lock_path) != owner_pid:
+        return False
+    if pid is not None:
+        # Lease of a dead process, the chain is recycled before reuse.
+        _recycle(state_dir, port)
+    return True
+
+
+def acquire(state_dir, timeout=ACQUIRE_TIMEOUT, owner_pid=None):
+    """Lease a warm chain of a running pool
+
+    Args:
+        state_dir (str): captured chain state directory
+        timeout (int): seconds to wait for a free chain
+        owner_pid (int): process holding the lease, the caller by default
+
+    Returns:
+        Chain_lease: leased chain
+    """
+    owner_pid = os.getpid() if owner_pid is None else owner_pid
+    pool_path = os.path.join(_get_pool_dir(state_dir), 'pool.json')
+    if not os.path.exists(pool_path):
+        raise RuntimeError(f'No chain pool is running for {state_dir}')
+    pool = _read_json(pool_path)
+    manifest = _read_json(os.path.join(state_dir, 'manifest.json'))
+    deadline = time.time() + timeout
+    while True:
+        for port in pool['ports']:
+            if _try_lock(state_dir, port, owner_pid):
+                chain = _read_json(_get_chain_path(state_dir, port))
+                return Chain_lease(
+                    state_dir,
+                    port,
+                    chain['rpc_url'],
+                    manifest
+                )
+        if time.time() > deadline:
+            raise TimeoutError(f'No free chain in {timeout}s')
+        time.sleep(POLL_INTERVAL)
+
+
+def release(state_dir, port):
+    """Recycle a leased chain and hand it back to the pool"""
+    _recycle(state_dir, port)
+    with open(_get_guard_path(state_dir, port), 'a') as guard:
+        fcntl.flock(guard, fcntl.LOCK_EX)
+        os.remove(_get_lock_path(state_dir, port))
+
+
+@contextmanager
+def lease(state_dir, timeout=ACQUIRE_TIMEOUT):
+    """Lease a warm chain for the duration of a with block"""
+    chain = acquire(state_dir, timeout)
+    try:
+        yield chain
+    finally:
+        chain.release()
+
+
+class Chain_pool():
+    def __init__(
+        self,
+        state_dir,
+        size=POOL_SIZE,
+        base_port=BASE_PORT,
+        fork_url=None
+    ):
+        self.state_dir = state_dir
+        self.size = size
+        self.base_port = base_port
+        self.fork_url = fork_url
+        self.manifest = _read_json(os.path.join(state_dir, 'manifest.json'))
+        self.processes = {}
+
+    def _get_cmd(self, port):
+        cmd = [
+            'anvil',
+            '--silent',
+            '--port', str(port),
+            '--chain-id', str(self.manifest['chain_id']),
+            '--load-state', os.path.join(self.state_dir, 'state.json')
+        ]
+        if self.manifest['fork_block'] is not None:
+            if self.fork_url is None:
+                raise RuntimeError('The chain state needs a fork url')
+            cmd += [
+                '--fork-url', self.fork_url,
+                '--fork-block-number', str(self.manifest['fork_block'])
+            ]
+        return cmd
+
+    def _wait_ready(self, port, rpc_url):
+        deadline = time.time() + START_TIMEOUT
+        while True:
+            if self.processes[port].poll() is not None:
+                raise RuntimeError(f'Anvil exited on port {port}')
+            try:
+                _rpc(rpc_url, 'eth_blockNumber', [])
+                return
+            except OSError:
+                if time.time() > deadline:
+                    raise TimeoutError(f'Anvil not ready on port {port}')
+                time.sleep(POLL_INTERVAL)
+
+    def start(self):
+        """Start the chains and publish the pool"""
+        pool_dir = _get_pool_dir(self.state_dir)
+        os.makedirs(pool_dir, exist_ok=True)
+        for file_name in os.listdir(pool_dir):
+            os.remove(os.path.join(pool_dir, file_name))
+        ports = [self.base_port + i for i in range(self.size)]
+        # Chains load the state in parallel, then wait for each one.
+        for port in ports:
+            self.processes[port] = subprocess.Popen(self._get_cmd(port))
+        for port in ports:
+            rpc_url = f'http://127.0.0.1:{port}'
+            self._wait_ready(port, rpc_url)
+            _snapshot(self.state_dir, port, rpc_url)
+        _write_json(
+            os.path.join(pool_dir, 'pool.json'),
+            {'pid': os.getpid(), 'ports': ports}
+        )
+        print(f'{self.size} chains ready on ports {ports[0]}-{ports[-1]}')
+
+    def stop(self):
+        pool_path = os.path.join(_get_pool_dir(self.state_dir), 'pool.json')
+        if os.path.exists(pool_path):
+            os.remove(pool_path)
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            process.wait()
+        self.processes = {}
+
+    def acquire(self, timeout=ACQUIRE_TIMEOUT):
+        return acquire(self.state_dir, timeout)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Pool of warm Anvil chains from a captured chain state'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help='Start the pool')
+    serve_parser.add_argument('state_dir')
+    serve_parser.add_argument('--size', type=int, default=POOL_SIZE)
+    serve_parser.add_argument('--base-port', type=int, default=BASE_PORT)
+    serve_parser.add_argument(
+        '--fork-url',
+        default=os.environ.get('FORK_URL'),
+        help='Rpc url of forked states, FORK_URL by default'
+    )
+    acquire_parser = subparsers.add_parser(
+        'acquire',
+        help='Lease a chain for the calling shell and print its rpc url'
+    )
+    acquire_parser.add_argument('state_dir')
+    acquire_parser.add_argument(
+        '--timeout',
+        type=int,
+        default=ACQUIRE_TIMEOUT
+    )
+    release_parser = subparsers.add_parser('release', help='Recycle a chain')
+    release_parser.add_argument('state_dir')
+    release_parser.add_argument('port', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'acquire':
+        # The lease belongs to the calling shell, not to this command.
+        chain = acquire(args.state_dir, args.timeout, os.getppid())
+        print(chain.port, chain.rpc_url)
+        return
+    if args.command == 'release':
+        release(args.state_dir, args.port)
+        return
+
+    pool = Chain_pool(
+        args.state_dir,
+        args.size,
+        args.base_port,
+        args.fork_url
+    )
+    signal.signal(signal.SIGTERM, lambda *_: pool.stop())
+    with pool:
+        try:
+            while pool.processes:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
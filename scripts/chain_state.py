@@ -0,0 +1,131 @@
+"""Capture of a deployed Demeter stack as a reusable Anvil chain state.
+
+The deployments of a chain_state_config are run once through
+deploy_contract on an Anvil chain (usually a fork), then the chain state is
+dumped together with a manifest of the deployed addresses:
+
+    chain_states/<config_name>/state.json
+    chain_states/<config_name>/manifest.json
+
+The state is loaded by `scripts/chain_pool.py` which keeps warm chains
+started from it for rehearsals and tests.
+"""
+from brownie import (
+    Contract,
+    FarmRegistry,
+    accounts,
+    web3
+)
+from .constants import (
+    Chain_state_config,
+    chain_state_config,
+    deployment_config
+)
+from .deploy_and_upgrade import deploy_contract
+from .utils import (
+    _to_json,
+    get_config,
+    print_dict,
+    rpc
+)
+import copy
+import gzip
+import json
+import os
+import time
+
+CHAIN_STATE_DIR = 'chain_states'
+ACCOUNT_BALANCE = 10**21
+
+
+def _get_address(deployment_data):
+    return deployment_data.get('proxy_addr') or \
+        deployment_data.get('contract_addr')
+
+
+def _link_params(config_name, config_data, conf, addresses):
+    """Point the linked deployment params to the new deployments"""
+    links = conf.param_links.get(config_name, {})
+    if not links:
+        return config_data
+    config_data = copy.copy(config_data)
+    config_data.config = copy.deepcopy(config_data.config)
+    params = config_data.config.deployment_params
+    for param, linked_name in links.items():
+        params[param] = addresses[linked_name]
+    return config_data
+
+
+def capture(config_name, conf):
+    """Deploy the stack of a config and dump the chain state
+
+    Args:
+        config_name (str): name of the chain state config
+        conf (Chain_state_config): stack to be deployed
+
+    Returns:
+        dict: manifest of the captured state
+    """
+    rpc('anvil_setBalance', [conf.deployer, hex(ACCOUNT_BALANCE)])
+    deployer = accounts.at(conf.deployer, force=True)
+    addresses = {}
+    deployments = {}
+    for name in conf.deployments:
+        config_data = _link_params(
+            name,
+            deployment_config[name],
+            conf,
+            addresses
+        )
+        deployments[name] = deploy_contract(name, config_data, deployer)
+        addresses[name] = _get_address(deployments[name])
+
+    if conf.register_deployers:
+        registry = Contract.from_abi(
+            'FarmRegistry',
+            addresses['FarmRegistry'],
+            FarmRegistry.abi
+        )
+        for name in conf.register_deployers:
+            registry.registerFarmDeployer(addresses[name], {'from': deployer})
+
+    # Fork urls usually embed an api key, only the block is kept.
+    node_info = rpc('anvil_nodeInfo', [])
+    fork_config = node_info.get('forkConfig') or {}
+    state = json.loads(
+        gzip.decompress(bytes.fromhex(rpc('anvil_dumpState', [])[2:]))
+    )
+    path = os.path.join(CHAIN_STATE_DIR, config_name)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'state.json'), 'w') as state_file:
+        json.dump(state, state_file)
+
+    manifest = {
+        'config_name': config_name,
+        'chain_id': web3.eth.chain_id,
+        'block_number': web3.eth.block_number,
+        'fork_block': fork_config.get('forkBlockNumber'),
+        'deployer': conf.deployer,
+        'captured_at': time.strftime('%m-%d-%Y_%H-%M-%S'),
+        'addresses': addresses,
+        'deployments': deployments
+    }
+    with open(os.path.join(path, 'manifest.json'), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, default=_to_json, indent=4)
+    print(f'Chain state stored at: {path}')
+    return manifest
+
+
+def main():
+    if not web3.clientVersion.lower().startswith('anvil'):
+        print('Chain states can only be captured on an Anvil chain')
+        return
+    config_name, conf = get_config(
+        'Select config for chain state',
+        chain_state_config
+    )
+    if type(conf) is not Chain_state_config:
+        print('Incorrect configuration data')
+        return
+    manifest = capture(config_name, conf)
+    print_dict('Captured addresses', manifest['addresses'], 30)
@@ -4,6 +4,7 @@ from brownie import (
     UniV3Farm,
     CamelotV2Farm,
     CamelotV2FarmDeployer,
+    UniV2Farm,
     UniV2FarmDeployer,
     BalancerV2FarmDeployer,
     RewarderFactory,
@@ -29,6 +30,26 @@ class Step():
         self.contract_addr = contract_addr
 
 
+# Health check expectations of fleet upgrades
+UNCHANGED = 'unchanged'
+EQUALS = 'equals'
+NO_REVERT = 'no_revert'
+
+
+class Health_check():
+    def __init__(
+        self,
+        func,
+        args={},
+        expect=UNCHANGED,
+        value=None
+    ):
+        self.func = func
+        self.args = args
+        self.expect = expect
+        self.value = value
+
+
 class Deployment_config():
     def __init__(
         self,
@@ -57,6 +78,24 @@ class Upgrade_config():
         self.post_upgrade_steps = post_upgrade_steps
 
 
+class Fleet_upgrade_config():
+    def __init__(
+        self,
+        proxies,
+        implementation=None,
+        wave_size=1,
+        parallelism=1,
+        health_checks=[],
+        post_upgrade_steps=[]
+    ):
+        self.proxies = proxies
+        self.implementation = implementation
+        self.wave_size = wave_size
+        self.parallelism = parallelism
+        self.health_checks = health_checks
+        self.post_upgrade_steps = post_upgrade_steps
+
+
 class Farm_config():
     def __init__(
         self,
@@ -79,6 +118,120 @@ class Deployment_data():
         self.config = config
 
 
+class Bulk_tx_config():
+    def __init__(
+        self,
+        contract,
+        contract_address,
+        steps=[]
+    ):
+        self.contract = contract
+        self.contract_address = contract_address
+        self.steps = steps
+
+
+class Reward_funding_config():
+    def __init__(
+        self,
+        farm_registry,
+        runway_days,
+        reward_tokens=[]
+    ):
+        self.farm_registry = farm_registry
+        self.runway_days = runway_days
+        self.reward_tokens = reward_tokens
+
+
+class Export_config():
+    def __init__(
+        self,
+        farm_registry,
+        output_dir,
+        start_block=0,
+        farms=[]
+    ):
+        self.farm_registry = farm_registry
+        self.output_dir = output_dir
+        self.start_block = start_block
+        self.farms = farms
+
+
+class Apr_report_config():
+    def __init__(
+        self,
+        farm_registry,
+        oracle,
+        price_ttl=0,
+        price_fixture=None,
+        record_fixture=None,
+        block=None
+    ):
+        self.farm_registry = farm_registry
+        self.oracle = oracle
+        self.price_ttl = price_ttl
+        self.price_fixture = price_fixture
+        self.record_fixture = record_fixture
+        self.block = block
+
+
+class Exit_forecast_config():
+    def __init__(
+        self,
+        farm_registry,
+        horizon_days,
+        cooldown_rate=0,
+        exit_ratio=1
+    ):
+        self.farm_registry = farm_registry
+        self.horizon_days = horizon_days
+        self.cooldown_rate = cooldown_rate
+        self.exit_ratio = exit_ratio
+
+
+class Load_test_config():
+    def __init__(
+        self,
+        deployer_data,
+        farm_data,
+        num_users,
+        num_rounds,
+        concurrency,
+        op_weights,
+        reward_rates={},
+        deposit_amount=10**18,
+        lockup_ratio=0.5,
+        round_interval=3600,
+        report_interval=10,
+        seed=0
+    ):
+        self.deployer_data = deployer_data
+        self.farm_data = farm_data
+        self.num_users = num_users
+        self.num_rounds = num_rounds
+        self.concurrency = concurrency
+        self.op_weights = op_weights
+        self.reward_rates = reward_rates
+        self.deposit_amount = deposit_amount
+        self.lockup_ratio = lockup_ratio
+        self.round_interval = round_interval
+        self.report_interval = report_interval
+        self.seed = seed
+
+
+class Chain_state_config():
+    def __init__(
+        self,
+        deployer,
+        deployments,
+        param_links={},
+        register_deployers=[]
+    ):
+        self.deployer = deployer
+        self.deployments = deployments
+        self.param_links = param_links
+        self.register_deployers = register_deployers
+
+
 class Create_Farm_data():
     def __init__(
         self,
@@ -299,6 +452,26 @@ upgrade_config = {
     )
 }
 
+fleet_upgrade_config = {
+    'farm_registry_fleet': Upgrade_data(
+        contract=FarmRegistry,
+        config=Fleet_upgrade_config(
+            proxies=[
+                '0x45bC6B44107837E7aBB21E2CaCbe7612Fce222e0'
+            ],
+            wave_size=1,
+            parallelism=1,
+            health_checks=[
+                # Farms are created while the fleet is upgraded.
+                Health_check(func='getFarmList', expect=NO_REVERT),
+                Health_check(func='getFarmDeployerList'),
+                Health_check(func='feeAmount'),
+                Health_check(func='owner'),
+            ]
+        )
+    )
+}
+
 farm_config = {
     'l2dao_usds_v1': Create_Farm_data(
         contract=UniV3Farm,
@@ -369,3 +542,159 @@ farm_config = {
         )
     )
 }
+
+bulk_tx_config = {
+    'rewarder_factory_deploy_rewarders': Bulk_tx_config(
+        contract=RewarderFactory,
+        contract_address='0x382B536873746b36faCBC0d45cDE17D122affB79',
+        steps=[
+            Step(
+                func='deployRewarder',
+                transact=True,
+                args={
+                    'reward_token':
+                        '0xD74f5255D557944cf7Dd0E45FF521520002D5748'
+                }
+            ),
+            Step(
+                func='deployRewarder',
+                transact=True,
+                args={
+                    'reward_token':
+                        '0xaf88d065e77c8cC2239327C5EDb3A432268e5831'
+                }
+            ),
+        ]
+    )
+}
+
+reward_funding_config = {
+    'all_farms_30_days': Reward_funding_config(
+        farm_registry='0x45bC6B44107837E7aBB21E2CaCbe7612Fce222e0',
+        runway_days=30
+    ),
+    'arb_farms_14_days': Reward_funding_config(
+        farm_registry='0x45bC6B44107837E7aBB21E2CaCbe7612Fce222e0',
+        runway_days=14,
+        reward_tokens=['0x912CE59144191C1204E64559FE8253a0e49E6548']
+    )
+}
+
+export_config = {
+    'arbitrum_v2_farms': Export_config(
+        farm_registry='0x45bC6B44107837E7aBB21E2CaCbe7612Fce222e0',
+        output_dir='exports/arbitrum_v2_farms',
+        start_block=228717000
+    )
+}
+
+apr_report_config = {
+    'arbitrum_v2_farms': Apr_report_config(
+        farm_registry='0x45bC6B44107837E7aBB21E2CaCbe7612Fce222e0',
+        oracle='0x14D99412dAB1878dC01Fe7a1664cdE85896e8E50',
+        price_ttl=300
+    ),
+    # Records the oracle prices of the report, replayed by setting
+    # price_fixture (and block) to the recorded file.
+    'arbitrum_v2_farms_record': Apr_report_config(
+        farm_registry='0x45bC6B44107837E7aBB21E2CaCbe7612Fce222e0',
+        oracle='0x14D99412dAB1878dC01Fe7a1664cdE85896e8E50',
+        record_fixture='price_fixtures/arbitrum_v2_farms.json'
+    )
+}
+
+exit_forecast_config = {
+    'arbitrum_v2_farms': Exit_forecast_config(
+        farm_registry='0x45bC6B44107837E7aBB21E2CaCbe7612Fce222e0',
+        horizon_days=90,
+        # Share of the locked liquidity initiating cooldown per day
+        cooldown_rate=0.01,
+        # Share of the unlocked liquidity withdrawn at the end of cooldown
+        exit_ratio=1
+    )
+}
+
+# Anvil default account 0, used as farm admin and reward token manager
+# of the load test farms.
+LOAD_TEST_ADMIN = '0xf39Fd6e51aad88F6F4ce6aB8827279cffFb92266'
+
+load_test_config = {
+    'sushiswap_weth_usdce_4_rewards': Load_test_config(
+        deployer_data=Deployment_data(
+            contract=UniV2FarmDeployer,
+            config=Deployment_config(
+                upgradeable=False,
+                deployment_params={
+                    'farm_registry':
+                        '0x45bC6B44107837E7aBB21E2CaCbe7612Fce222e0',
+                    'farm_id': 'Demeter_SushiSwap_Farm_load_test',
+                    'protocol_factory':
+                        '0xc35DADB65012eC5796536bD9864eD8773aBc74C4'
+                }
+            )
+        ),
+        farm_data=Create_Farm_data(
+            contract=UniV2Farm,
+            deployer_contract=UniV2FarmDeployer,
+            deployer_address=None,  # Set to the deployed deployer
+            config=Farm_config(
+                deployment_params={
+                    'farm_admin': LOAD_TEST_ADMIN,
+                    'farm_start_time': chain.time() + 100,
+                    'cooldown_period': 7,
+                    'pool_data': {
+                        'tokenA': '0x82aF49447D8a07e3bd95BD0d56f35241523fBab1',
+                        'tokenB': '0xFF970A61A04b1cA14834A43f5dE4533eBDDB5CC8'
+                    },
+                    'reward_token_data': [
+                        {
+                            'token': token,
+                            'tknManager': LOAD_TEST_ADMIN
+                        }
+                        for token in [
+                            '0x912CE59144191C1204E64559FE8253a0e49E6548',
+                            '0x5575552988A3A80504bBaeB1311674fCFd40aD4B',
+                            '0x82aF49447D8a07e3bd95BD0d56f35241523fBab1',
+                            '0xaf88d065e77c8cC2239327C5EDb3A432268e5831'
+                        ]
+                    ]
+                }
+            )
+        ),
+        num_users=2000,
+        num_rounds=200,
+        concurrency=50,
+        op_weights={
+            'deposit': 30,
+            'claim': 20,
+            'cooldown': 10,
+            'withdraw': 15,
+            'increase': 15,
+            'decrease': 10
+        },
+        reward_rates={
+            '0x912CE59144191C1204E64559FE8253a0e49E6548': [10**15, 10**15],
+            '0x5575552988A3A80504bBaeB1311674fCFd40aD4B': [10**17, 10**17],
+            '0x82aF49447D8a07e3bd95BD0d56f35241523fBab1': [10**12, 0],
+            '0xaf88d065e77c8cC2239327C5EDb3A432268e5831': [1000, 1000]
+        },
+        deposit_amount=10**12
+    )
+}
+
+chain_state_config = {
+    'demeter_v2_stack': Chain_state_config(
+        deployer=LOAD_TEST_ADMIN,
+        # deployment_config entries, in deployment order
+        deployments=[
+            'FarmRegistry',
+            'RewarderFactory',
+            'CamelotV3FarmDeployer'
+        ],
+        # deployment param: deployment it is set to
+        param_links={
+            'CamelotV3FarmDeployer': {'farm_registry': 'FarmRegistry'}
+        },
+        register_deployers=['CamelotV3FarmDeployer']
+    )
+}
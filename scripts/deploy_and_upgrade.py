@@ -3,7 +3,8 @@ from brownie import (
     network,
     config as BrownieConfig,
     accounts, 
-    project
+    project,
+    web3
 )
 from .constants import (
     Create_Farm_data,
@@ -14,16 +15,22 @@ from .constants import (
     farm_config,
     Step
 )
+from .call_cache import call_cache
 from .utils import (
+    ADMIN_SLOT,
+    IMPLEMENTATION_SLOT,
+    Deployment_journal,
     get_config,
     print_dict,
     _getYorN,
     confirm,
     save_deployment_artifacts
 )
+from web3.exceptions import TransactionNotFound
 import eth_utils
 import click
 import json
+import rlp
 GAS_LIMIT = 40000000
 
 oz_project = project.load(BrownieConfig["dependencies"][0])
@@ -73,11 +80,11 @@ def call_func(contract_obj, func_name, args, transact, caller=None):
             *res,
             {'from': caller, 'gas_limit': GAS_LIMIT}
         )
+        # Later view steps must not read values cached before the tx.
+        call_cache.invalidate(contract_obj.address)
     else:
         tx = None
-        val = func.call(
-            *res,
-        )
+        val = call_cache.call(contract_obj, func_sig, res)
     return args, val, tx
 
 
@@ -160,9 +167,196 @@ def get_tx_info(name, tx):
     return data
 
 
+def get_implementation(proxy_address, block=None):
+    """Read the implementation address of an ERC1967 proxy
+
+    Args:
+        proxy_address (address): address of the proxy
+        block (int): block number to read the slot at, latest if None
+
+    Returns:
+        address: current implementation of the proxy
+    """
+    slot = web3.eth.get_storage_at(
+        proxy_address,
+        IMPLEMENTATION_SLOT,
+        block_identifier=block
+    )
+    return eth_utils.to_checksum_address(slot[-20:])
+
+
+def get_proxy_admin(proxy_address, block=None):
+    """Read the ProxyAdmin address of an ERC1967 proxy
+
+    Args:
+        proxy_address (address): address of the proxy
+        block (int): block number to read the slot at, latest if None
+
+    Returns:
+        address: ProxyAdmin of the proxy
+    """
+    slot = web3.eth.get_storage_at(
+        proxy_address,
+        ADMIN_SLOT,
+        block_identifier=block
+    )
+    return eth_utils.to_checksum_address(slot[-20:])
+
+
+def get_upgrade_call(proxy_admin, proxy_address, impl_address):
+    """Get the ProxyAdmin function and arguments to upgrade a proxy
+
+    OpenZeppelin v5 ProxyAdmin only exposes upgradeAndCall.
+
+    Args:
+        proxy_admin (contract): ProxyAdmin contract
+        proxy_address (address): address of the proxy
+        impl_address (address): address of the new implementation
+
+    Returns:
+        (str, []): function name and arguments
+    """
+    if 'upgradeAndCall' in proxy_admin.signatures:
+        return 'upgradeAndCall', [proxy_address, impl_address, '0x']
+    return 'upgrade', [proxy_address, impl_address]
+
+
+def _get_create_address(sender, nonce):
+    """Address of a contract deployed by sender with the given nonce"""
+    encoded = rlp.encode([eth_utils.to_bytes(hexstr=sender), nonce])
+    return eth_utils.to_checksum_address(web3.keccak(encoded)[12:])
+
+
+def verify_journal(journal, deployer):
+    """Check the journaled sub-operations on-chain and drop the entries
+    from the first one which can not be confirmed
+
+    A sub-operation started but not journaled as done is recovered when its
+    nonce was consumed: deployments from the contract code at the expected
+    address, calls after confirmation by the user.
+
+    Args:
+        journal (Deployment_journal): journal of the partial deployment
+        deployer (address): address of the deployer
+    """
+    nonce = deployer.nonce
+    valid = 1
+    recovered = None
+    for i, entry in enumerate(journal.entries[1:], 1):
+        if entry['state'] == 'done':
+            if entry['tx_hash'] is not None:
+                try:
+                    receipt = web3.eth.get_transaction_receipt(
+                        entry['tx_hash']
+                    )
+                except TransactionNotFound:
+                    receipt = None
+                if receipt is None or receipt.status != 1:
+                    print(f'{entry["step"]}: transaction not found on-chain')
+                    break
+            if entry['address'] is not None and \
+                    len(web3.eth.get_code(entry['address'])) == 0:
+                print(f'{entry["step"]}: no code at {entry["address"]}')
+                break
+            valid = i + 1
+            continue
+        if i + 1 < len(journal.entries) and \
+                journal.entries[i + 1]['step'] == entry['step']:
+            valid = i + 1
+            continue
+        if entry['nonce'] >= nonce:
+            print(f'{entry["step"]}: transaction was not mined')
+            break
+        recovered = {
+            'step': entry['step'],
+            'state': 'done',
+            'tx_hash': None,
+            'address': None,
+            'value': None,
+            'tx_info': None
+        }
+        if entry['deploy']:
+            address = _get_create_address(deployer.address, entry['nonce'])
+            if len(web3.eth.get_code(address)) == 0:
+                print(f'{entry["step"]}: deployment reverted')
+                recovered = None
+                break
+            recovered['address'] = address
+        elif _getYorN(
+            f'{entry["step"]} was sent with nonce {entry["nonce"]} but not '
+            'confirmed. Did it succeed?'
+        ) == 'n':
+            recovered = None
+            break
+        valid = i + 1
+    # A started entry is only kept together with its completion.
+    while journal.entries[valid - 1]['state'] == 'started':
+        valid -= 1
+    journal.truncate(valid)
+    if recovered is not None:
+        journal.append(recovered)
+    for entry in journal.entries[1:]:
+        if entry['state'] == 'done':
+            print(f'Journaled: {entry["step"]}')
+
+
+def _run_journaled(journal, key, name, deployer, deploy_op, func, tx_list):
+    """Run a sub-operation, or reuse its result if already journaled
+
+    Args:
+        journal (Deployment_journal): journal, None to run without one
+        key (str): unique key of the sub-operation in the journal
+        name (str): step name for the transaction info
+        deployer (address): address sending the transaction
+        deploy_op (bool): the sub-operation is a contract deployment
+        func (function): sends the sub-operation and returns the
+            transaction, deployed address and returned value
+        tx_list ([]): transaction info list to be appended to
+
+    Returns:
+        (address, val): deployed address and returned value
+    """
+    if journal is not None:
+        entry = journal.get_done(key)
+        if entry is not None:
+            print(f'\nSkipping {key}, already done')
+            if entry['tx_info'] is not None:
+                tx_list.append(entry['tx_info'])
+            return entry['address'], entry['value']
+        journal.append({
+            'step': key,
+            'state': 'started',
+            'nonce': deployer.nonce,
+            'deploy': deploy_op
+        })
+    tx, address, val = func()
+    tx_info = None
+    if tx is not None:
+        tx_info = get_tx_info(name, tx)
+        tx_list.append(tx_info)
+    if journal is not None:
+        journal.append({
+            'step': key,
+            'state': 'done',
+            'tx_hash': tx.txid if tx is not None else None,
+            'address': address,
+            'value': val,
+            'tx_info': tx_info
+        })
+    return address, val
+
+
+def _run_post_step(step, contract_obj, deployer):
+    _, val, tx = run_step(step, contract_obj, deployer)
+    return tx, None, val
+
+
 def deploy(configuration, deployer):
     """Utility to deploy contracts
 
+    Progress is journaled under the network's deployment folder, so an
+    interrupted deployment of the same config can be resumed.
+
     Args:
         configuration (Deployment_data{}): Configuration data for deployment
         deployer (address): address of the deployer
@@ -177,103 +371,170 @@ def deploy(configuration, deployer):
     if(type(config_data) is not Deployment_data):
         print('Incorrect configuration data')
         return
-    contract = config_data.contract
-    conf = config_data.config
-    deployment_data = {}
-    deployed_contract = None
-    tx_list = []
     print(
         json.dumps(
-            conf,
+            config_data.config,
             default=lambda o: o.__dict__,
             indent=2
         )
     )
     confirm('Are the above configurations correct?')
 
-    if (conf.upgradeable):
-        print('\nDeploying implementation contract')
-        impl = contract.deploy(
+    header = {
+        'step': 'Journal_header',
+        'state': 'done',
+        'deployer': deployer.address,
+        'config': json.loads(
+            json.dumps(config_data.config, default=lambda o: o.__dict__)
+        )
+    }
+    journal = Deployment_journal(config_name)
+    if journal.entries:
+        print(f'\nFound partial deployment journal: {journal.path}')
+        if journal.entries[0] != header:
+            print('Journal does not match the deployer and configuration')
+            confirm('Start a new deployment?')
+            journal.archive()
+        elif _getYorN('Resume the partial deployment?') == 'y':
+            verify_journal(journal, deployer)
+        else:
+            journal.archive()
+    if not journal.entries:
+        journal.append(header)
+
+    deployment_data = deploy_contract(
+        config_name,
+        config_data,
+        deployer,
+        journal
+    )
+    save_deployment_artifacts(deployment_data, config_name, 'Deployment')
+    journal.remove()
+    return deployment_data
+
+
+def deploy_contract(config_name, config_data, deployer, journal=None):
+    """Deploy a contract and run its post deployment steps
+
+    Args:
+        config_name (str): name of the configuration
+        config_data (Deployment_data): configuration data for deployment
+        deployer (address): address of the deployer
+        journal (Deployment_journal): journal to record the sub-operations
+            in and to resume from, None to run without a journal
+
+    Returns:
+        dict: deployment_data
+    """
+    contract = config_data.contract
+    conf = config_data.config
+    deployment_data = {}
+    deployed_contract = None
+    tx_list = []
+
+    def run(key, name, deploy_op, func):
+        return _run_journaled(
+            journal,
+            key,
+            name,
+            deployer,
+            deploy_op,
+            func,
+            tx_list
+        )
+
+    def deploy_tx(contract_container, *args):
+        deployment = contract_container.deploy(
+            *args,
             {'from': deployer, 'gas_limit': GAS_LIMIT}
         )
-        tx_list.append(
-            get_tx_info('Implementation_deployment', impl.tx)
+        return deployment.tx, deployment.address, None
+
+    if (conf.upgradeable):
+        print('\nDeploying implementation contract')
+        impl, _ = run(
+            'Implementation_deployment',
+            'Implementation_deployment',
+            True,
+            lambda: deploy_tx(contract)
         )
 
         proxy_admin = conf.proxy_admin
 
         if(proxy_admin is None):
             print('\nDeploying proxy admin contract')
-            pa_deployment = ProxyAdmin.deploy(
-                deployer,
-                {'from': deployer, 'gas_limit': GAS_LIMIT}
+            proxy_admin, _ = run(
+                'Proxy_admin_deployment',
+                'Proxy_admin_deployment',
+                True,
+                lambda: deploy_tx(ProxyAdmin, deployer)
             )
-            tx_list.append(
-                get_tx_info('Proxy_admin_deployment', pa_deployment.tx)
-            )
-            proxy_admin = pa_deployment.address
 
         print('\nDeploying proxy contract')
-        proxy = TransparentUpgradeableProxy.deploy(
-            impl.address,
-            proxy_admin,
-            eth_utils.to_bytes(hexstr='0x'),
-            {'from': deployer, 'gas_limit': GAS_LIMIT}
-        )
-        tx_list.append(
-            get_tx_info('Proxy_deployment', proxy.tx)
+        proxy, _ = run(
+            'Proxy_deployment',
+            'Proxy_deployment',
+            True,
+            lambda: deploy_tx(
+                TransparentUpgradeableProxy,
+                impl,
+                proxy_admin,
+                eth_utils.to_bytes(hexstr='0x')
+            )
         )
 
         # Load the deployed contracts
         deployed_contract = Contract.from_abi(
             config_name,
-            proxy.address,
+            proxy,
             contract.abi
         )
 
         print('\nInitializing proxy contract')
-        init = deployed_contract.initialize(
-            *conf.deployment_params.values(),
-            {'from': deployer, 'gas_limit': GAS_LIMIT}
-        )
-
-        tx_list.append(
-            get_tx_info('Proxy_initialization', init)
+        run(
+            'Proxy_initialization',
+            'Proxy_initialization',
+            False,
+            lambda: (
+                deployed_contract.initialize(
+                    *conf.deployment_params.values(),
+                    {'from': deployer, 'gas_limit': GAS_LIMIT}
+                ),
+                None,
+                None
+            )
         )
 
-        deployment_data['proxy_addr'] = proxy.address
-        deployment_data['impl_addr'] = impl.address
+        deployment_data['proxy_addr'] = proxy
+        deployment_data['impl_addr'] = impl
         deployment_data['proxy_admin'] = proxy_admin
 
     else:
         print(f'\nDeploying {config_name} contract')
-        deployed_contract = contract.deploy(
-            *conf.deployment_params.values(),
-            {'from': deployer, 'gas_limit': GAS_LIMIT}
-        )
-        tx_list.append(
-            get_tx_info('Deployment_transaction', deployed_contract.tx)
+        address, _ = run(
+            'Deployment_transaction',
+            'Deployment_transaction',
+            True,
+            lambda: deploy_tx(contract, *conf.deployment_params.values())
         )
+        deployed_contract = contract.at(address)
 
-        deployment_data['contract_addr'] = deployed_contract.address
+        deployment_data['contract_addr'] = address
 
-    for step in conf.post_deployment_steps:
-        step, _, tx = run_step(
-            step,
-            deployed_contract,
-            deployer
+    for i, step in enumerate(conf.post_deployment_steps):
+        run(
+            f'Post_deployment_step_{i}',
+            'Post_deployment_step',
+            False,
+            lambda: _run_post_step(step, deployed_contract, deployer)
         )
-        if tx is not None:
-            tx_list.append(
-                get_tx_info('Post_deployment_step', tx)
-            )
 
     print_dict('Printing deployment data', deployment_data, 20)
     deployment_data['type'] = 'Deployment'
     deployment_data['transactions'] = tx_list
     deployment_data['config_name'] = config_name
     deployment_data['config'] = conf
-    save_deployment_artifacts(deployment_data, config_name, 'Deployment')
+    return deployment_data
 
 
 def upgrade(configuration, deployer):
@@ -327,6 +588,7 @@ def upgrade(configuration, deployer):
         tx_list.append(
             get_tx_info('Upgrade_transaction', upgrade_tx)
         )
+        call_cache.invalidate(conf.proxy_address)
         deployed_contract = Contract.from_abi(
             config_name,
             conf.proxy_address,
@@ -343,7 +605,15 @@ def upgrade(configuration, deployer):
                     get_tx_info('Post_upgrade_transaction', tx)
                 )
     else:
-        print('\nPlease switch to Gnosis to perform upgrade!\n')
+        # safe_batch imports this module, imported here to avoid the cycle.
+        from .safe_batch import export_batch
+        print('\nExporting the upgrade as a Safe Transaction Builder batch')
+        export_batch(
+            [(config_name, config_data)],
+            {config_name: new_impl.address},
+            tx_list
+        )
+        return
 
     upgrade_data['new_impl'] = new_impl.address
     print_dict('Printing Upgrade data', upgrade_data, 20)
@@ -363,10 +633,29 @@ def create_farm(configuration, deployer):
     if(type(config_data) is not Create_Farm_data):
         print('Incorrect configuration data')
         return
-    conf = config_data.config
-    print(json.dumps(conf, default=lambda o: o.__dict__, indent=2))
+    print(
+        json.dumps(config_data.config, default=lambda o: o.__dict__, indent=2)
+    )
     confirm('Are the above configurations correct?')
 
+    deployment_data = deploy_farm(config_name, config_data, deployer)
+    save_deployment_artifacts(deployment_data, config_name, 'FarmCreation')
+    return deployment_data
+
+
+def deploy_farm(config_name, config_data, deployer):
+    """Create a farm through its farm deployer and run the post
+    deployment steps
+
+    Args:
+        config_name (str): name of the configuration
+        config_data (Create_Farm_data): configuration data of the farm
+        deployer (address): address of the farm creator
+
+    Returns:
+        dict: deployment_data
+    """
+    conf = config_data.config
     deployer_contract = Contract.from_abi(
         'Deployer_contract',
         config_data.deployer_address,
@@ -416,7 +705,7 @@ def create_farm(configuration, deployer):
     deployment_data['transactions'] = tx_list
     deployment_data['config_name'] = config_name
     deployment_data['config'] = conf
-    save_deployment_artifacts(deployment_data, config_name, 'FarmCreation')
+    return deployment_data
 
 
 def main():
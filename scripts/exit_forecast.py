@@ -0,0 +1,260 @@
+"""Forecast of the liquidity leaving the farms through cooldowns.
+
+Every deposit of the registered farms is read in batched multicalls pinned
+to one block, then the day-by-day exit curves of all the farms are computed
+at once with NumPy:
+
+- cooling deposits (expiryDate in the future) are unlocked on their
+  expiry day,
+- locked deposits (cooldownPeriod != 0) are expected to initiate cooldown
+  at `cooldown_rate` per day, leave the lockup fund on initiation and are
+  unlocked cooldownPeriod later,
+- `exit_ratio` of the unlocked liquidity is withdrawn from the common fund.
+
+The lockup and common fund liquidity projected from these curves gives the
+share of the rewards going to the lockup fund over the horizon, to plan
+setRewardRate and addRewards changes.
+"""
+from brownie import web3
+from .constants import (
+    Exit_forecast_config,
+    exit_forecast_config
+)
+from .utils import (
+    COMMON_FUND_ID,
+    LOCKUP_FUND_ID,
+    ONE_DAY,
+    ZERO_ADDRESS,
+    batch_call,
+    get_config,
+    get_farms,
+    print_dict,
+    save_deployment_artifacts
+)
+import numpy as np
+
+
+class Deposit_arrays():
+    """Deposits of all the farms as flat arrays"""
+
+    def __init__(self, farm_ids, liquidity, expiry_dates, cooldown_periods):
+        self.farm_ids = np.array(farm_ids, dtype=np.int64)
+        # Forecasts do not need exact amounts, float keeps them vectorized.
+        self.liquidity = np.array(liquidity, dtype=np.float64)
+        self.expiry_dates = np.array(expiry_dates, dtype=np.int64)
+        self.cooldown_periods = np.array(cooldown_periods, dtype=np.int64)
+
+
+def load_deposits(farms, block):
+    """Read the deposits and reward funds of the farms in batched calls
+
+    Returns:
+        (Deposit_arrays, []dict): deposits and per farm data
+    """
+    num_farms = len(farms)
+    farm_data = batch_call(
+        [(farm, 'totalDeposits', []) for farm in farms] +
+        [(farm, 'cooldownPeriod', []) for farm in farms] +
+        [(farm, 'getRewardFunds', []) for farm in farms],
+        block
+    )
+    keys = [
+        (i, deposit_id)
+        for i in range(num_farms)
+        for deposit_id in range(1, (farm_data[i] or 0) + 1)
+    ]
+    deposits = batch_call(
+        [(farms[i], 'getDepositInfo', [id_]) for i, id_ in keys],
+        block
+    )
+    farm_ids = []
+    liquidity = []
+    expiry_dates = []
+    cooldown_periods = []
+    for (i, _), deposit in zip(keys, deposits):
+        # Withdrawn deposits are deleted.
+        if deposit is None or deposit[0] == ZERO_ADDRESS:
+            continue
+        farm_ids.append(i)
+        liquidity.append(deposit[1])
+        expiry_dates.append(deposit[2])
+        # Deposits store the farm's cooldownPeriod, in seconds.
+        cooldown_periods.append(deposit[3])
+
+    farm_info = []
+    for i, farm in enumerate(farms):
+        funds = farm_data[2 * num_farms + i] or []
+        fund_liquidity = [fund[0] for fund in funds]
+        farm_info.append({
+            'farm': farm.address,
+            'cooldown_days': (farm_data[num_farms + i] or 0) // ONE_DAY,
+            'common_liquidity': fund_liquidity[COMMON_FUND_ID]
+            if len(funds) > COMMON_FUND_ID else 0,
+            'lockup_liquidity': fund_liquidity[LOCKUP_FUND_ID]
+            if len(funds) > LOCKUP_FUND_ID else 0
+        })
+    return Deposit_arrays(
+        farm_ids,
+        liquidity,
+        expiry_dates,
+        cooldown_periods
+    ), farm_info
+
+
+def get_exit_curves(deposits, num_farms, now, horizon, cooldown_rate):
+    """Compute the daily cooldown initiations and unlocks of the farms
+
+    Args:
+        deposits (Deposit_arrays): deposits of all the farms
+        num_farms (int): number of farms
+        now (int): timestamp the forecast starts at
+        horizon (int): number of days forecasted
+        cooldown_rate (float): share of the locked liquidity initiating
+            cooldown per day
+
+    Returns:
+        (np.ndarray, np.ndarray): (farms, horizon) expected liquidity
+            initiating cooldown and unlocked on each day
+    """
+    farm_ids = deposits.farm_ids
+    liquidity = deposits.liquidity
+    # Column d holds day d, column 0 is unused.
+    unlocks = np.zeros((num_farms, horizon + 1))
+
+    cooling = (deposits.cooldown_periods == 0) & (deposits.expiry_dates > now)
+    expiry_days = -(-(deposits.expiry_dates - now) // ONE_DAY)
+    in_horizon = cooling & (expiry_days <= horizon)
+    np.add.at(
+        unlocks,
+        (farm_ids[in_horizon], expiry_days[in_horizon]),
+        liquidity[in_horizon]
+    )
+
+    # Expected share of the locked liquidity initiating on each day.
+    days = np.arange(horizon + 1)
+    weights = np.zeros(horizon + 1)
+    weights[1:] = cooldown_rate * (1 - cooldown_rate) ** (days[1:] - 1.0)
+
+    locked = deposits.cooldown_periods != 0
+    locked_liquidity = np.zeros(num_farms)
+    np.add.at(locked_liquidity, farm_ids[locked], liquidity[locked])
+    initiations = locked_liquidity[:, None] * weights[None, :]
+
+    # Locked liquidity by cooldown length, delayed by a (cooldown, day)
+    # matrix: unlocks on day d of the initiations on day d - cooldown.
+    cooldown_days = -(-deposits.cooldown_periods[locked] // ONE_DAY)
+    max_cooldown = int(cooldown_days.max()) if cooldown_days.size else 0
+    by_cooldown = np.zeros((num_farms, max_cooldown + 1))
+    np.add.at(
+        by_cooldown,
+        (farm_ids[locked], cooldown_days),
+        liquidity[locked]
+    )
+    delays = days[None, :] - np.arange(max_cooldown + 1)[:, None]
+    delay_matrix = np.where(delays >= 1, weights[np.clip(delays, 0, None)], 0)
+    unlocks += by_cooldown @ delay_matrix
+    return initiations[:, 1:], unlocks[:, 1:]
+
+
+def forecast(conf, block):
+    """Forecast the exits and fund shares of all the registered farms
+
+    Args:
+        conf (Exit_forecast_config): forecast configuration
+        block (int): block number the deposits are read at
+
+    Returns:
+        []dict: forecast of each farm
+    """
+    farms = get_farms(conf.farm_registry, block)
+    deposits, farm_info = load_deposits(farms, block)
+    now = web3.eth.get_block(block).timestamp
+    initiations, unlocks = get_exit_curves(
+        deposits,
+        len(farms),
+        now,
+        conf.horizon_days,
+        conf.cooldown_rate
+    )
+    exits = unlocks * conf.exit_ratio
+
+    common = np.array(
+        [info['common_liquidity'] for info in farm_info],
+        dtype=np.float64
+    )
+    lockup = np.array(
+        [info['lockup_liquidity'] for info in farm_info],
+        dtype=np.float64
+    )
+    common_curve = common[:, None] - np.cumsum(exits, axis=1)
+    lockup_curve = lockup[:, None] - np.cumsum(initiations, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lockup_share = np.where(
+            common_curve > 0,
+            lockup_curve / common_curve,
+            0
+        )
+
+    # Unlocked liquidity which can leave at any time.
+    unlocked = (deposits.cooldown_periods == 0) & \
+        (deposits.expiry_dates <= now)
+    withdrawable = np.zeros(len(farms))
+    np.add.at(
+        withdrawable,
+        deposits.farm_ids[unlocked],
+        deposits.liquidity[unlocked]
+    )
+
+    report = []
+    for i, info in enumerate(farm_info):
+        report.append(dict(
+            info,
+            withdrawable_liquidity=withdrawable[i],
+            lockup_share=lockup[i] / common[i] if common[i] else 0,
+            initiations=initiations[i].tolist(),
+            exits=exits[i].tolist(),
+            common_liquidity_curve=common_curve[i].tolist(),
+            lockup_liquidity_curve=lockup_curve[i].tolist(),
+            lockup_share_curve=lockup_share[i].tolist()
+        ))
+    return report
+
+
+def main():
+    config_name, conf = get_config(
+        'Select config for exit forecast',
+        exit_forecast_config
+    )
+    if type(conf) is not Exit_forecast_config:
+        print('Incorrect configuration data')
+        return
+    block = web3.eth.block_number
+    report = forecast(conf, block)
+    for entry in report:
+        exits = entry['exits']
+        shares = entry['lockup_share_curve']
+        print_dict(
+            f'Farm {entry["farm"]}',
+            {
+                'common_liquidity': entry['common_liquidity'],
+                'lockup_liquidity': entry['lockup_liquidity'],
+                'withdrawable_liquidity': entry['withdrawable_liquidity'],
+                'exits_7_days': sum(exits[:7]),
+                'exits_30_days': sum(exits[:30]),
+                f'exits_{conf.horizon_days}_days': sum(exits),
+                'lockup_share_now': entry['lockup_share'],
+                'lockup_share_at_horizon': shares[-1] if shares else None
+            },
+            30
+        )
+    save_deployment_artifacts(
+        {
+            'type': 'ExitForecast',
+            'block_number': block,
+            'farms': report,
+            'config_name': config_name,
+            'config': conf
+        },
+        config_name,
+        'ExitForecast'
+    )
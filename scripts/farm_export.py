@@ -0,0 +1,368 @@
+"""Streaming Parquet export of farm deposits and reward history.
+
+Every run exports the block range after the previous run of the same farm
+and writes one part file per table and farm:
+
+    <output_dir>/<table>/farm=<address>/part-<from_block>-<to_block>.parquet
+
+Tables:
+    deposits       Deposit snapshot at to_block of every deposit touched
+                   in the range (all deposits on the first run).
+    subscriptions  Subscription snapshot of the same deposits.
+    reward_funds   RewardFund snapshot of the farm at to_block.
+    events         Farm events of the range, one row per subscription for
+                   RewardsClaimed.
+
+The latest state of a deposit is its row with the highest block_number.
+Token amounts, liquidity and reward accumulators are stored losslessly as
+32 byte big-endian unsigned integers (byte order matches numeric order),
+timestamps and ids as uint64. Part files are written to a temporary file
+and renamed when complete, so the dataset can be read at any time with
+e.g. duckdb `read_parquet('<output_dir>/deposits/*/*.parquet',
+hive_partitioning=true)` or polars `scan_parquet`.
+"""
+from brownie import (
+    Contract,
+    FarmRegistry,
+    UniV3Farm,
+    web3
+)
+from .constants import (
+    Export_config,
+    export_config
+)
+from .utils import (
+    ZERO_ADDRESS,
+    batch_call,
+    get_config,
+    print_dict
+)
+import glob
+import json
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ROW_GROUP_SIZE = 10000
+LOG_BLOCK_RANGE = 100000
+STATE_FILE = '_state.json'
+
+UINT256 = pa.binary(32)
+UINT256_LIST = pa.list_(UINT256)
+
+DEPOSIT_SCHEMA = pa.schema([
+    ('block_number', pa.uint64()),
+    ('deposit_id', pa.uint64()),
+    ('depositor', pa.string()),
+    ('liquidity', UINT256),
+    ('expiry_date', pa.uint64()),
+    ('cooldown_period', pa.uint64()),
+    ('deposit_ts', pa.uint64()),
+    ('total_rewards_claimed', UINT256_LIST)
+])
+SUBSCRIPTION_SCHEMA = pa.schema([
+    ('block_number', pa.uint64()),
+    ('deposit_id', pa.uint64()),
+    ('subscription_id', pa.uint16()),
+    ('fund_id', pa.uint8()),
+    ('reward_debt', UINT256_LIST),
+    ('reward_claimed', UINT256_LIST)
+])
+REWARD_FUND_SCHEMA = pa.schema([
+    ('block_number', pa.uint64()),
+    ('fund_id', pa.uint8()),
+    ('total_liquidity', UINT256),
+    ('rewards_per_sec', UINT256_LIST),
+    ('acc_reward_per_share', UINT256_LIST)
+])
+EVENT_SCHEMA = pa.schema([
+    ('block_number', pa.uint64()),
+    ('tx_hash', pa.string()),
+    ('log_index', pa.uint32()),
+    ('event', pa.string()),
+    ('deposit_id', pa.uint64()),
+    ('subscription_id', pa.uint16()),
+    ('fund_id', pa.uint8()),
+    ('token', pa.string()),
+    ('locked', pa.bool_()),
+    ('amounts', UINT256_LIST)
+])
+TABLES = {
+    'deposits': DEPOSIT_SCHEMA,
+    'subscriptions': SUBSCRIPTION_SCHEMA,
+    'reward_funds': REWARD_FUND_SCHEMA,
+    'events': EVENT_SCHEMA
+}
+
+
+def to_uint256(value):
+    return int(value).to_bytes(32, 'big')
+
+
+def from_uint256(value):
+    return int.from_bytes(value, 'big')
+
+
+class Parquet_table_writer():
+    """Buffers rows and writes them as bounded row groups of a part file"""
+
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self.rows = []
+        self.num_rows = 0
+        self.writer = None
+
+    def append(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        if self.writer is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.writer = pq.ParquetWriter(self.path + '.tmp', self.schema)
+        self.writer.write_table(
+            pa.Table.from_pylist(self.rows, schema=self.schema)
+        )
+        self.num_rows += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(self.path + '.tmp', self.path)
+
+
+def _load_state(output_dir):
+    path = os.path.join(output_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as state_file:
+        return json.load(state_file)
+
+
+def _save_state(output_dir, state):
+    path = os.path.join(output_dir, STATE_FILE)
+    os.makedirs(output_dir, exist_ok=True)
+    with open(path + '.tmp', 'w') as state_file:
+        json.dump(state, state_file, indent=4)
+    os.replace(path + '.tmp', path)
+
+
+def _get_writers(output_dir, farm, from_block, to_block):
+    """Create the part file writers of a farm, removing the leftovers of an
+    interrupted run of the same range
+
+    Returns:
+        {str: Parquet_table_writer}: writer for each table
+    """
+    writers = {}
+    for table, schema in TABLES.items():
+        farm_dir = os.path.join(output_dir, table, f'farm={farm}')
+        for stale in glob.glob(
+            os.path.join(farm_dir, f'part-{from_block}-*.parquet*')
+        ):
+            os.remove(stale)
+        writers[table] = Parquet_table_writer(
+            os.path.join(farm_dir, f'part-{from_block}-{to_block}.parquet'),
+            schema
+        )
+    return writers
+
+
+def _event_rows(event):
+    """Convert a farm event to rows of the events table
+
+    Args:
+        event (AttributeDict): decoded event log
+
+    Returns:
+        []dict: rows for the events table
+    """
+    args = event.args
+    row = {
+        'block_number': event.blockNumber,
+        'tx_hash': event.transactionHash.hex(),
+        'log_index': event.logIndex,
+        'event': event.event,
+        'deposit_id': args.get('depositId'),
+        'subscription_id': None,
+        'fund_id': args.get('fundId'),
+        'token': args.get('rwdToken'),
+        'locked': args.get('locked'),
+        'amounts': []
+    }
+    if event.event == 'RewardsClaimed':
+        return [
+            dict(
+                row,
+                subscription_id=i,
+                amounts=[to_uint256(amount) for amount in rewards]
+            )
+            for i, rewards in enumerate(args['rewardsForEachSubs'])
+        ]
+    for key in ['liquidity', 'amount', 'expiryDate']:
+        if key in args:
+            row['amounts'] = [to_uint256(args[key])]
+    for key in ['newRewardRate', 'totalRewardsClaimed']:
+        if key in args:
+            row['amounts'] = [to_uint256(amount) for amount in args[key]]
+    return [row]
+
+
+def export_events(farm, from_block, to_block, writer):
+    """Stream the farm events of a block range to the events table
+
+    Returns:
+        set: ids of the deposits touched in the range
+    """
+    deposit_ids = set()
+    for start in range(from_block, to_block + 1, LOG_BLOCK_RANGE):
+        end = min(start + LOG_BLOCK_RANGE - 1, to_block)
+        sequence = farm.events.get_sequence(start, end)
+        events = sorted(
+            [event for events in sequence.values() for event in events],
+            key=lambda e: (e.blockNumber, e.logIndex)
+        )
+        for event in events:
+            for row in _event_rows(event):
+                writer.append(row)
+            if 'depositId' in event.args:
+                deposit_ids.add(event.args['depositId'])
+    return deposit_ids
+
+
+def export_deposits(farm, deposit_ids, block, deposit_writer, sub_writer):
+    """Stream deposit and subscription snapshots in bounded chunks"""
+    deposit_ids = sorted(deposit_ids)
+    for i in range(0, len(deposit_ids), ROW_GROUP_SIZE):
+        chunk = deposit_ids[i:i + ROW_GROUP_SIZE]
+        data = batch_call(
+            [(farm, 'getDepositInfo', [id_]) for id_ in chunk] +
+            [(farm, 'getNumSubscriptions', [id_]) for id_ in chunk],
+            block
+        )
+        sub_keys = []
+        for j, deposit_id in enumerate(chunk):
+            deposit = data[j]
+            if deposit is None:
+                continue
+            deposit_writer.append({
+                'block_number': block,
+                'deposit_id': deposit_id,
+                'depositor': deposit[0],
+                'liquidity': to_uint256(deposit[1]),
+                'expiry_date': deposit[2],
+                'cooldown_period': deposit[3],
+                'deposit_ts': deposit[4],
+                'total_rewards_claimed': [to_uint256(v) for v in deposit[5]]
+            })
+            if deposit[0] == ZERO_ADDRESS:
+                continue
+            sub_keys += [
+                (deposit_id, sub_id) for sub_id in range(data[len(chunk) + j])
+            ]
+        subs = batch_call(
+            [
+                (farm, 'getSubscriptionInfo', [deposit_id, sub_id])
+                for deposit_id, sub_id in sub_keys
+            ],
+            block
+        )
+        for (deposit_id, sub_id), sub in zip(sub_keys, subs):
+            sub_writer.append({
+                'block_number': block,
+                'deposit_id': deposit_id,
+                'subscription_id': sub_id,
+                'fund_id': sub[0],
+                'reward_debt': [to_uint256(v) for v in sub[1]],
+                'reward_claimed': [to_uint256(v) for v in sub[2]]
+            })
+
+
+def export_reward_funds(farm, block, writer):
+    funds = farm.getRewardFunds(block_identifier=block)
+    for fund_id, fund in enumerate(funds):
+        writer.append({
+            'block_number': block,
+            'fund_id': fund_id,
+            'total_liquidity': to_uint256(fund[0]),
+            'rewards_per_sec': [to_uint256(v) for v in fund[1]],
+            'acc_reward_per_share': [to_uint256(v) for v in fund[2]]
+        })
+
+
+def export_farm(conf, farm, state, to_block):
+    """Export the block range of a farm after its last export
+
+    Args:
+        conf (Export_config): export configuration
+        farm (contract): farm contract
+        state (dict): last exported block of each farm
+        to_block (int): last block of the range
+
+    Returns:
+        dict: number of rows written in each table
+    """
+    last_block = state.get(farm.address)
+    from_block = conf.start_block if last_block is None else last_block + 1
+    if from_block > to_block:
+        return {}
+    writers = _get_writers(conf.output_dir, farm.address, from_block, to_block)
+    deposit_ids = export_events(farm, from_block, to_block, writers['events'])
+    if last_block is None:
+        total_deposits = farm.totalDeposits(block_identifier=to_block)
+        deposit_ids = range(1, total_deposits + 1)
+    export_deposits(
+        farm,
+        deposit_ids,
+        to_block,
+        writers['deposits'],
+        writers['subscriptions']
+    )
+    export_reward_funds(farm, to_block, writers['reward_funds'])
+    for writer in writers.values():
+        writer.close()
+    state[farm.address] = to_block
+    _save_state(conf.output_dir, state)
+    return {table: writer.num_rows for table, writer in writers.items()}
+
+
+def export_farms(conf, to_block=None):
+    """Export all the farms of a config up to a block
+
+    Args:
+        conf (Export_config): export configuration
+        to_block (int): last block to export, latest if None
+    """
+    if to_block is None:
+        to_block = web3.eth.block_number
+    farms = conf.farms
+    if not farms:
+        registry = Contract.from_abi(
+            'FarmRegistry',
+            conf.farm_registry,
+            FarmRegistry.abi
+        )
+        farms = registry.getFarmList(block_identifier=to_block)
+    state = _load_state(conf.output_dir)
+    for farm_address in farms:
+        farm = Contract.from_abi('Farm', farm_address, UniV3Farm.abi)
+        rows = export_farm(conf, farm, state, to_block)
+        if rows:
+            print_dict(f'Exported {farm.address}', rows, 20)
+
+
+def main():
+    config_name, conf = get_config(
+        'Select config for export',
+        export_config
+    )
+    if type(conf) is not Export_config:
+        print('Incorrect configuration data')
+        return
+    export_farms(conf)
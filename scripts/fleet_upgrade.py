@@ -0,0 +1,370 @@
+from brownie import (
+    Contract,
+    network,
+    web3
+)
+from .constants import (
+    EQUALS,
+    NO_REVERT,
+    UNCHANGED,
+    Fleet_upgrade_config,
+    Upgrade_data,
+    fleet_upgrade_config
+)
+from .call_cache import call_cache
+from .deploy_and_upgrade import (
+    GAS_LIMIT,
+    ProxyAdmin,
+    get_implementation,
+    get_proxy_admin,
+    get_tx_info,
+    get_upgrade_call,
+    get_user,
+    run_step
+)
+from .utils import (
+    _getYorN,
+    batch_call,
+    confirm,
+    get_config,
+    normalize,
+    print_dict,
+    save_deployment_artifacts,
+    send_pipelined
+)
+import copy
+import eth_utils
+import glob
+import json
+import os
+
+PUSH1 = 0x60
+PUSH32 = 0x7f
+
+
+def _get_artifact_impls():
+    """Get the implementations recorded in the network's artifacts
+
+    Returns:
+        []address: implementation addresses, newest artifacts first
+    """
+    path = os.path.join('deployed', network.show_active())
+    files = glob.glob(os.path.join(path, '*.json'))
+    impls = []
+    for file in sorted(files, key=os.path.getmtime, reverse=True):
+        with open(file) as json_file:
+            data = json.load(json_file)
+        for key in ['new_impl', 'impl_addr']:
+            if isinstance(data.get(key), str):
+                impls.append(data[key])
+    return impls
+
+
+def _get_immutable_ranges(bytecode):
+    """Byte ranges of the immutable values of compiled runtime code
+
+    solc leaves immutables as zero filled PUSH32 operands in the
+    deployedBytecode and writes them in the constructor. Brownie builds
+    do not keep the compiler's immutableReferences, so the zero filled
+    PUSH32 operands are used instead.
+    """
+    ranges = []
+    i = 0
+    while i < len(bytecode):
+        opcode = bytecode[i]
+        if PUSH1 <= opcode <= PUSH32:
+            size = opcode - PUSH1 + 1
+            if opcode == PUSH32 and not any(bytecode[i + 1:i + 1 + size]):
+                ranges.append((i + 1, i + 1 + size))
+            i += size
+        i += 1
+    return ranges
+
+
+def _mask(code, ranges):
+    code = bytearray(code)
+    for start, end in ranges:
+        code[start:end] = bytes(end - start)
+    return bytes(code)
+
+
+def find_implementation(contract, candidates):
+    """Find a deployed implementation matching the compiled contract
+
+    Immutable values are masked in the deployed code before hashing, they
+    differ from one deployment to another.
+
+    Args:
+        contract (ContractContainer): contract to be deployed
+        candidates ([]address): addresses to check
+
+    Returns:
+        address: first candidate with the same code hash, None if not found
+    """
+    bytecode = eth_utils.to_bytes(hexstr=contract._build['deployedBytecode'])
+    ranges = _get_immutable_ranges(bytecode)
+    code_hash = web3.keccak(bytecode)
+    for candidate in dict.fromkeys(candidates):
+        code = bytes(web3.eth.get_code(candidate))
+        if len(code) != len(bytecode):
+            continue
+        if web3.keccak(_mask(code, ranges)) == code_hash:
+            return eth_utils.to_checksum_address(candidate)
+    print(
+        f'\nNo deployed implementation matches {contract._name} among '
+        f'{len(candidates)} candidates'
+    )
+    return None
+
+
+def read_health_checks(contract, checks, proxies, block):
+    """Run the health check calls of proxies in batched multicalls
+
+    Args:
+        contract (ContractContainer): contract of the proxies
+        checks ([]Health_check): view calls
+        proxies ([]address): proxies to be checked
+        block (int): block number the calls are run at
+
+    Returns:
+        {(address, int): value}: value of each check by proxy and check
+            index, None if reverted
+    """
+    keys = []
+    calls = []
+    for proxy in proxies:
+        contract_obj = Contract.from_abi('', proxy, contract.abi)
+        for i, check in enumerate(checks):
+            keys.append((proxy, i))
+            calls.append((contract_obj, check.func, list(check.args.values())))
+    return dict(zip(keys, batch_call(calls, block)))
+
+
+def get_failures(proxies, new_impl, checks, baseline, values, block):
+    """Check the upgraded proxies against the declared expectations
+
+    Every check fails when it reverts. UNCHANGED checks also fail when the
+    value differs from the baseline (unless the baseline reverted) and
+    EQUALS checks when the value differs from the configured one.
+
+    Returns:
+        []str: failure descriptions
+    """
+    failures = []
+    for proxy in proxies:
+        current = get_implementation(proxy, block)
+        if current != new_impl:
+            failures.append(f'{proxy}: implementation is {current}')
+    for (proxy, i), value in values.items():
+        check = checks[i]
+        if value is None:
+            failures.append(f'{proxy}: {check.func}() reverted')
+        elif check.expect == UNCHANGED:
+            previous = baseline.get((proxy, i))
+            if previous is not None and \
+                    normalize(previous) != normalize(value):
+                failures.append(f'{proxy}: {check.func}() changed')
+        elif check.expect == EQUALS:
+            if normalize(value) != normalize(check.value):
+                failures.append(
+                    f'{proxy}: {check.func}() is {value}, '
+                    f'expected {check.value}'
+                )
+        elif check.expect != NO_REVERT:
+            failures.append(
+                f'{proxy}: {check.func}() unknown expectation {check.expect}'
+            )
+    return failures
+
+
+def set_implementations(impls, admin, parallelism, step_name):
+    """Upgrade proxies through their ProxyAdmin
+
+    Args:
+        impls ({address: address}): implementation for each proxy
+        admin (account): owner of the ProxyAdmins
+        parallelism (int): maximum number of pending transactions
+        step_name (str): step name for the artifacts
+
+    Returns:
+        ([]dict, []address): transaction info and successfully
+            upgraded proxies
+    """
+    txs = []
+    for proxy, impl in impls.items():
+        proxy_admin = Contract.from_abi(
+            'ProxyAdmin',
+            get_proxy_admin(proxy),
+            ProxyAdmin.abi
+        )
+        func_name, args = get_upgrade_call(proxy_admin, proxy, impl)
+        txs.append((step_name, proxy_admin, func_name, args))
+    receipts = send_pipelined(
+        txs,
+        {'from': admin, 'gas_limit': GAS_LIMIT},
+        parallelism
+    )
+    upgraded = [
+        proxy for proxy, (_, tx) in zip(impls, receipts) if tx.status == 1
+    ]
+    for proxy in impls:
+        call_cache.invalidate(proxy)
+    return [get_tx_info(name, tx) for name, tx in receipts], upgraded
+
+
+def fleet_upgrade(configuration, deployer):
+    """Upgrade many proxies to one shared implementation in waves
+
+    Every wave is health checked before the next one starts. On failure all
+    the upgraded proxies are rolled back to their previous implementation.
+
+    Post upgrade steps only run once every wave passed its health checks,
+    so a rollback never leaves proxies on the old implementation with
+    state set by the new one. They are not reversed: a failing post upgrade
+    step is recorded in the artifact and the fleet stays on the new
+    implementation. Health checks see the proxies before their post
+    upgrade steps, checks on values set by the steps should not be
+    UNCHANGED.
+
+    Args:
+        configuration ({}): fleet upgrade configurations
+        deployer (address): address of the deployer
+    """
+    config_name, config_data = get_config(
+        'Select config for fleet upgrade',
+        configuration
+    )
+    if type(config_data) is not Upgrade_data or \
+            type(config_data.config) is not Fleet_upgrade_config:
+        print('Incorrect configuration data')
+        return
+    contract = config_data.contract
+    conf = config_data.config
+    print(json.dumps(conf, default=lambda o: o.__dict__, indent=2))
+    confirm('Are the above configurations correct?')
+
+    tx_list = []
+    old_impls = {proxy: get_implementation(proxy) for proxy in conf.proxies}
+    candidates = list(old_impls.values()) + _get_artifact_impls()
+    if conf.implementation is not None:
+        candidates.insert(0, conf.implementation)
+    new_impl = find_implementation(contract, candidates)
+    reused = new_impl is not None
+    if reused:
+        print(f'\nReusing implementation contract: {new_impl}')
+    else:
+        print('\nDeploying new implementation contract')
+        impl = contract.deploy({'from': deployer, 'gas_limit': GAS_LIMIT})
+        tx_list.append(
+            get_tx_info('New_implementation_deployment', impl.tx)
+        )
+        new_impl = impl.address
+
+    admin = deployer
+    if _getYorN('Is admin same as deployer?') == 'n':
+        admin = get_user('Admin account: ')
+
+    baseline_block = web3.eth.block_number
+    baseline = read_health_checks(
+        contract,
+        conf.health_checks,
+        conf.proxies,
+        baseline_block
+    )
+    waves = [
+        conf.proxies[i:i + conf.wave_size]
+        for i in range(0, len(conf.proxies), conf.wave_size)
+    ]
+    upgraded = []
+    wave_data = []
+    rolled_back = []
+    healthy = True
+    for wave_id, wave in enumerate(waves):
+        print(f'\nUpgrading wave {wave_id + 1}/{len(waves)}')
+        pending = {p: new_impl for p in wave if old_impls[p] != new_impl}
+        txs, done = set_implementations(
+            pending,
+            admin,
+            conf.parallelism,
+            'Upgrade_transaction'
+        )
+        tx_list += txs
+        upgraded += done
+        # Receipts are confirmed, the wave is read at the latest block.
+        block = web3.eth.block_number
+        failures = get_failures(
+            wave,
+            new_impl,
+            conf.health_checks,
+            baseline,
+            read_health_checks(contract, conf.health_checks, wave, block),
+            block
+        )
+        wave_data.append({
+            'wave': wave_id,
+            'proxies': wave,
+            'block_number': block,
+            'failures': failures
+        })
+        if failures:
+            healthy = False
+            print('\nHealth check failed:\n' + '\n'.join(failures))
+            print(f'\nRolling back {len(upgraded)} proxies')
+            txs, rolled_back = set_implementations(
+                {proxy: old_impls[proxy] for proxy in upgraded},
+                admin,
+                conf.parallelism,
+                'Rollback_transaction'
+            )
+            tx_list += txs
+            break
+
+    post_upgrade_failures = []
+    if healthy and conf.post_upgrade_steps:
+        print('\nRunning post upgrade steps')
+        for proxy in upgraded:
+            deployed_contract = Contract.from_abi(
+                config_name,
+                proxy,
+                contract.abi
+            )
+            for step in conf.post_upgrade_steps:
+                try:
+                    _, _, tx = run_step(
+                        copy.copy(step),
+                        deployed_contract,
+                        deployer
+                    )
+                except Exception as e:
+                    post_upgrade_failures.append(
+                        f'{proxy}: {step.func}() failed: {e}'
+                    )
+                    break
+                if tx is not None:
+                    tx_list.append(
+                        get_tx_info('Post_upgrade_transaction', tx)
+                    )
+
+    upgrade_data = {
+        'new_impl': new_impl,
+        'reused_impl': reused,
+        'num_proxies': len(conf.proxies),
+        'num_upgraded': len(upgraded) - len(rolled_back),
+        'num_rolled_back': len(rolled_back)
+    }
+    print_dict('Printing Upgrade data', upgrade_data, 20)
+    upgrade_data['type'] = 'FleetUpgrade'
+    upgrade_data['old_impls'] = old_impls
+    upgrade_data['baseline_block'] = baseline_block
+    upgrade_data['waves'] = wave_data
+    upgrade_data['post_upgrade_failures'] = post_upgrade_failures
+    upgrade_data['transactions'] = tx_list
+    upgrade_data['config_name'] = config_name
+    upgrade_data['config'] = conf
+    save_deployment_artifacts(upgrade_data, config_name, 'FleetUpgrade')
+    return upgrade_data
+
+
+def main():
+    deployer = get_user('Deployer account: ')
+    fleet_upgrade(fleet_upgrade_config, deployer)
@@ -0,0 +1,487 @@
+"""Load generator for E20 farms on a local Anvil chain.
+
+A farm deployer and a farm are deployed through the deployment_config and
+farm_config machinery, then a pool of simulated accounts drives a weighted
+mix of deposit, claim, cooldown, withdraw and increase/decrease operations.
+Every round sends one operation for `concurrency` distinct accounts and
+mines them together, in as many blocks as the block gas limit requires,
+then moves the chain time forward so rewards accrue and cooldowns expire.
+
+Throughput and gas percentiles are reported per window of rounds together
+with the number of active deposits, and the reward accounting invariants
+are checked at the end of every window.
+"""
+from brownie import (
+    Contract,
+    FarmRegistry,
+    accounts,
+    chain,
+    web3
+)
+from .constants import (
+    LOAD_TEST_ADMIN,
+    Load_test_config,
+    load_test_config
+)
+from .deploy_and_upgrade import (
+    deploy_contract,
+    deploy_farm,
+    oz_project
+)
+from .utils import (
+    COMMON_FUND_ID,
+    LOCKUP_FUND_ID,
+    batch_call,
+    get_config,
+    is_local_network,
+    print_dict,
+    rpc,
+    save_deployment_artifacts
+)
+import copy
+import random
+import time
+
+ERC20 = oz_project.ERC20
+OP_GAS_LIMIT = 3000000
+ACCOUNT_BALANCE = 10**20
+OPS = ['deposit', 'claim', 'cooldown', 'withdraw', 'increase', 'decrease']
+
+
+def _get_account(address):
+    rpc('anvil_setBalance', [address, hex(ACCOUNT_BALANCE)])
+    return accounts.at(address, force=True)
+
+
+def _deal(token, address, amount):
+    rpc('anvil_dealERC20', [address, token, hex(amount)])
+
+
+def _percentile(values, percent):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    rank = max(0, -(-len(values) * percent // 100) - 1)
+    return values[rank]
+
+
+class Simulated_deposit():
+    def __init__(self, deposit_id, liquidity, locked, timestamp):
+        self.deposit_id = deposit_id
+        self.liquidity = liquidity
+        self.locked = locked
+        self.expiry_date = 0
+        self.timestamp = timestamp
+
+
+class Simulated_user():
+    def __init__(self, account):
+        self.account = account
+        self.deposits = {}
+
+    def get_ops(self, now):
+        """Get the operations the user can run with their current deposits
+
+        Returns:
+            {str: []Simulated_deposit}: candidate deposits of each operation
+        """
+        deposits = list(self.deposits.values())
+        open_deposits = [d for d in deposits if d.expiry_date == 0]
+        return {
+            'deposit': [None],
+            'claim': deposits,
+            'cooldown': [d for d in open_deposits if d.locked],
+            'withdraw': [
+                d for d in deposits
+                if not d.locked and d.expiry_date <= now and d.timestamp < now
+            ],
+            'increase': open_deposits,
+            'decrease': [
+                d for d in open_deposits
+                if not d.locked and d.liquidity > 1 and d.timestamp < now
+            ]
+        }
+
+
+class Load_test():
+    def __init__(self, conf, farm, reward_tokens):
+        self.conf = conf
+        self.farm = farm
+        self.reward_tokens = reward_tokens
+        self.farm_token = Contract.from_abi(
+            'ERC20',
+            farm.farmToken(),
+            ERC20.abi
+        )
+        self.rng = random.Random(conf.seed)
+        self.users = []
+        self.funded = {token: 0 for token in reward_tokens}
+        self.samples = []
+        self.windows = []
+        self.failures = []
+
+    def _send_round(self, txs):
+        """Send transactions of distinct accounts and mine them together
+
+        With automine off a block only includes the transactions fitting
+        its gas limit and the others would stay pending, so the
+        transactions are mined in chunks of the block capacity for
+        OP_GAS_LIMIT.
+
+        Args:
+            txs ([(account, contract, str, [])]): sender, contract,
+                function name and args of each transaction
+
+        Returns:
+            []TransactionReceipt: receipts in the order of txs
+        """
+        capacity = max(
+            1,
+            web3.eth.get_block('latest').gasLimit // OP_GAS_LIMIT
+        )
+        receipts = []
+        for i in range(0, len(txs), capacity):
+            pending = []
+            for account, contract_obj, func_name, args in txs[i:i + capacity]:
+                pending.append(getattr(contract_obj, func_name)(*args, {
+                    'from': account,
+                    'gas_limit': OP_GAS_LIMIT,
+                    'allow_revert': True,
+                    'required_confs': 0
+                }))
+            chain.mine()
+            for tx in pending:
+                tx.wait(1)
+            receipts += pending
+        return receipts
+
+    def setup_users(self):
+        """Create the simulated accounts, fund them with farm tokens and
+        approve the farm"""
+        print(f'\nSetting up {self.conf.num_users} accounts')
+        balance = self.conf.deposit_amount * self.conf.num_rounds
+        for i in range(self.conf.num_users):
+            address = web3.to_checksum_address(
+                web3.keccak(text=f'demeter-load-test-{i}')[-20:]
+            )
+            _deal(self.farm_token.address, address, balance)
+            self.users.append(Simulated_user(_get_account(address)))
+        for i in range(0, len(self.users), self.conf.concurrency):
+            self._send_round([
+                (
+                    user.account,
+                    self.farm_token,
+                    'approve',
+                    [self.farm.address, 2**256 - 1]
+                )
+                for user in self.users[i:i + self.conf.concurrency]
+            ])
+
+    def setup_rewards(self):
+        """Fund the reward tokens for the whole run and set the reward
+        rates"""
+        manager = _get_account(LOAD_TEST_ADMIN)
+        duration = (self.conf.num_rounds + 1) * self.conf.round_interval
+        for token in self.reward_tokens:
+            rates = self.conf.reward_rates.get(token)
+            if rates is None:
+                continue
+            amount = sum(rates) * duration
+            erc20 = Contract.from_abi('ERC20', token, ERC20.abi)
+            _deal(token, manager.address, amount)
+            erc20.approve(self.farm.address, amount, {'from': manager})
+            self.farm.addRewards(token, amount, {'from': manager})
+            self.farm.setRewardRate(token, rates, {'from': manager})
+            self.funded[token] += amount
+        start_time = self.farm.farmStartTime()
+        if chain.time() < start_time:
+            chain.sleep(start_time - chain.time() + 1)
+            chain.mine()
+
+    def _get_tx(self, op, deposit):
+        amount = self.rng.randint(1, self.conf.deposit_amount)
+        if op == 'deposit':
+            locked = self.rng.random() < self.conf.lockup_ratio
+            return 'deposit', [amount, locked]
+        if op == 'claim':
+            return 'claimRewards', [deposit.deposit_id]
+        if op == 'cooldown':
+            return 'initiateCooldown', [deposit.deposit_id]
+        if op == 'withdraw':
+            return 'withdraw', [deposit.deposit_id]
+        if op == 'increase':
+            return 'increaseDeposit', [deposit.deposit_id, amount]
+        return 'decreaseDeposit', [
+            deposit.deposit_id,
+            self.rng.randint(1, deposit.liquidity - 1)
+        ]
+
+    def _apply(self, user, op, deposit, args, tx, timestamp):
+        """Update the simulated state with a successful operation"""
+        if op == 'deposit':
+            deposit_id = tx.events['Deposited']['depositId']
+            user.deposits[deposit_id] = Simulated_deposit(
+                deposit_id,
+                args[0],
+                args[1],
+                timestamp
+            )
+        elif op == 'cooldown':
+            deposit.locked = False
+            deposit.expiry_date = tx.events['CooldownInitiated']['expiryDate']
+        elif op == 'withdraw':
+            del user.deposits[deposit.deposit_id]
+        elif op == 'increase':
+            deposit.liquidity += args[1]
+            deposit.timestamp = timestamp
+        elif op == 'decrease':
+            deposit.liquidity -= args[1]
+
+    def run_round(self, round_id):
+        now = chain.time()
+        weights = self.conf.op_weights
+        ops = []
+        for user in self.rng.sample(self.users, self.conf.concurrency):
+            candidates = {
+                op: deposits for op, deposits in user.get_ops(now).items()
+                if deposits and weights.get(op)
+            }
+            op = self.rng.choices(
+                list(candidates),
+                [weights[op] for op in candidates]
+            )[0]
+            deposit = self.rng.choice(candidates[op])
+            func_name, args = self._get_tx(op, deposit)
+            ops.append((user, op, deposit, func_name, args))
+
+        start = time.time()
+        receipts = self._send_round([
+            (user.account, self.farm, func_name, args)
+            for user, _, _, func_name, args in ops
+        ])
+        elapsed = time.time() - start
+        timestamps = {
+            block: web3.eth.get_block(block).timestamp
+            for block in {tx.block_number for tx in receipts}
+        }
+        for (user, op, deposit, _, args), tx in zip(ops, receipts):
+            if tx.status == 1:
+                self._apply(
+                    user,
+                    op,
+                    deposit,
+                    args,
+                    tx,
+                    timestamps[tx.block_number]
+                )
+            self.samples.append({
+                'round': round_id,
+                'op': op,
+                'status': tx.status,
+                'gas_used': tx.gas_used,
+                'elapsed': elapsed / len(receipts)
+            })
+        chain.sleep(self.conf.round_interval)
+
+    def get_invariant_failures(self):
+        """Check the farm accounting against the simulated deposits
+
+        Returns:
+            []str: failure descriptions
+        """
+        deposits = [
+            deposit
+            for user in self.users
+            for deposit in user.deposits.values()
+        ]
+        reward_erc20s = [
+            Contract.from_abi('ERC20', token, ERC20.abi)
+            for token in self.reward_tokens
+        ]
+        data = batch_call(
+            [
+                (self.farm, 'getRewardFunds', []),
+                (self.farm_token, 'balanceOf', [self.farm.address])
+            ] +
+            [(erc20, 'balanceOf', [self.farm.address])
+             for erc20 in reward_erc20s] +
+            [(self.farm, 'getRewardData', [token])
+             for token in self.reward_tokens] +
+            [(self.farm, 'getDepositInfo', [deposit.deposit_id])
+             for deposit in deposits] +
+            [(erc20, 'balanceOf', [user.account.address])
+             for erc20 in reward_erc20s for user in self.users]
+        )
+        funds, farm_token_balance = data[0], data[1]
+        num_tokens = len(self.reward_tokens)
+        reward_balances = data[2:2 + num_tokens]
+        reward_data = data[2 + num_tokens:2 + 2 * num_tokens]
+        deposit_info = data[
+            2 + 2 * num_tokens:2 + 2 * num_tokens + len(deposits)
+        ]
+        user_balances = data[2 + 2 * num_tokens + len(deposits):]
+
+        failures = []
+        liquidity = sum(deposit.liquidity for deposit in deposits)
+        locked = sum(deposit.liquidity for deposit in deposits
+                     if deposit.locked)
+        chain_liquidity = sum(info[1] for info in deposit_info)
+        if funds[COMMON_FUND_ID][0] != liquidity:
+            failures.append(
+                f'Common fund liquidity {funds[COMMON_FUND_ID][0]} != '
+                f'deposits liquidity {liquidity}'
+            )
+        if chain_liquidity != liquidity:
+            failures.append(
+                f'On-chain deposits liquidity {chain_liquidity} != '
+                f'simulated liquidity {liquidity}'
+            )
+        if len(funds) > LOCKUP_FUND_ID and funds[LOCKUP_FUND_ID][0] != locked:
+            failures.append(
+                f'Lockup fund liquidity {funds[LOCKUP_FUND_ID][0]} != '
+                f'locked liquidity {locked}'
+            )
+        if farm_token_balance != liquidity:
+            failures.append(
+                f'Farm token balance {farm_token_balance} != '
+                f'deposits liquidity {liquidity}'
+            )
+        for i, token in enumerate(self.reward_tokens):
+            # Rewards are only moved by addRewards and claims.
+            claimed = sum(
+                user_balances[i * len(self.users):(i + 1) * len(self.users)]
+            )
+            if reward_balances[i] + claimed != self.funded[token]:
+                failures.append(
+                    f'{token}: farm balance {reward_balances[i]} + claimed '
+                    f'{claimed} != funded {self.funded[token]}'
+                )
+            if reward_data[i][2] > reward_balances[i]:
+                failures.append(
+                    f'{token}: accrued rewards {reward_data[i][2]} exceed '
+                    f'farm balance {reward_balances[i]}'
+                )
+        return failures
+
+    def report_window(self, first_round, last_round):
+        samples = [
+            sample for sample in self.samples
+            if first_round <= sample['round'] <= last_round
+        ]
+        elapsed = sum(sample['elapsed'] for sample in samples)
+        window = {
+            'rounds': f'{first_round}-{last_round}',
+            'active_deposits': sum(len(user.deposits) for user in self.users),
+            'txs': len(samples),
+            'reverted': len([s for s in samples if s['status'] == 0]),
+            'tx_per_sec': round(len(samples) / elapsed, 2) if elapsed else 0
+        }
+        for op in OPS:
+            gas = sorted(
+                sample['gas_used'] for sample in samples
+                if sample['op'] == op and sample['status'] == 1
+            )
+            window[f'{op}_count'] = len(gas)
+            for percent in [50, 90, 99]:
+                window[f'{op}_gas_p{percent}'] = _percentile(gas, percent)
+        window['invariant_failures'] = self.get_invariant_failures()
+        print_dict(
+            f'Rounds {window["rounds"]}',
+            {key: str(value) for key, value in window.items()},
+            25
+        )
+        self.windows.append(window)
+        self.failures += window['invariant_failures']
+
+    def run(self):
+        rpc('evm_setAutomine', [False])
+        try:
+            self.setup_users()
+            first_round = 0
+            for round_id in range(self.conf.num_rounds):
+                self.run_round(round_id)
+                last = round_id == self.conf.num_rounds - 1
+                if (round_id + 1) % self.conf.report_interval == 0 or last:
+                    self.report_window(first_round, round_id)
+                    first_round = round_id + 1
+        finally:
+            rpc('evm_setAutomine', [True])
+
+
+def setup_farm(config_name, conf, deployer):
+    """Deploy the farm deployer and the farm of a load test config
+
+    The registry owner is impersonated to register the deployer and to
+    exempt the farm creator from the farm creation fee.
+
+    Returns:
+        (contract, []dict): farm contract and deployment data
+    """
+    deployer_data = deploy_contract(
+        f'{config_name}_deployer',
+        conf.deployer_data,
+        deployer
+    )
+    registry = Contract.from_abi(
+        'FarmRegistry',
+        conf.deployer_data.config.deployment_params['farm_registry'],
+        FarmRegistry.abi
+    )
+    registry_owner = _get_account(registry.owner())
+    registry.registerFarmDeployer(
+        deployer_data['contract_addr'],
+        {'from': registry_owner}
+    )
+    if not registry.isPrivilegedUser(deployer.address):
+        registry.updatePrivilege(deployer, True, {'from': registry_owner})
+
+    farm_data = copy.copy(conf.farm_data)
+    farm_data.deployer_address = deployer_data['contract_addr']
+    farm_data.config = copy.deepcopy(conf.farm_data.config)
+    farm_data.config.deployment_params['farm_start_time'] = chain.time() + 10
+    farm_deployment = deploy_farm(config_name, farm_data, deployer)
+    farm = Contract.from_abi(
+        config_name,
+        farm_deployment['farm_addr'],
+        conf.farm_data.contract.abi
+    )
+    return farm, [deployer_data, farm_deployment]
+
+
+def main():
+    if not is_local_network():
+        print('Load tests are only supported on local networks and forks')
+        return
+    config_name, conf = get_config(
+        'Select config for load test',
+        load_test_config
+    )
+    if type(conf) is not Load_test_config:
+        print('Incorrect configuration data')
+        return
+    deployer = _get_account(LOAD_TEST_ADMIN)
+    farm, deployments = setup_farm(config_name, conf, deployer)
+    reward_tokens = farm.getRewardTokens()
+
+    load_test = Load_test(conf, farm, reward_tokens)
+    load_test.setup_rewards()
+    load_test.run()
+
+    summary = {
+        'farm': farm.address,
+        'num_users': conf.num_users,
+        'num_rounds': conf.num_rounds,
+        'num_txs': len(load_test.samples),
+        'invariant_failures': len(load_test.failures)
+    }
+    print_dict('Load test summary', summary, 20)
+    summary['type'] = 'LoadTest'
+    summary['windows'] = load_test.windows
+    summary['deployments'] = deployments
+    summary['config_name'] = config_name
+    # Deployment configs are stored with the deployments.
+    summary['config'] = {
+        key: value for key, value in conf.__dict__.items()
+        if key not in ['deployer_data', 'farm_data']
+    }
+    save_deployment_artifacts(summary, config_name, 'LoadTest')
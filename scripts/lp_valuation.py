@@ -0,0 +1,375 @@
+"""Valuation of the LP tokens held by E20 farms.
+
+The pool state of every E20 farm (UniV2 pairs, e.g. SushiSwap and
+TraderJoe, and Balancer V2 pools) is read in batched multicalls pinned to
+one block, then the token amounts of all the deposits are computed at once
+with exact integer arrays:
+
+    amount = liquidity * pool_balance // lp_supply
+
+which is the formula of TokenUtils.getUniV2TokenAmounts. getTokenAmounts
+is unsupported by most E20 farms: UniV2Farm reads the pair through
+INFTPool.getPoolInfo, which reverts on plain UniV2 pairs (SushiSwap,
+TraderJoe), and BalancerV2Farm reverts with NotImplemented. The amounts are
+compared with getTokenAmounts where it is supported, and reported as
+unsupported otherwise.
+"""
+from brownie import (
+    Contract,
+    UniV2Farm,
+    web3
+)
+from .constants import (
+    Apr_report_config,
+    apr_report_config
+)
+from .price_service import Price_service
+from .utils import (
+    COMMON_FUND_ID,
+    ZERO_ADDRESS,
+    batch_call,
+    get_config,
+    get_farms,
+    print_dict,
+    save_deployment_artifacts
+)
+import numpy as np
+
+UNIV2 = 'UniV2'
+BALANCER_V2 = 'BalancerV2'
+# getTokenAmounts reverted, the amounts can not be compared.
+UNSUPPORTED = 'unsupported'
+
+
+def _view(name, inputs, outputs):
+    return {
+        'inputs': [{'name': '', 'type': type_} for type_ in inputs],
+        'name': name,
+        'outputs': [{'name': '', 'type': type_} for type_ in outputs],
+        'stateMutability': 'view',
+        'type': 'function'
+    }
+
+
+# UniV2 pair and Balancer pool token, probed on every farm token.
+LP_TOKEN_ABI = [
+    _view('token0', [], ['address']),
+    _view('token1', [], ['address']),
+    _view('getReserves', [], ['uint112', 'uint112', 'uint32']),
+    _view('totalSupply', [], ['uint256']),
+    _view('getPoolId', [], ['bytes32']),
+    _view('getVault', [], ['address']),
+    _view('getActualSupply', [], ['uint256']),
+    _view('getVirtualSupply', [], ['uint256'])
+]
+BALANCER_VAULT_ABI = [
+    _view('getPoolTokens', ['bytes32'], ['address[]', 'uint256[]', 'uint256'])
+]
+
+
+class Lp_pool():
+    def __init__(self, farm, farm_token, pool_type, tokens, balances, supply):
+        self.farm = farm
+        self.farm_token = farm_token
+        self.pool_type = pool_type
+        self.tokens = tokens
+        self.balances = balances
+        self.supply = supply
+        self.farm_liquidity = 0
+        self.deposits = []
+
+
+def _get_pool_tokens(farm_token, pool_tokens):
+    """Tokens and balances of a Balancer pool, without its own BPT
+
+    Composable pools hold their pre-minted BPT, it is not part of the
+    liquidity.
+    """
+    tokens = []
+    balances = []
+    for token, balance in zip(pool_tokens[0], pool_tokens[1]):
+        if token.lower() != farm_token.lower():
+            tokens.append(token)
+            balances.append(balance)
+    return tokens, balances
+
+
+def get_lp_pools(farms, block, with_deposits=True):
+    """Read the LP pool state of the E20 farms in batched calls
+
+    Farms of other types are skipped.
+
+    Args:
+        farms ([]contract): farm contracts
+        block (int): block number the state is read at
+        with_deposits (bool): also load the active deposits of the farms
+
+    Returns:
+        []Lp_pool: pools of the E20 farms
+    """
+    farms = [
+        Contract.from_abi('E20Farm', farm.address, UniV2Farm.abi)
+        for farm in farms
+    ]
+    num_farms = len(farms)
+    farm_data = batch_call(
+        [(farm, 'farmToken', []) for farm in farms] +
+        [(farm, 'getRewardFunds', []) for farm in farms] +
+        [(farm, 'totalDeposits', []) for farm in farms],
+        block
+    )
+    e20_ids = [i for i in range(num_farms) if farm_data[i] is not None]
+    lp_tokens = [
+        Contract.from_abi('LpToken', farm_data[i], LP_TOKEN_ABI)
+        for i in e20_ids
+    ]
+    funcs = [abi['name'] for abi in LP_TOKEN_ABI]
+    values = batch_call(
+        [(lp_token, func, []) for lp_token in lp_tokens for func in funcs],
+        block
+    )
+    token_data = [
+        dict(zip(funcs, values[j * len(funcs):(j + 1) * len(funcs)]))
+        for j in range(len(lp_tokens))
+    ]
+
+    balancer_ids = [
+        j for j, data in enumerate(token_data)
+        if data['getReserves'] is None and data['getPoolId'] is not None
+    ]
+    deposit_keys = []
+    if with_deposits:
+        deposit_keys = [
+            (i, deposit_id)
+            for i in e20_ids
+            for deposit_id in range(1, farm_data[2 * num_farms + i] + 1)
+        ]
+    results = batch_call(
+        [
+            (
+                Contract.from_abi(
+                    'BalancerVault',
+                    token_data[j]['getVault'],
+                    BALANCER_VAULT_ABI
+                ),
+                'getPoolTokens',
+                [token_data[j]['getPoolId']]
+            )
+            for j in balancer_ids
+        ] +
+        [(farms[i], 'getDepositInfo', [id_]) for i, id_ in deposit_keys],
+        block
+    )
+    pool_tokens = dict(zip(balancer_ids, results[:len(balancer_ids)]))
+    deposits = results[len(balancer_ids):]
+
+    pools = {}
+    for j, i in enumerate(e20_ids):
+        data = token_data[j]
+        farm_token = farm_data[i]
+        if data['getReserves'] is not None and data['token0'] is not None:
+            pool = Lp_pool(
+                farms[i],
+                farm_token,
+                UNIV2,
+                [data['token0'], data['token1']],
+                list(data['getReserves'][:2]),
+                data['totalSupply']
+            )
+        elif pool_tokens.get(j) is not None:
+            tokens, balances = _get_pool_tokens(farm_token, pool_tokens[j])
+            supply = data['getActualSupply']
+            if supply is None:
+                supply = data['getVirtualSupply']
+            if supply is None:
+                supply = data['totalSupply']
+            pool = Lp_pool(
+                farms[i],
+                farm_token,
+                BALANCER_V2,
+                tokens,
+                balances,
+                supply
+            )
+        else:
+            continue
+        funds = farm_data[num_farms + i]
+        pool.farm_liquidity = funds[COMMON_FUND_ID][0] if funds else 0
+        pools[i] = pool
+    for (i, deposit_id), deposit in zip(deposit_keys, deposits):
+        # Withdrawn deposits are deleted.
+        if i in pools and deposit is not None and deposit[0] != ZERO_ADDRESS:
+            pools[i].deposits.append((deposit_id, deposit))
+    return list(pools.values())
+
+
+def get_lp_amounts(liquidity, pool_ids, balances, supplies):
+    """Token amounts of LP shares, exact for uint256 values
+
+    Args:
+        liquidity (np.ndarray): LP amounts, object dtype
+        pool_ids (np.ndarray): pool of each LP amount
+        balances (np.ndarray): (pools, max tokens) pool balances, object
+            dtype, zero padded
+        supplies (np.ndarray): LP supply of each pool, object dtype
+
+    Returns:
+        np.ndarray: (len(liquidity), max tokens) token amounts
+    """
+    # Empty pools have no balances, any non zero divisor gives 0.
+    supplies = np.where(supplies == 0, 1, supplies)
+    return (
+        liquidity[:, None] * balances[pool_ids] // supplies[pool_ids, None]
+    )
+
+
+def value_pools(pools):
+    """Compute the token amounts of the farms and of their deposits
+
+    Args:
+        pools ([]Lp_pool): pools loaded by get_lp_pools
+
+    Returns:
+        []dict: valuation of each farm
+    """
+    if not pools:
+        return []
+    max_tokens = max(len(pool.tokens) for pool in pools)
+    balances = np.zeros((len(pools), max_tokens), dtype=object)
+    for k, pool in enumerate(pools):
+        balances[k, :len(pool.balances)] = pool.balances
+    supplies = np.array([pool.supply for pool in pools], dtype=object)
+
+    # Farm liquidity rows first, then all the deposits.
+    pool_ids = list(range(len(pools)))
+    liquidity = [pool.farm_liquidity for pool in pools]
+    for k, pool in enumerate(pools):
+        pool_ids += [k] * len(pool.deposits)
+        liquidity += [deposit[1] for _, deposit in pool.deposits]
+    amounts = get_lp_amounts(
+        np.array(liquidity, dtype=object),
+        np.array(pool_ids, dtype=np.int64),
+        balances,
+        supplies
+    )
+
+    valuations = []
+    row = len(pools)
+    for k, pool in enumerate(pools):
+        num_tokens = len(pool.tokens)
+        deposits = []
+        for deposit_id, deposit in pool.deposits:
+            deposits.append({
+                'deposit_id': deposit_id,
+                'depositor': deposit[0],
+                'liquidity': deposit[1],
+                'locked': deposit[3] != 0,
+                'amounts': amounts[row, :num_tokens].tolist()
+            })
+            row += 1
+        valuations.append({
+            'farm': pool.farm.address,
+            'farm_token': pool.farm_token,
+            'pool_type': pool.pool_type,
+            'tokens': pool.tokens,
+            'amounts': amounts[k, :num_tokens].tolist(),
+            'deposits': deposits
+        })
+    return valuations
+
+
+def get_lp_token_amounts(farms, block):
+    """Token amounts of the E20 farms, as reported by getTokenAmounts
+
+    Returns:
+        {str: ([]address, []int)}: tokens and amounts keyed by farm address
+    """
+    valuations = value_pools(get_lp_pools(farms, block, False))
+    return {
+        valuation['farm']: (valuation['tokens'], valuation['amounts'])
+        for valuation in valuations
+    }
+
+
+def main():
+    config_name, conf = get_config(
+        'Select config for LP valuation',
+        apr_report_config
+    )
+    if type(conf) is not Apr_report_config:
+        print('Incorrect configuration data')
+        return
+    if conf.price_fixture is not None and conf.record_fixture is not None:
+        print('A valuation can not both serve from and record a fixture')
+        return
+    price_service = Price_service(
+        conf.oracle,
+        ttl=conf.price_ttl,
+        fixture=conf.price_fixture,
+        record=conf.record_fixture is not None
+    )
+    block = web3.eth.block_number if conf.block is None else conf.block
+    farms = get_farms(conf.farm_registry, block)
+    valuations = value_pools(get_lp_pools(farms, block))
+
+    tokens = [token for val in valuations for token in val['tokens']]
+    prices = price_service.get_prices(tokens, block)
+    decimals = price_service.get_decimals(tokens)
+    if conf.record_fixture is not None:
+        price_service.save_fixture(conf.record_fixture)
+
+    def to_usd(tokens, amounts):
+        values = [
+            prices[token.lower()].to_usd(amount, decimals.get(token.lower()))
+            for token, amount in zip(tokens, amounts)
+            if token.lower() in prices
+        ]
+        if len(values) != len(tokens) or None in values:
+            return None
+        return sum(values)
+
+    farm_by_address = {farm.address: farm for farm in farms}
+    reported = batch_call(
+        [
+            (farm_by_address[val['farm']], 'getTokenAmounts', [])
+            for val in valuations
+        ],
+        block
+    )
+    reported = dict(zip([val['farm'] for val in valuations], reported))
+    for valuation in valuations:
+        valuation['tvl_usd'] = to_usd(
+            valuation['tokens'],
+            valuation['amounts']
+        )
+        for deposit in valuation['deposits']:
+            deposit['value_usd'] = to_usd(
+                valuation['tokens'],
+                deposit['amounts']
+            )
+        token_amounts = reported[valuation['farm']]
+        valuation['matches_get_token_amounts'] = (
+            UNSUPPORTED if token_amounts is None
+            else list(token_amounts[1]) == valuation['amounts']
+        )
+        print_dict(
+            f'Farm {valuation["farm"]}',
+            {
+                'pool_type': valuation['pool_type'],
+                'deposits': len(valuation['deposits']),
+                'tvl_usd': str(valuation['tvl_usd']),
+                'matches_get_token_amounts':
+                    str(valuation['matches_get_token_amounts'])
+            },
+            30
+        )
+    save_deployment_artifacts(
+        {
+            'type': 'LpValuation',
+            'block_number': block,
+            'farms': valuations,
+            'config_name': config_name
+        },
+        config_name,
+        'LpValuation'
+    )
@@ -0,0 +1,150 @@
+"""Offline signer for bulk transaction plans.
+
+This module intentionally does not depend on brownie or on a network
+connection so that it can run on a cold-wallet machine, with only the
+packages of requirements-signer.txt installed:
+
+    pip install -r requirements-signer.txt
+    python scripts/offline_signer.py <plan> <output> --keystore <keystore>
+
+The plan file is built with `scripts/bulk_tx.py` and the signed file is
+broadcasted with the same script.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from eth_account import Account
+from getpass import getpass
+import argparse
+import eth_utils
+import json
+import os
+
+SIGN_CHUNK_SIZE = 64
+
+# Private key of the worker process, set once by _init_worker.
+_private_key = None
+
+
+def _init_worker(private_key):
+    global _private_key
+    _private_key = private_key
+
+
+def _sign(tx):
+    """Sign a single transaction, runs inside a worker process
+
+    Args:
+        tx (dict): unsigned transaction
+
+    Returns:
+        dict: nonce, raw transaction and transaction hash, 0x prefixed
+    """
+    signed = Account.sign_transaction(tx, _private_key)
+    # eth-account 0.13 renamed rawTransaction to raw_transaction.
+    raw_tx = getattr(signed, 'raw_transaction', None)
+    if raw_tx is None:
+        raw_tx = signed.rawTransaction
+    return {
+        'nonce': tx['nonce'],
+        'raw_tx': eth_utils.to_hex(raw_tx),
+        'tx_hash': eth_utils.to_hex(signed.hash)
+    }
+
+
+def _to_signable(tx):
+    """Convert a plan entry to the dict expected by eth_account
+
+    Args:
+        tx (dict): transaction entry of the plan
+
+    Returns:
+        dict: transaction fields accepted by Account.sign_transaction
+    """
+    res = {
+        'chainId': tx['chainId'],
+        'nonce': tx['nonce'],
+        'to': tx['to'],
+        'data': tx['data'],
+        'value': tx['value'],
+        'gas': tx['gas']
+    }
+    if 'maxFeePerGas' in tx:
+        res['maxFeePerGas'] = tx['maxFeePerGas']
+        res['maxPriorityFeePerGas'] = tx['maxPriorityFeePerGas']
+    else:
+        res['gasPrice'] = tx['gasPrice']
+    return res
+
+
+def sign_plan(plan, private_key, workers=None):
+    """Sign all the transactions of a plan in a process pool
+
+    Args:
+        plan (dict): plan produced by bulk_tx.build_plan
+        private_key (str|bytes): private key of the plan's sender
+        workers (int): number of worker processes, defaults to cpu count
+
+    Returns:
+        dict: signed plan ready to be broadcasted
+    """
+    sender = Account.from_key(private_key).address
+    if sender.lower() != plan['sender'].lower():
+        raise ValueError(
+            f'Key address {sender} does not match plan sender '
+            f'{plan["sender"]}'
+        )
+    txs = [_to_signable(tx) for tx in plan['transactions']]
+    # The key is sent once to each worker instead of with every task.
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(private_key,)
+    ) as executor:
+        signed = list(
+            executor.map(_sign, txs, chunksize=SIGN_CHUNK_SIZE)
+        )
+    for entry, tx in zip(signed, plan['transactions']):
+        entry['step'] = tx['step']
+        entry['to'] = tx['to']
+    return {
+        'type': 'SignedPlan',
+        'config_name': plan['config_name'],
+        'chain_id': plan['chain_id'],
+        'sender': plan['sender'],
+        'transactions': signed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Sign a bulk transaction plan offline'
+    )
+    parser.add_argument('plan', help='Plan file built by bulk_tx.py')
+    parser.add_argument('output', help='File to write the signed plan to')
+    parser.add_argument(
+        '--keystore',
+        required=True,
+        help='Encrypted keystore json (e.g. ~/.brownie/accounts/<id>.json)'
+    )
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with open(args.plan) as plan_file:
+        plan = json.load(plan_file)
+    with open(os.path.expanduser(args.keystore)) as keystore_file:
+        private_key = Account.decrypt(
+            json.load(keystore_file),
+            getpass('Keystore password: ')
+        )
+
+    print(
+        f'Signing {len(plan["transactions"])} transactions for '
+        f'{plan["sender"]} on chain {plan["chain_id"]}'
+    )
+    signed_plan = sign_plan(plan, private_key, args.workers)
+    with open(args.output, 'w') as json_file:
+        json.dump(signed_plan, json_file, indent=4)
+    print(f'Signed transactions stored at: {args.output}')
+
+
+if __name__ == '__main__':
+    main()
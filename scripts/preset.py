@@ -10,6 +10,10 @@ from brownie import (
     accounts
 )
 
+from .call_cache import (
+    cached,
+    call_cache
+)
 from .utils import get_user
 
 oz_project = project.load(BrownieConfig["dependencies"][4])
@@ -24,12 +28,13 @@ def main():
     usds = ERC20.at('0xD74f5255D557944cf7Dd0E45FF521520002D5748')
     spa = ERC20.at('0x5575552988a3a80504bbaeb1311674fcfd40ad4b')
 
-    # Base contracts
-    farmRegistry = Contract.from_abi('FarmRegistry', '0x45bC6B44107837E7aBB21E2CaCbe7612Fce222e0', FarmRegistry.abi)
-    rewarderFactory = Contract.from_abi('RewarderFactory', '0x382B536873746b36faCBC0d45cDE17D122affB79', RewarderFactory.abi)
-    arbRewarder = Contract.from_abi('Rewarder', '0x9418678F11298e847F420BC8276BA1e459b51f01', Rewarder.abi)
-    spaRewarder = Contract.from_abi('Rewarder', '0x3529D51de1c473cD78D439784825f40738f001FD', Rewarder.abi)
+    # Base contracts, view calls go through the shared call cache.
+    # Use `with call_cache.pin():` to read a consistent block.
+    farmRegistry = cached(Contract.from_abi('FarmRegistry', '0x45bC6B44107837E7aBB21E2CaCbe7612Fce222e0', FarmRegistry.abi))
+    rewarderFactory = cached(Contract.from_abi('RewarderFactory', '0x382B536873746b36faCBC0d45cDE17D122affB79', RewarderFactory.abi))
+    arbRewarder = cached(Contract.from_abi('Rewarder', '0x9418678F11298e847F420BC8276BA1e459b51f01', Rewarder.abi))
+    spaRewarder = cached(Contract.from_abi('Rewarder', '0x3529D51de1c473cD78D439784825f40738f001FD', Rewarder.abi))
     
-    camelotV3Deployer = Contract.from_abi('CamelotV3Deployer', '0x212208daF12D7612e65fb39eE9a07172b08226B8', CamelotV3FarmDeployer.abi)
+    camelotV3Deployer = cached(Contract.from_abi('CamelotV3Deployer', '0x212208daF12D7612e65fb39eE9a07172b08226B8', CamelotV3FarmDeployer.abi))
     
-    camelotV3Farm = Contract.from_abi('CamelotV3Farm', '0xadbcc455c700ac6ec6a8b692e81996cfefdf56b7', CamelotV3Farm.abi)    
\ No newline at end of file
+    camelotV3Farm = cached(Contract.from_abi('CamelotV3Farm', '0xadbcc455c700ac6ec6a8b692e81996cfefdf56b7', CamelotV3Farm.abi))    
\ No newline at end of file
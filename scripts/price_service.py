@@ -0,0 +1,276 @@
+from brownie import (
+    Contract,
+    web3
+)
+from .utils import batch_call
+from collections import OrderedDict
+import bisect
+import json
+import os
+
+MAX_CACHE_SIZE = 1024
+ORACLE_ABI = [
+    {
+        'inputs': [
+            {'internalType': 'address', 'name': '_token', 'type': 'address'}
+        ],
+        'name': 'getPrice',
+        'outputs': [
+            {
+                'components': [
+                    {
+                        'internalType': 'uint256',
+                        'name': 'price',
+                        'type': 'uint256'
+                    },
+                    {
+                        'internalType': 'uint256',
+                        'name': 'precision',
+                        'type': 'uint256'
+                    }
+                ],
+                'internalType': 'struct IOracle.PriceData',
+                'name': '',
+                'type': 'tuple'
+            }
+        ],
+        'stateMutability': 'view',
+        'type': 'function'
+    },
+    {
+        'inputs': [
+            {'internalType': 'address', 'name': '_token', 'type': 'address'}
+        ],
+        'name': 'priceFeedExists',
+        'outputs': [{'internalType': 'bool', 'name': '', 'type': 'bool'}],
+        'stateMutability': 'view',
+        'type': 'function'
+    }
+]
+ERC20_DECIMALS_ABI = [
+    {
+        'inputs': [],
+        'name': 'decimals',
+        'outputs': [{'internalType': 'uint8', 'name': '', 'type': 'uint8'}],
+        'stateMutability': 'view',
+        'type': 'function'
+    }
+]
+
+
+class Price_data():
+    def __init__(self, price, precision, block, timestamp=None):
+        self.price = price
+        self.precision = precision
+        self.block = block
+        self.timestamp = timestamp
+
+    def to_usd(self, amount, decimals):
+        """Get the USD value of a token amount
+
+        Args:
+            amount (int): token amount in the token's decimals
+            decimals (int): decimals of the token
+
+        Returns:
+            float: USD value of the amount, None if decimals are unknown
+        """
+        if decimals is None:
+            return None
+        return amount * self.price / (self.precision * 10**decimals)
+
+
+class Price_service():
+    """Cached price layer over IOracle.getPrice
+
+    Prices are cached per token with the block they were read at. A cached
+    price is served for the same block, or for a later block within
+    `ttl` seconds. Misses of a request are fetched in one batched multicall.
+    When a fixture is given, prices are served from it without touching
+    the chain (latest recorded block at or before the requested block).
+    Fixtures only replace the oracle and decimals reads, the farm state of
+    a backtest is still read from a node serving the requested block
+    (an archive node or a fork). Fixtures are recorded with `record=True`
+    and save_fixture().
+    """
+
+    def __init__(
+        self,
+        oracle,
+        ttl=0,
+        max_size=MAX_CACHE_SIZE,
+        fixture=None,
+        record=False
+    ):
+        self.oracle = Contract.from_abi('Oracle', oracle, ORACLE_ABI)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.record = record
+        self.cache = OrderedDict()
+        self.decimals = {}
+        self.block_timestamps = {}
+        self.recorded = {}
+        self.fixture = None
+        if fixture is not None:
+            self.fixture = self._load_fixture(fixture)
+        self.hits = 0
+        self.misses = 0
+
+    def _load_fixture(self, path):
+        with open(path) as fixture_file:
+            data = json.load(fixture_file)
+        fixture = {}
+        for token, prices in data['prices'].items():
+            blocks = sorted(int(block) for block in prices)
+            fixture[token.lower()] = (
+                blocks,
+                [prices[str(block)] for block in blocks]
+            )
+        self.decimals.update({
+            token.lower(): decimals
+            for token, decimals in data['decimals'].items()
+        })
+        return fixture
+
+    def save_fixture(self, path):
+        """Store the prices and decimals fetched while recording as a
+        fixture, merged with an existing fixture at the same path
+
+        Args:
+            path (str): path of the fixture file
+        """
+        data = {'prices': {}, 'decimals': {}}
+        if os.path.exists(path):
+            with open(path) as fixture_file:
+                data = json.load(fixture_file)
+        for (token, block), price in self.recorded.items():
+            data['prices'].setdefault(token, {})[str(block)] = [
+                price.price,
+                price.precision
+            ]
+        data['decimals'].update(self.decimals)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fixture_file:
+            json.dump(data, fixture_file, indent=4)
+        print(f'Price fixture stored at: {path}')
+
+    def _get_timestamp(self, block):
+        if block not in self.block_timestamps:
+            self.block_timestamps[block] = web3.eth.get_block(block).timestamp
+        return self.block_timestamps[block]
+
+    def _from_fixture(self, token, block):
+        blocks, prices = self.fixture.get(token, ([], []))
+        i = bisect.bisect_right(blocks, block)
+        if i == 0:
+            return None
+        price, precision = prices[i - 1]
+        return Price_data(price, precision, blocks[i - 1])
+
+    def _get_cached(self, token, block):
+        price = self.cache.get(token)
+        if price is None or price.block > block:
+            return None
+        if price.block != block:
+            if not self.ttl or price.timestamp is None:
+                return None
+            if self._get_timestamp(block) - price.timestamp > self.ttl:
+                return None
+        self.cache.move_to_end(token)
+        return price
+
+    def _set_cached(self, token, price):
+        self.cache[token] = price
+        self.cache.move_to_end(token)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    def get_prices(self, tokens, block=None):
+        """Get the prices of tokens at a block
+
+        Args:
+            tokens ([]address): tokens, duplicates are fetched once
+            block (int): block number, latest if None
+
+        Returns:
+            {str: Price_data}: price of each token, keyed by lower case
+                address
+        """
+        tokens = list(dict.fromkeys(token.lower() for token in tokens))
+        if self.fixture is not None:
+            if block is None:
+                raise ValueError('Block is required to serve from a fixture')
+            prices = {}
+            for token in tokens:
+                price = self._from_fixture(token, block)
+                if price is None:
+                    print(f'No fixture price for {token} at block {block}')
+                    continue
+                prices[token] = price
+            return prices
+        if block is None:
+            block = web3.eth.block_number
+
+        prices = {}
+        misses = []
+        for token in tokens:
+            price = self._get_cached(token, block)
+            if price is None:
+                misses.append(token)
+            else:
+                prices[token] = price
+        self.hits += len(prices)
+        self.misses += len(misses)
+        if not misses:
+            return prices
+
+        timestamp = self._get_timestamp(block) if self.ttl else None
+        results = batch_call(
+            [(self.oracle, 'getPrice', [token]) for token in misses],
+            block
+        )
+        for token, result in zip(misses, results):
+            if result is None:
+                print(f'Price feed not available for {token}')
+                continue
+            price = Price_data(result[0], result[1], block, timestamp)
+            self._set_cached(token, price)
+            if self.record:
+                self.recorded[(token, block)] = price
+            prices[token] = price
+        return prices
+
+    def get_decimals(self, tokens):
+        """Get the decimals of tokens, cached for the lifetime of the service
+
+        Args:
+            tokens ([]address): token addresses
+
+        Returns:
+            {str: int}: decimals of each token, keyed by lower case address,
+                None when unknown
+        """
+        tokens = list(dict.fromkeys(token.lower() for token in tokens))
+        misses = [token for token in tokens if token not in self.decimals]
+        if self.fixture is not None:
+            results = [None] * len(misses)
+        else:
+            results = batch_call([
+                (Contract.from_abi('ERC20', token, ERC20_DECIMALS_ABI),
+                 'decimals', [])
+                for token in misses
+            ])
+        for token, decimals in zip(misses, results):
+            if decimals is None:
+                print(f'Decimals not available for {token}')
+                continue
+            self.decimals[token] = decimals
+        return {token: self.decimals.get(token) for token in tokens}
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'cached_tokens': len(self.cache)
+        }
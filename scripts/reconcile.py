@@ -0,0 +1,279 @@
+from brownie import (
+    Contract,
+    web3
+)
+from .constants import (
+    Create_Farm_data,
+    Deployment_data,
+    Upgrade_data,
+    deployment_config,
+    farm_config,
+    upgrade_config
+)
+from .deploy_and_upgrade import get_proxy_admin
+from .utils import (
+    ONE_DAY,
+    ZERO_ADDRESS,
+    batch_call,
+    get_latest_artifact,
+    normalize,
+    print_dict,
+    save_deployment_artifacts
+)
+
+# deployment param: getter proving it
+PARAM_GETTERS = {
+    'fee_receiver': 'feeReceiver',
+    'fee_token': 'feeToken',
+    'fee_amount': 'feeAmount',
+    'extension_fee_per_day': 'extensionFeePerDay',
+    'oracle': 'oracle',
+    'farm_registry': 'FARM_REGISTRY',
+    'farm_id': 'farmId',
+    'protocol_factory': 'PROTOCOL_FACTORY'
+}
+# pool_data keys of the tick bounds across farm configs
+TICK_GETTERS = {
+    'lower_tick': 'tickLowerAllowed',
+    'upper_tick': 'tickUpperAllowed',
+    'tickLowerAllowed': 'tickLowerAllowed',
+    'tickUpperAllowed': 'tickUpperAllowed'
+}
+
+
+class Check():
+    def __init__(self, config_name, contract_obj, func, args, expected):
+        self.config_name = config_name
+        self.contract = contract_obj
+        self.func = func
+        self.args = args
+        self.expected = expected
+
+
+def _get_expected_owner(steps, default=None):
+    """Owner set by the last ownership step"""
+    owner = default
+    for step in steps:
+        if step.func == 'transferOwnership':
+            owner = list(step.args.values())[0]
+        elif step.func == 'renounceOwnership':
+            owner = ZERO_ADDRESS
+    return owner
+
+
+def _unchecked(config_name, address, entry):
+    return {
+        'config': config_name,
+        'address': address,
+        'check': entry,
+        'expected': None,
+        'actual': None,
+        'status': 'unchecked'
+    }
+
+
+def _get_admin_slot_result(config_name, proxy, proxy_admin, block):
+    return {
+        'config': config_name,
+        'address': proxy,
+        'check': 'proxy admin slot',
+        'expected': proxy_admin,
+        'actual': get_proxy_admin(proxy, block)
+    }
+
+
+def _get_reward_token_data(reward_data):
+    """Token and manager of a reward_token_data entry, of any config
+    version"""
+    values = list(reward_data.values())
+    return values[0], values[1]
+
+
+def get_deployment_checks(config_name, config_data, block):
+    """Get the view calls proving a deployment config
+
+    Args:
+        config_name (str): name of the configuration
+        config_data (Deployment_data): deployment configuration
+        block (int): block number the slots are read at
+
+    Returns:
+        ([]Check, []dict): checks and results which are not view calls
+    """
+    artifact = get_latest_artifact(config_name, 'Deployment')
+    if artifact is None:
+        return [], [_unchecked(config_name, None, 'No deployment artifact')]
+    conf = config_data.config
+    address = artifact.get('proxy_addr') or artifact.get('contract_addr')
+    contract_obj = Contract.from_abi(
+        config_name,
+        address,
+        config_data.contract.abi
+    )
+    checks = []
+    results = []
+    if conf.upgradeable:
+        results.append(_get_admin_slot_result(
+            config_name,
+            address,
+            conf.proxy_admin or artifact['proxy_admin'],
+            block
+        ))
+    for param, value in conf.deployment_params.items():
+        getter = PARAM_GETTERS.get(param)
+        if getter is None or getter not in contract_obj.signatures:
+            results.append(
+                _unchecked(config_name, address, f'deployment param {param}')
+            )
+            continue
+        checks.append(Check(config_name, contract_obj, getter, [], value))
+    owner = _get_expected_owner(conf.post_deployment_steps)
+    if owner is not None:
+        checks.append(Check(config_name, contract_obj, 'owner', [], owner))
+    return checks, results
+
+
+def get_farm_checks(config_name, config_data):
+    """Get the view calls proving a farm config
+
+    Returns:
+        ([]Check, []dict): checks and results which are not view calls
+    """
+    artifact = get_latest_artifact(config_name, 'FarmCreation')
+    if artifact is None:
+        return [], [
+            _unchecked(config_name, None, 'No farm creation artifact')
+        ]
+    params = config_data.config.deployment_params
+    farm = Contract.from_abi(
+        config_name,
+        artifact['farm_addr'],
+        config_data.contract.abi
+    )
+    owner = _get_expected_owner(
+        config_data.config.post_deployment_steps,
+        params['farm_admin']
+    )
+    checks = [
+        Check(config_name, farm, 'owner', [], owner),
+        Check(
+            config_name,
+            farm,
+            'cooldownPeriod',
+            [],
+            params['cooldown_period'] * ONE_DAY
+        )
+    ]
+    for key, value in params['pool_data'].items():
+        if key in TICK_GETTERS:
+            checks.append(
+                Check(config_name, farm, TICK_GETTERS[key], [], value)
+            )
+    reward_data = [
+        _get_reward_token_data(data) for data in params['reward_token_data']
+    ]
+    checks.append(
+        Check(
+            config_name,
+            farm,
+            'getRewardTokens',
+            [],
+            [token for token, _ in reward_data]
+        )
+    )
+    for token, manager in reward_data:
+        checks.append(
+            Check(config_name, farm, 'getRewardData', [token], manager)
+        )
+    return checks, []
+
+
+def reconcile(block):
+    """Compare all the deployment, farm and upgrade configs with the chain
+
+    Args:
+        block (int): block number the chain state is read at
+
+    Returns:
+        ([]dict, []dict): mismatches and all the check results
+    """
+    checks = []
+    results = []
+    for config_name, config_data in deployment_config.items():
+        if type(config_data) is Deployment_data:
+            entry_checks, entry_results = get_deployment_checks(
+                config_name,
+                config_data,
+                block
+            )
+            checks += entry_checks
+            results += entry_results
+    for config_name, config_data in farm_config.items():
+        if type(config_data) is Create_Farm_data:
+            entry_checks, entry_results = get_farm_checks(
+                config_name,
+                config_data
+            )
+            checks += entry_checks
+            results += entry_results
+    for config_name, config_data in upgrade_config.items():
+        if type(config_data) is Upgrade_data:
+            results.append(_get_admin_slot_result(
+                config_name,
+                config_data.config.proxy_address,
+                config_data.config.proxy_admin,
+                block
+            ))
+
+    values = batch_call(
+        [(check.contract, check.func, check.args) for check in checks],
+        block
+    )
+    for check, value in zip(checks, values):
+        if check.func == 'getRewardData' and value is not None:
+            value = value[0]
+        results.append({
+            'config': check.config_name,
+            'address': check.contract.address,
+            'check': f'{check.func}({", ".join(map(str, check.args))})',
+            'expected': check.expected,
+            'actual': value
+        })
+    for result in results:
+        if 'status' in result:
+            continue
+        if result['actual'] is None:
+            result['status'] = 'reverted'
+        elif normalize(result['actual']) == normalize(result['expected']):
+            result['status'] = 'ok'
+        else:
+            result['status'] = 'mismatch'
+    mismatches = [
+        result for result in results
+        if result['status'] in ['mismatch', 'reverted']
+    ]
+    return mismatches, results
+
+
+def main():
+    block = web3.eth.block_number
+    mismatches, results = reconcile(block)
+    for result in mismatches:
+        print_dict(
+            f'{result["config"]}: {result["check"]}',
+            {
+                'address': str(result['address']),
+                'expected': str(result['expected']),
+                'actual': str(result['actual']),
+                'status': result['status']
+            },
+            20
+        )
+    summary = {'block_number': block, 'checks': len(results)}
+    for status in ['ok', 'mismatch', 'reverted', 'unchecked']:
+        summary[status] = len([r for r in results if r['status'] == status])
+    print_dict('Reconciliation summary', summary, 20)
+    summary['type'] = 'Reconciliation'
+    summary['mismatches'] = mismatches
+    summary['results'] = results
+    save_deployment_artifacts(summary, 'all_configs', 'Reconciliation')
@@ -0,0 +1,254 @@
+from brownie import (
+    Contract,
+    UniV3Farm,
+    web3
+)
+from .constants import (
+    Reward_funding_config,
+    reward_funding_config
+)
+from .deploy_and_upgrade import (
+    GAS_LIMIT,
+    get_tx_info,
+    get_user,
+    oz_project
+)
+from .utils import (
+    ONE_DAY,
+    batch_call,
+    confirm,
+    get_config,
+    get_farms,
+    print_dict,
+    save_deployment_artifacts,
+    send_pipelined
+)
+import json
+
+ERC20 = oz_project.ERC20
+
+
+def get_funding_plan(conf, funder, block):
+    """Compute the rewards required by each farm for the target runway
+
+    The emission rate of a token is the sum of its rates over all the reward
+    funds, i.e. assuming every fund has liquidity. Runway starts at the
+    farm's start time for farms which have not started yet and is capped at
+    the farm's end time for expirable farms.
+
+    Args:
+        conf (Reward_funding_config): funding configuration
+        funder (address): address funding the rewards
+        block (int): block number the state is read at
+
+    Returns:
+        ([]dict, dict): per farm funding entries and per token totals
+    """
+    farms = get_farms(conf.farm_registry, block)
+    now = web3.eth.get_block(block).timestamp
+    reward_tokens = [token.lower() for token in conf.reward_tokens]
+
+    farm_data = batch_call(
+        [(farm, 'getRewardTokens', []) for farm in farms] +
+        [(farm, 'isFarmOpen', []) for farm in farms] +
+        [(farm, 'farmEndTime', []) for farm in farms] +
+        [(farm, 'farmStartTime', []) for farm in farms],
+        block
+    )
+    num_farms = len(farms)
+    pairs = []
+    for i, farm in enumerate(farms):
+        if not farm_data[num_farms + i]:
+            continue
+        end_time = farm_data[2 * num_farms + i]
+        start = max(now, farm_data[3 * num_farms + i] or 0)
+        for token in farm_data[i] or []:
+            if reward_tokens and token.lower() not in reward_tokens:
+                continue
+            pairs.append((farm, token, start, end_time))
+
+    reward_data = batch_call(
+        [(farm, 'getRewardRates', [token]) for farm, token, _, _ in pairs] +
+        [(farm, 'getRewardBalance', [token]) for farm, token, _, _ in pairs],
+        block
+    )
+    plan = []
+    for i, (farm, token, start, end_time) in enumerate(pairs):
+        rate = sum(reward_data[i] or [])
+        balance = reward_data[len(pairs) + i] or 0
+        runway_end = start + conf.runway_days * ONE_DAY
+        end = runway_end if end_time is None else min(runway_end, end_time)
+        required = rate * max(0, end - start)
+        plan.append({
+            'farm': farm.address,
+            'token': token,
+            'rewards_per_sec': rate,
+            'reward_balance': balance,
+            'runway_start': start,
+            'runway_end': end,
+            'required': required,
+            'amount': max(0, required - balance)
+        })
+    plan = [entry for entry in plan if entry['amount'] > 0]
+
+    tokens = {}
+    for entry in plan:
+        tokens.setdefault(entry['token'], 0)
+        tokens[entry['token']] += entry['amount']
+    erc20s = {
+        token: Contract.from_abi('ERC20', token, ERC20.abi)
+        for token in tokens
+    }
+    balances = batch_call(
+        [(erc20s[token], 'balanceOf', [funder]) for token in tokens] +
+        [
+            (erc20s[entry['token']], 'allowance', [funder, entry['farm']])
+            for entry in plan
+        ],
+        block
+    )
+    for i, entry in enumerate(plan):
+        entry['allowance'] = balances[len(tokens) + i]
+    approvals = get_approvals(plan)
+    totals = {}
+    for i, token in enumerate(tokens):
+        totals[token] = {
+            'amount': tokens[token],
+            'funder_balance': balances[i],
+            'approval_amount': sum(approvals.get(token, {}).values())
+        }
+    return plan, totals
+
+
+def get_approvals(plan):
+    """Merge the allowances required by the plan per token
+
+    addRewards pulls the rewards from the caller into each farm and ERC20
+    allowances are per spender, so a token is approved once for each of its
+    farms, for the total that farm pulls. Allowances already covering the
+    total are not approved again.
+
+    Args:
+        plan ([]dict): funding entries from get_funding_plan
+
+    Returns:
+        {str: {str: int}}: amount to approve by token and farm
+    """
+    required = {}
+    allowances = {}
+    for entry in plan:
+        key = (entry['token'], entry['farm'])
+        required[key] = required.get(key, 0) + entry['amount']
+        allowances[key] = entry['allowance']
+    approvals = {}
+    for (token, farm), amount in required.items():
+        if allowances[(token, farm)] < amount:
+            approvals.setdefault(token, {})[farm] = amount
+    return approvals
+
+
+def execute_funding_plan(plan, funder):
+    """Send the approvals and addRewards transactions through pipelines
+
+    The approvals of get_approvals are pipelined first. The addRewards
+    calls are pipelined once they are mined, skipping the ones whose
+    approval reverted.
+
+    Args:
+        plan ([]dict): funding entries from get_funding_plan
+        funder (account): account funding the rewards
+
+    Returns:
+        []: transaction info of the sent transactions
+    """
+    tx_params = {'from': funder, 'gas_limit': GAS_LIMIT}
+    keys = []
+    txs = []
+    for token, farms in get_approvals(plan).items():
+        erc20 = Contract.from_abi('ERC20', token, ERC20.abi)
+        for farm, amount in farms.items():
+            keys.append((token, farm))
+            txs.append((
+                'Approve_transaction',
+                erc20,
+                'approve',
+                [farm, amount]
+            ))
+    receipts = send_pipelined(txs, tx_params)
+    failed = {
+        key for key, (_, tx) in zip(keys, receipts) if tx.status != 1
+    }
+
+    txs = []
+    for entry in plan:
+        if (entry['token'], entry['farm']) in failed:
+            print(
+                f'Skipping addRewards of {entry["token"]} to '
+                f'{entry["farm"]}, approval reverted'
+            )
+            entry['skipped'] = True
+            continue
+        txs.append((
+            'Add_rewards_transaction',
+            Contract.from_abi('Farm', entry['farm'], UniV3Farm.abi),
+            'addRewards',
+            [entry['token'], entry['amount']]
+        ))
+    receipts += send_pipelined(txs, tx_params)
+    return [get_tx_info(name, tx) for name, tx in receipts]
+
+
+def fund_rewards(configuration, funder):
+    config_name, conf = get_config(
+        'Select config for reward funding',
+        configuration
+    )
+    if type(conf) is not Reward_funding_config:
+        print('Incorrect configuration data')
+        return
+    print(json.dumps(conf, default=lambda o: o.__dict__, indent=2))
+    confirm('Are the above configurations correct?')
+
+    block = web3.eth.block_number
+    plan, totals = get_funding_plan(conf, funder.address, block)
+    if not plan:
+        print('\nAll farms are funded for the runway')
+        return
+    for entry in plan:
+        print_dict(
+            f'Funding {entry["farm"]}',
+            {
+                'token': entry['token'],
+                'rewards_per_sec': entry['rewards_per_sec'],
+                'reward_balance': entry['reward_balance'],
+                'amount': entry['amount']
+            },
+            20
+        )
+    insufficient = False
+    for token, total in totals.items():
+        print_dict(f'Total for {token}', total, 20)
+        if total['funder_balance'] < total['amount']:
+            print(f'Insufficient balance of {token}')
+            insufficient = True
+    if insufficient:
+        return
+    confirm(f'Send rewards to {len(plan)} farm reward pools?')
+
+    tx_list = execute_funding_plan(plan, funder)
+    funding_data = {
+        'type': 'RewardFunding',
+        'block_number': block,
+        'funder': funder.address,
+        'plan': plan,
+        'totals': totals,
+        'transactions': tx_list,
+        'config_name': config_name,
+        'config': conf
+    }
+    save_deployment_artifacts(funding_data, config_name, 'RewardFunding')
+
+
+def main():
+    funder = get_user('Funder account: ')
+    fund_rewards(reward_funding_config, funder)
@@ -0,0 +1,506 @@
+from brownie import (
+    Contract,
+    accounts,
+    chain,
+    web3
+)
+from brownie.exceptions import VirtualMachineError
+from .constants import (
+    Step,
+    Upgrade_data,
+    upgrade_config
+)
+from .deploy_and_upgrade import (
+    GAS_LIMIT,
+    ProxyAdmin,
+    get_implementation,
+    get_tx_info,
+    get_upgrade_call,
+    get_user,
+    resolve_args
+)
+from .utils import (
+    ZERO_ADDRESS,
+    confirm,
+    get_configs,
+    get_latest_artifact,
+    is_local_network,
+    print_dict,
+    save_deployment_artifacts
+)
+import eth_utils
+import json
+import time
+
+# MultiSendCallOnly v1.3.0, deployed at the same address on all chains.
+MULTISEND_CALL_ONLY = '0x40A2aCCbd92BCA938b02010E17A5b8929b49130D'
+MULTISEND_ABI = [
+    {
+        'inputs': [
+            {'internalType': 'bytes', 'name': 'transactions', 'type': 'bytes'}
+        ],
+        'name': 'multiSend',
+        'outputs': [],
+        'stateMutability': 'payable',
+        'type': 'function'
+    }
+]
+
+
+def _function(name, inputs, outputs, state_mutability='view'):
+    return {
+        'inputs': [
+            {'internalType': type_, 'name': name_, 'type': type_}
+            for type_, name_ in inputs
+        ],
+        'name': name,
+        'outputs': [
+            {'internalType': type_, 'name': '', 'type': type_}
+            for type_ in outputs
+        ],
+        'stateMutability': state_mutability,
+        'type': 'function'
+    }
+
+
+SAFE_TX_INPUTS = [
+    ('address', 'to'),
+    ('uint256', 'value'),
+    ('bytes', 'data'),
+    ('uint8', 'operation'),
+    ('uint256', 'safeTxGas'),
+    ('uint256', 'baseGas'),
+    ('uint256', 'gasPrice'),
+    ('address', 'gasToken'),
+    ('address', 'refundReceiver')
+]
+# Safe v1.3.0 functions used by the simulation.
+SAFE_ABI = [
+    _function('getOwners', [], ['address[]']),
+    _function('getThreshold', [], ['uint256']),
+    _function('nonce', [], ['uint256']),
+    _function(
+        'getTransactionHash',
+        SAFE_TX_INPUTS + [('uint256', '_nonce')],
+        ['bytes32']
+    ),
+    _function(
+        'approveHash',
+        [('bytes32', 'hashToApprove')],
+        [],
+        'nonpayable'
+    ),
+    _function(
+        'execTransaction',
+        SAFE_TX_INPUTS + [('bytes', 'signatures')],
+        ['bool'],
+        'payable'
+    )
+]
+# Safe operations, the MultiSend payload is executed with a delegatecall.
+DELEGATECALL = 1
+TX_BUILDER_VERSION = '1.16.5'
+SIMULATION_BALANCE = 10**20
+
+
+def _encode_step(step, contract_obj):
+    """Encode a post upgrade step as a Safe transaction
+
+    Args:
+        step (Step): post upgrade step, must be a transaction
+        contract_obj (contract): upgraded proxy contract
+
+    Returns:
+        dict: to, value and data of the transaction
+    """
+    target = contract_obj
+    if step.contract is not None:
+        target = Contract.from_abi('', step.contract_addr, step.contract.abi)
+    func = target.get_method_object(target.signatures[step.func])
+    # Derived arguments are resolved against the pre-upgrade state.
+    step.args, res = resolve_args(step.args, target, None)
+    return {
+        'to': target.address,
+        'value': 0,
+        'data': func.encode_input(*res),
+        'description': f'{step.func}()'
+    }
+
+
+def get_upgrade_txs(config_name, config_data, new_impl):
+    """Get the Safe transactions for upgrading a proxy and its post
+    upgrade steps
+
+    Args:
+        config_name (str): name of the upgrade config
+        config_data (Upgrade_data): upgrade config
+        new_impl (address): address of the new implementation
+
+    Returns:
+        []dict: to, value, data and description of each transaction
+    """
+    conf = config_data.config
+    proxy_admin = Contract.from_abi(
+        'ProxyAdmin',
+        conf.proxy_admin,
+        ProxyAdmin.abi
+    )
+    func_name, args = get_upgrade_call(
+        proxy_admin,
+        conf.proxy_address,
+        new_impl
+    )
+    txs = [{
+        'to': proxy_admin.address,
+        'value': 0,
+        'data': getattr(proxy_admin, func_name).encode_input(*args),
+        'description': f'{config_name}: {func_name}()'
+    }]
+    deployed_contract = Contract.from_abi(
+        config_name,
+        conf.proxy_address,
+        config_data.contract.abi
+    )
+    for step in conf.post_upgrade_steps:
+        if type(step) is not Step or not step.transact:
+            print(f'Skipping non transaction step: {step.func}()')
+            continue
+        tx = _encode_step(step, deployed_contract)
+        tx['description'] = f'{config_name}: {tx["description"]}'
+        txs.append(tx)
+    return txs
+
+
+def encode_multisend(txs):
+    """Encode transactions as a MultiSendCallOnly call
+
+    Args:
+        txs ([]dict): transactions with to, value and data
+
+    Returns:
+        str: calldata for MultiSendCallOnly.multiSend
+    """
+    packed = b''
+    for tx in txs:
+        data = eth_utils.to_bytes(hexstr=tx['data'])
+        packed += (
+            b'\x00' +  # operation: call
+            eth_utils.to_bytes(hexstr=tx['to']) +
+            int(tx['value']).to_bytes(32, 'big') +
+            len(data).to_bytes(32, 'big') +
+            data
+        )
+    multisend = Contract.from_abi(
+        'MultiSendCallOnly',
+        MULTISEND_CALL_ONLY,
+        MULTISEND_ABI
+    )
+    return multisend.multiSend.encode_input(packed)
+
+
+def get_tx_builder_batch(name, safe, txs):
+    """Build a Safe Transaction Builder batch file
+
+    Args:
+        name (str): name of the batch
+        safe (address): address of the Safe executing the batch
+        txs ([]dict): transactions with to, value and data
+
+    Returns:
+        dict: batch in the Transaction Builder json format
+    """
+    return {
+        'version': '1.0',
+        'chainId': str(chain.id),
+        'createdAt': int(time.time() * 1000),
+        'meta': {
+            'name': name,
+            'description': '\n'.join(tx['description'] for tx in txs),
+            'txBuilderVersion': TX_BUILDER_VERSION,
+            'createdFromSafeAddress': safe,
+            'createdFromOwnerAddress': ''
+        },
+        'transactions': [
+            {
+                'to': tx['to'],
+                'value': str(tx['value']),
+                'data': tx['data'],
+                'contractMethod': None,
+                'contractInputsValues': None
+            }
+            for tx in txs
+        ]
+    }
+
+
+def _get_upgrade_checks(batch):
+    """Decode the proxy upgrades of a batch
+
+    Args:
+        batch (dict): Transaction Builder batch
+
+    Returns:
+        [(address, address)]: proxy and expected implementation
+    """
+    checks = []
+    for tx in batch['transactions']:
+        proxy_admin = Contract.from_abi('ProxyAdmin', tx['to'], ProxyAdmin.abi)
+        try:
+            func, args = proxy_admin.decode_input(tx['data'])
+        except ValueError:
+            continue
+        if func.startswith('upgrade'):
+            checks.append((args[0], args[1]))
+    return checks
+
+
+def _get_approved_signatures(owners):
+    """Pre-validated signatures of Safe owners
+
+    A signature with v = 1 is accepted for the owner in r when the owner is
+    the sender or has approved the Safe transaction hash.
+
+    Args:
+        owners ([]address): signing owners
+
+    Returns:
+        bytes: signatures sorted by owner, as required by the Safe
+    """
+    signatures = b''
+    for owner in sorted(owners, key=lambda owner: int(owner, 16)):
+        signatures += (
+            eth_utils.to_bytes(hexstr=owner).rjust(32, b'\x00') +
+            b'\x00' * 32 +
+            b'\x01'
+        )
+    return signatures
+
+
+def simulate_batch(batch, multisend_data=None):
+    """Execute a batch through its Safe on a local fork
+
+    The MultiSendCallOnly payload is executed by the Safe with a
+    delegatecall, exactly as signing the batch would, using approved hash
+    signatures of impersonated owners. The Safe reverts the whole batch
+    when one of its transactions fails, which is checked by comparing the
+    proxy implementations with the ones before the simulation. Everything is
+    reverted after the upgraded proxies have been checked.
+
+    Args:
+        batch (dict): Transaction Builder batch
+        multisend_data (str): MultiSendCallOnly calldata of the Upgrade
+            artifact, it has to match the batch
+
+    Returns:
+        bool: True if the batch and the checks passed
+    """
+    if not is_local_network():
+        print('Simulation is only supported on local networks and forks')
+        return False
+    data = encode_multisend(batch['transactions'])
+    if multisend_data is not None and multisend_data != data:
+        print('Upgrade artifact MultiSend data does not match the batch')
+        return False
+    safe_address = batch['meta']['createdFromSafeAddress']
+    if web3.eth.get_code(safe_address) == b'':
+        print(f'No Safe deployed at {safe_address}')
+        return False
+    safe = Contract.from_abi('Safe', safe_address, SAFE_ABI)
+    owners = safe.getOwners()[:safe.getThreshold()]
+    checks = _get_upgrade_checks(batch)
+    chain.snapshot()
+    success = True
+    try:
+        # Implementations the Safe must leave untouched on failure.
+        initial = {proxy: get_implementation(proxy) for proxy, _ in checks}
+        tx_args = [
+            MULTISEND_CALL_ONLY,
+            0,
+            data,
+            DELEGATECALL,
+            0,
+            0,
+            0,
+            ZERO_ADDRESS,
+            ZERO_ADDRESS
+        ]
+        tx_hash = safe.getTransactionHash(*tx_args, safe.nonce())
+        for owner in owners:
+            web3.provider.make_request(
+                'anvil_setBalance',
+                [owner, hex(SIMULATION_BALANCE)]
+            )
+            safe.approveHash(
+                tx_hash,
+                {'from': accounts.at(owner, force=True)}
+            )
+        try:
+            receipt = safe.execTransaction(
+                *tx_args,
+                _get_approved_signatures(owners),
+                {
+                    'from': accounts.at(owners[0], force=True),
+                    'gas_limit': GAS_LIMIT
+                }
+            )
+            print(f'Batch gas used: {receipt.gas_used}')
+        except VirtualMachineError as e:
+            print(f'Batch reverted: {e}')
+            success = False
+        for proxy, impl in checks:
+            current = get_implementation(proxy)
+            expected = impl if success else initial[proxy]
+            if current != expected:
+                print(
+                    f'Proxy {proxy} implementation is {current}, '
+                    f'expected {expected}'
+                )
+                success = False
+    finally:
+        chain.revert()
+    print('\nSimulation ' + ('passed' if success else 'failed'))
+    return success
+
+
+def get_safe(configs):
+    """Get the Safe owning the proxy admins of the upgrade configs
+
+    Returns:
+        address: owner of the proxy admins, None if they are not owned by
+            one account
+    """
+    safes = {
+        Contract.from_abi(
+            'ProxyAdmin',
+            config_data.config.proxy_admin,
+            ProxyAdmin.abi
+        ).owner()
+        for _, config_data in configs
+    }
+    if len(safes) != 1:
+        print(f'Proxy admins are owned by different accounts: {safes}')
+        return None
+    return safes.pop()
+
+
+def export_batch(configs, new_impls, tx_list=[]):
+    """Export the upgrades of already deployed implementations as one
+    Transaction Builder batch, simulated on local networks and forks
+
+    Args:
+        configs ([(str, Upgrade_data)]): names and data of the upgrade
+            configs
+        new_impls ({str: address}): new implementation by config name
+        tx_list ([]dict): info of the implementation deployments
+
+    Returns:
+        dict: Transaction Builder batch, None if the proxy admins are not
+            owned by one Safe
+    """
+    safe = get_safe(configs)
+    if safe is None:
+        return None
+
+    txs = []
+    for config_name, config_data in configs:
+        txs += get_upgrade_txs(
+            config_name,
+            config_data,
+            new_impls[config_name]
+        )
+    name = '_'.join(config_name for config_name, _ in configs)
+    batch = get_tx_builder_batch(name, safe, txs)
+    multisend_data = encode_multisend(txs)
+    print_dict('Printing Upgrade data', new_impls, 20)
+    save_deployment_artifacts(batch, name, 'SafeBatch')
+    save_deployment_artifacts(
+        {
+            'type': 'SafeBatchUpgrade',
+            'safe': safe,
+            'new_impls': new_impls,
+            'multisend': MULTISEND_CALL_ONLY,
+            'multisend_data': multisend_data,
+            'transactions': tx_list,
+            'config_names': [config_name for config_name, _ in configs],
+            'configs': [config_data.config for _, config_data in configs]
+        },
+        name,
+        'Upgrade'
+    )
+    if is_local_network():
+        simulate_batch(batch, multisend_data)
+    else:
+        print(
+            '\nSimulate the batch on a fork before sharing it with the '
+            'signers'
+        )
+    return batch
+
+
+def export_upgrades(configuration, deployer):
+    """Deploy new implementations for the selected upgrade configs and
+    export all the upgrades as one Transaction Builder batch
+
+    Args:
+        configuration ({}): upgrade configurations
+        deployer (address): address of the deployer
+    """
+    configs = get_configs('Select configs for upgrade', configuration)
+    for config_name, config_data in configs:
+        if type(config_data) is not Upgrade_data:
+            print(f'Incorrect configuration data: {config_name}')
+            return
+        if not config_data.config.gnosis_upgrade:
+            print(
+                f'{config_name} is not a gnosis upgrade, upgrade it with '
+                'scripts/deploy_and_upgrade.py'
+            )
+            return
+        print(
+            json.dumps(config_data.config, default=lambda o: o.__dict__,
+                       indent=2)
+        )
+    confirm('Are the above configurations correct?')
+    if get_safe(configs) is None:
+        return
+
+    tx_list = []
+    new_impls = {}
+    for config_name, config_data in configs:
+        print(f'\nDeploying new implementation contract for {config_name}')
+        new_impl = config_data.contract.deploy(
+            {'from': deployer, 'gas_limit': GAS_LIMIT}
+        )
+        tx_list.append(
+            get_tx_info('New_implementation_deployment', new_impl.tx)
+        )
+        new_impls[config_name] = new_impl.address
+    export_batch(configs, new_impls, tx_list)
+
+
+def simulate_batch_file():
+    file = input('Safe batch file: ')
+    with open(file) as batch_file:
+        batch = json.load(batch_file)
+    upgrade = get_latest_artifact(batch['meta']['name'], 'Upgrade')
+    if upgrade is None:
+        print('No Upgrade artifact found, simulating the batch file only')
+    simulate_batch(batch, upgrade['multisend_data'] if upgrade else None)
+
+
+def main():
+    menu = '\nPlease select one of the following options: \n \
+    1. Export upgrades as Safe batch \n \
+    2. Simulate Safe batch \n \
+    3. Exit \n \
+    -> '
+    while True:
+        choice = input(menu)
+        if choice == '1':
+            export_upgrades(upgrade_config, get_user('Deployer account: '))
+        elif choice == '2':
+            simulate_batch_file()
+        elif choice == '3':
+            break
+        else:
+            print('Please select a valid option')
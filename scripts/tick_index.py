@@ -0,0 +1,342 @@
+"""In-memory index of the tick ranges of E721 (UniV3/CamelotV3) deposits.
+
+Positions are grouped by width class (2**k <= upper - lower < 2**(k+1))
+and kept sorted by lower tick in each class. A position of class k can
+only contain tick t if its lower tick is in (t - 2**(k+1), t], so point
+and range lookups bisect one slice per class and only scan candidates
+which are at least half likely to match.
+
+Liquidity aggregates use two Fenwick trees keyed by tick (sum of liquidity
+by lower tick and by upper tick), so the liquidity overlapping any tick
+range is answered in O(log(ticks)) independent of the number of positions.
+
+Tick semantics follow the pools: a position is in range at tick t when
+lower <= t < upper.
+
+The index itself does not depend on brownie, only the chain readers import
+it.
+"""
+import bisect
+
+MIN_TICK = -887272
+MAX_TICK = 887272
+MAX_DEPOSIT_ID = 2**256
+
+
+def _positions_abi(outputs):
+    return [{
+        'inputs': [
+            {'internalType': 'uint256', 'name': 'tokenId', 'type': 'uint256'}
+        ],
+        'name': 'positions',
+        'outputs': [
+            {'internalType': _type, 'name': name, 'type': _type}
+            for name, _type in outputs
+        ],
+        'stateMutability': 'view',
+        'type': 'function'
+    }]
+
+
+UNIV3_NFPM_ABI = _positions_abi([
+    ('nonce', 'uint96'), ('operator', 'address'), ('token0', 'address'),
+    ('token1', 'address'), ('fee', 'uint24'), ('tickLower', 'int24'),
+    ('tickUpper', 'int24'), ('liquidity', 'uint128'),
+    ('feeGrowthInside0LastX128', 'uint256'),
+    ('feeGrowthInside1LastX128', 'uint256'),
+    ('tokensOwed0', 'uint128'), ('tokensOwed1', 'uint128')
+])
+CAMELOTV3_NFPM_ABI = _positions_abi([
+    ('nonce', 'uint96'), ('operator', 'address'), ('token0', 'address'),
+    ('token1', 'address'), ('tickLower', 'int24'), ('tickUpper', 'int24'),
+    ('liquidity', 'uint128'), ('feeGrowthInside0LastX128', 'uint256'),
+    ('feeGrowthInside1LastX128', 'uint256'),
+    ('tokensOwed0', 'uint128'), ('tokensOwed1', 'uint128')
+])
+# farm type: (nfpm abi, index of tickLower in positions())
+FARM_TYPES = {
+    'UniV3Farm': (UNIV3_NFPM_ABI, 5),
+    'CamelotV3Farm': (CAMELOTV3_NFPM_ABI, 4)
+}
+
+
+class Fenwick_tree():
+    """Sparse Fenwick tree over ticks for prefix sums of liquidity"""
+
+    def __init__(self):
+        self.size = MAX_TICK - MIN_TICK + 1
+        self.tree = {}
+
+    def build(self, values):
+        """Build the tree of an empty Fenwick tree in a single pass
+
+        A node only adds up to its parent, which has a larger lowest set
+        bit, so nodes are processed by level of their lowest set bit.
+
+        Args:
+            values ({int: int}): value of each tick
+        """
+        levels = [{} for _ in range(self.size.bit_length())]
+        for tick, value in values.items():
+            i = tick - MIN_TICK + 1
+            level = levels[(i & -i).bit_length() - 1]
+            level[i] = level.get(i, 0) + value
+        for level in levels:
+            for i, value in level.items():
+                self.tree[i] = value
+                parent = i + (i & -i)
+                if parent <= self.size:
+                    parent_level = levels[(parent & -parent).bit_length() - 1]
+                    parent_level[parent] = parent_level.get(parent, 0) + value
+
+    def add(self, tick, value):
+        i = tick - MIN_TICK + 1
+        while i <= self.size:
+            self.tree[i] = self.tree.get(i, 0) + value
+            i += i & -i
+
+    def prefix_sum(self, tick):
+        """Sum of the values at ticks <= tick"""
+        i = min(tick, MAX_TICK) - MIN_TICK + 1
+        res = 0
+        while i > 0:
+            res += self.tree.get(i, 0)
+            i -= i & -i
+        return res
+
+
+class Tick_index():
+    def __init__(self):
+        self.positions = {}
+        self.classes = {}
+        self.by_lower = Fenwick_tree()
+        self.by_upper = Fenwick_tree()
+        self.total_liquidity = 0
+
+    def __len__(self):
+        return len(self.positions)
+
+    def load(self, positions):
+        """Add many positions at once
+
+        An empty index is bulk loaded: each width class is sorted once and
+        the Fenwick trees are built in a single pass. Positions are added
+        one by one to a non empty index.
+
+        Args:
+            positions ([(int, int, int, int)]): deposit id, lower tick,
+                upper tick and liquidity of each position
+        """
+        if self.positions:
+            for position in positions:
+                self.add(*position)
+            return
+        for deposit_id, tick_lower, tick_upper, liquidity in positions:
+            self.positions[deposit_id] = [tick_lower, tick_upper, liquidity]
+        by_lower = {}
+        by_upper = {}
+        for deposit_id, position in self.positions.items():
+            tick_lower, tick_upper, liquidity = position
+            k = (tick_upper - tick_lower).bit_length() - 1
+            self.classes.setdefault(k, []).append((tick_lower, deposit_id))
+            by_lower[tick_lower] = by_lower.get(tick_lower, 0) + liquidity
+            by_upper[tick_upper] = by_upper.get(tick_upper, 0) + liquidity
+            self.total_liquidity += liquidity
+        for lowers in self.classes.values():
+            lowers.sort()
+        self.by_lower.build(by_lower)
+        self.by_upper.build(by_upper)
+
+    def add(self, deposit_id, tick_lower, tick_upper, liquidity):
+        """Add a single position, for incremental updates"""
+        if deposit_id in self.positions:
+            self.remove(deposit_id)
+        k = (tick_upper - tick_lower).bit_length() - 1
+        bisect.insort(
+            self.classes.setdefault(k, []),
+            (tick_lower, deposit_id)
+        )
+        self.positions[deposit_id] = [tick_lower, tick_upper, liquidity]
+        self._add_liquidity(tick_lower, tick_upper, liquidity)
+
+    def remove(self, deposit_id):
+        tick_lower, tick_upper, liquidity = self.positions.pop(deposit_id)
+        k = (tick_upper - tick_lower).bit_length() - 1
+        lowers = self.classes[k]
+        del lowers[bisect.bisect_left(lowers, (tick_lower, deposit_id))]
+        self._add_liquidity(tick_lower, tick_upper, -liquidity)
+
+    def update_liquidity(self, deposit_id, delta):
+        """Apply a liquidity change of an increase/decrease deposit"""
+        position = self.positions[deposit_id]
+        position[2] += delta
+        self._add_liquidity(position[0], position[1], delta)
+
+    def _add_liquidity(self, tick_lower, tick_upper, delta):
+        self.by_lower.add(tick_lower, delta)
+        self.by_upper.add(tick_upper, delta)
+        self.total_liquidity += delta
+
+    def _candidates(self, tick_a, tick_b):
+        """Deposits of which the lower tick allows an overlap with
+        [tick_a, tick_b], per width class"""
+        for k, lowers in self.classes.items():
+            start = bisect.bisect_right(
+                lowers,
+                (tick_a - 2**(k + 1), MAX_DEPOSIT_ID)
+            )
+            end = bisect.bisect_right(lowers, (tick_b, MAX_DEPOSIT_ID))
+            for i in range(start, end):
+                yield lowers[i][1]
+
+    def deposits_in_range(self, tick_a, tick_b=None):
+        """Get the deposits earning pool fees at any tick of [tick_a, tick_b]
+
+        Args:
+            tick_a (int): first tick
+            tick_b (int): last tick, tick_a if None
+
+        Returns:
+            []int: deposit ids
+        """
+        if tick_b is None:
+            tick_b = tick_a
+        return [
+            deposit_id for deposit_id in self._candidates(tick_a, tick_b)
+            if self.positions[deposit_id][1] > tick_a
+        ]
+
+    def liquidity_in_range(self, tick_a, tick_b=None):
+        """Get the liquidity of the deposits in range at any tick of
+        [tick_a, tick_b]
+
+        Args:
+            tick_a (int): first tick
+            tick_b (int): last tick, tick_a if None
+
+        Returns:
+            int: sum of the liquidity of the deposits
+        """
+        if tick_b is None:
+            tick_b = tick_a
+        # Positions starting at or before tick_b minus the ones ending at or
+        # before tick_a (which also start before tick_b as lower < upper).
+        return (
+            self.by_lower.prefix_sum(tick_b) -
+            self.by_upper.prefix_sum(tick_a)
+        )
+
+    def liquidity_around(self, tick, num_ticks):
+        """Get the liquidity within +-num_ticks of a tick"""
+        return self.liquidity_in_range(tick - num_ticks, tick + num_ticks)
+
+
+def _get_contracts(farm_address, farm_type):
+    from brownie import (
+        CamelotV3Farm,
+        Contract,
+        UniV3Farm
+    )
+    farm_contract = {
+        'UniV3Farm': UniV3Farm,
+        'CamelotV3Farm': CamelotV3Farm
+    }[farm_type]
+    nfpm_abi, tick_id = FARM_TYPES[farm_type]
+    farm = Contract.from_abi(farm_type, farm_address, farm_contract.abi)
+    nfpm = Contract.from_abi('NFPM', farm.nftContract(), nfpm_abi)
+    return farm, nfpm, tick_id
+
+
+def _load_deposits(index, farm, nfpm, tick_id, deposit_ids, block):
+    """Read deposits and their position ticks in batched calls and add
+    them to the index"""
+    from .utils import (
+        ZERO_ADDRESS,
+        batch_call
+    )
+    deposit_ids = list(deposit_ids)
+    data = batch_call(
+        [(farm, 'getDepositInfo', [id_]) for id_ in deposit_ids] +
+        [(farm, 'depositToTokenId', [id_]) for id_ in deposit_ids],
+        block
+    )
+    deposits = []
+    for i, deposit_id in enumerate(deposit_ids):
+        deposit = data[i]
+        if deposit is None or deposit[0] == ZERO_ADDRESS:
+            continue
+        deposits.append((deposit_id, deposit[1], data[len(deposit_ids) + i]))
+    positions = batch_call(
+        [(nfpm, 'positions', [token_id]) for _, _, token_id in deposits],
+        block
+    )
+    index.load([
+        (deposit_id, position[tick_id], position[tick_id + 1], liquidity)
+        for (deposit_id, liquidity, _), position in zip(deposits, positions)
+    ])
+
+
+def build_tick_index(farm_address, farm_type, block):
+    """Build the tick index of all the active deposits of a farm
+
+    Args:
+        farm_address (address): address of the farm
+        farm_type (str): key of FARM_TYPES
+        block (int): block number to read the deposits at
+
+    Returns:
+        Tick_index: index of the farm's deposits
+    """
+    farm, nfpm, tick_id = _get_contracts(farm_address, farm_type)
+    index = Tick_index()
+    total_deposits = farm.totalDeposits(block_identifier=block)
+    _load_deposits(
+        index,
+        farm,
+        nfpm,
+        tick_id,
+        range(1, total_deposits + 1),
+        block
+    )
+    return index
+
+
+def update_tick_index(index, farm_address, farm_type, from_block, to_block):
+    """Apply the deposit events of a block range to the index
+
+    Args:
+        index (Tick_index): index built up to from_block - 1
+        farm_address (address): address of the farm
+        farm_type (str): key of FARM_TYPES
+        from_block (int): first block of the range
+        to_block (int): last block of the range
+    """
+    farm, nfpm, tick_id = _get_contracts(farm_address, farm_type)
+    sequence = farm.events.get_sequence(from_block, to_block)
+    events = sorted(
+        [
+            event for name in [
+                'Deposited',
+                'DepositWithdrawn',
+                'DepositIncreased',
+                'DepositDecreased'
+            ]
+            for event in sequence.get(name, [])
+        ],
+        key=lambda e: (e.blockNumber, e.logIndex)
+    )
+    new_deposits = set()
+    for event in events:
+        deposit_id = event.args['depositId']
+        if event.event == 'Deposited':
+            new_deposits.add(deposit_id)
+        elif event.event == 'DepositWithdrawn':
+            new_deposits.discard(deposit_id)
+            if deposit_id in index.positions:
+                index.remove(deposit_id)
+        elif deposit_id not in new_deposits:
+            sign = 1 if event.event == 'DepositIncreased' else -1
+            index.update_liquidity(deposit_id, sign * event.args['liquidity'])
+    # New deposits are read at to_block, so their later increases and
+    # decreases are already included.
+    _load_deposits(index, farm, nfpm, tick_id, new_deposits, to_block)
@@ -1,13 +1,35 @@
 from brownie import (
+    Contract,
+    FarmRegistry,
+    UniV3Farm,
     network,
-    accounts
+    accounts,
+    multicall,
+    web3
 )
 import click
+import glob
+import requests
 import sys
 import time
 import json
 import os
 
+MULTICALL_BATCH_SIZE = 500
+MAX_PENDING_TXS = 50
+ZERO_ADDRESS = '0x0000000000000000000000000000000000000000'
+ONE_DAY = 86400
+COMMON_FUND_ID = 0
+LOCKUP_FUND_ID = 1
+# ERC1967 implementation slot: bytes32(uint256(keccak256('eip1967.proxy.implementation')) - 1)
+IMPLEMENTATION_SLOT = (
+    '0x360894a13ba1a3210667c828492db98dca3e2076cc3735a920a3ca505d382bbc'
+)
+# ERC1967 admin slot: bytes32(uint256(keccak256('eip1967.proxy.admin')) - 1)
+ADMIN_SLOT = (
+    '0xb53127684a568b3173ae13b9f8a6016e243e63b6e8ee1178d6a717850b5d6103'
+)
+
 
 def signal_handler(signal, frame):
     sys.exit(0)
@@ -52,6 +74,26 @@ def get_config(msg: str, constants):
     )
 
 
+def get_configs(msg: str, constants):
+    """Select several configs at once
+
+    Returns:
+        [(str, config)]: names and data of the selected configs
+    """
+    configs = list(constants.keys())
+    menu = f'\n{msg} (comma separated): \n'
+    for i, k in enumerate(configs):
+        menu += str(i) + '. ' + k + '\n'
+    menu += '-> '
+    config_ids = [int(i) for i in input(menu).split(',') if i.strip()]
+    selected = [configs[i] for i in config_ids]
+    print()
+    print('-'*60, f'\nConfigs selected: {", ".join(selected)}')
+    print('-'*60)
+
+    return [(name, constants[name]) for name in selected]
+
+
 def confirm(msg):
     """
     Prompts the user to confirm an action.
@@ -94,6 +136,18 @@ def onlyDevelopment(func):
         func()  # can also just return t/f
 
 
+def is_local_network():
+    """Check if the active network is a local chain or a fork
+    on which accounts can be impersonated
+
+    Returns:
+        bool: True for development networks and forks
+    """
+    active = network.show_active()
+    return active in ['development', 'anvil', 'hardhat'] or \
+        active.endswith(('-fork', '-fork-server'))
+
+
 def print_dict(msg, data, col=40):
     print('-'*70, f'\n{msg}:')
     print('-'*70)
@@ -115,6 +169,122 @@ def save_deployment_artifacts(data, name, operation_type=''):
     with open(file, 'w') as json_file:
         json.dump(data, json_file, default=lambda o: o.__dict__, indent=4)
     print(f'Artifacts stored at: {file}')
+    return file
+
+
+def get_latest_artifact(name, operation_type=''):
+    """Load the latest deployment artifact of a config
+
+    Args:
+        name (str): config name
+        operation_type (str): operation type of the artifact
+
+    Returns:
+        dict: artifact data, None if not found
+    """
+    path = os.path.join('deployed', network.show_active())
+    prefix = operation_type + '_' + name + '_'
+    latest = None
+    for file in glob.glob(os.path.join(path, glob.escape(prefix) + '*.json')):
+        try:
+            timestamp = time.strptime(
+                os.path.basename(file)[len(prefix):-len('.json')],
+                '%m-%d-%Y_%H-%M-%S'
+            )
+        except ValueError:
+            # Artifact of another config sharing the prefix.
+            continue
+        if latest is None or timestamp > latest[0]:
+            latest = (timestamp, file)
+    if latest is None:
+        return None
+    with open(latest[1]) as json_file:
+        return json.load(json_file)
+
+
+def _to_json(o):
+    if isinstance(o, bytes):
+        return '0x' + o.hex()
+    return o.__dict__
+
+
+def normalize(value):
+    """Normalize a config or call value for comparisons: lists for tuples,
+    integers for floats and lower case strings (addresses, hex values)"""
+    if isinstance(value, (list, tuple)):
+        return [normalize(v) for v in value]
+    if isinstance(value, float):
+        return int(value)
+    if isinstance(value, str):
+        return value.lower()
+    return value
+
+
+class Deployment_journal():
+    """Write-ahead journal of the sub-operations of a deployment
+
+    Entries are appended as json lines and fsynced before the next
+    sub-operation starts, so a crashed run can be resumed from the first
+    incomplete sub-operation.
+    """
+
+    def __init__(self, name):
+        path = os.path.join('deployed', network.show_active())
+        os.makedirs(path, exist_ok=True)
+        self.path = os.path.join(path, 'Journal_' + name + '.jsonl')
+        self.entries = []
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as journal_file:
+            lines = journal_file.read().splitlines()
+        for line in lines:
+            try:
+                self.entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Torn write of the last entry.
+                break
+        if len(self.entries) != len(lines):
+            self.truncate(len(self.entries))
+
+    def append(self, entry):
+        line = json.dumps(entry, default=_to_json)
+        with open(self.path, 'a') as journal_file:
+            journal_file.write(line + '\n')
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        self.entries.append(json.loads(line))
+
+    def truncate(self, num_entries):
+        """Drop the entries after the first num_entries"""
+        self.entries = self.entries[:num_entries]
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as journal_file:
+            for entry in self.entries:
+                journal_file.write(json.dumps(entry) + '\n')
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        os.replace(tmp_path, self.path)
+
+    def get_done(self, key):
+        """Get the completion entry of a sub-operation, None if not done"""
+        for entry in self.entries:
+            if entry['step'] == key and entry['state'] == 'done':
+                return entry
+        return None
+
+    def archive(self):
+        """Move the journal out of the way to start a new deployment"""
+        if os.path.exists(self.path):
+            os.replace(
+                self.path,
+                self.path + time.strftime('.%m-%d-%Y_%H-%M-%S')
+            )
+        self.entries = []
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.entries = []
 
 
 def get_user(msg):
@@ -128,3 +298,132 @@ def get_user(msg):
     deployer = accounts.load(click.prompt(msg, type=click.Choice(accounts.load())))
     print(f"{msg}{deployer.address}\n")
     return deployer
+
+
+def batch_call(calls, block_identifier=None):
+    """Run view calls through batched multicalls
+
+    Args:
+        calls ([(contract, str, [])]): contract, function name and args
+        block_identifier (int): block to run the calls at, latest if None
+
+    Returns:
+        []: results in the order of calls, None for reverted calls
+    """
+    results = []
+    for i in range(0, len(calls), MULTICALL_BATCH_SIZE):
+        with multicall(block_identifier=block_identifier):
+            batch = [
+                getattr(contract_obj, func_name)(*args)
+                for contract_obj, func_name, args
+                in calls[i:i + MULTICALL_BATCH_SIZE]
+            ]
+        results += [res.__wrapped__ for res in batch]
+    return results
+
+
+def get_farms(farm_registry, block=None):
+    """Load all the farms registered in the farm registry
+
+    Args:
+        farm_registry (address): address of the FarmRegistry
+        block (int): block number to read the farm list at, latest if None
+
+    Returns:
+        []contract: farm contracts
+    """
+    registry = Contract.from_abi(
+        'FarmRegistry',
+        farm_registry,
+        FarmRegistry.abi
+    )
+    # UniV3Farm abi covers the common Farm and ExpirableFarm functions.
+    return [
+        Contract.from_abi('Farm', farm, UniV3Farm.abi)
+        for farm in registry.getFarmList(block_identifier=block)
+    ]
+
+
+def rpc(method, params):
+    """Send a JSON-RPC request to the active network
+
+    Args:
+        method (str): JSON-RPC method
+        params ([]): params of the request
+
+    Returns:
+        result of the request, raises RuntimeError on error
+    """
+    res = web3.provider.make_request(method, params)
+    if 'error' in res:
+        raise RuntimeError(f'{method} failed: {res["error"]}')
+    return res.get('result')
+
+
+def batch_rpc(method, params_list):
+    """Send the same JSON-RPC method with several params in batch requests
+
+    Providers without an http endpoint get one request per params.
+
+    Args:
+        method (str): JSON-RPC method
+        params_list ([][]): params of each request
+
+    Returns:
+        []: results in the order of params_list, None for failed requests
+    """
+    uri = getattr(web3.provider, 'endpoint_uri', None)
+    if uri is None or not str(uri).startswith('http'):
+        return [
+            web3.provider.make_request(method, params).get('result')
+            for params in params_list
+        ]
+    results = []
+    for i in range(0, len(params_list), MULTICALL_BATCH_SIZE):
+        payload = [
+            {'jsonrpc': '2.0', 'id': j, 'method': method, 'params': params}
+            for j, params in enumerate(params_list[i:i + MULTICALL_BATCH_SIZE])
+        ]
+        res = requests.post(str(uri), json=payload).json()
+        # Nodes without batch support answer with a single error object.
+        if not isinstance(res, list):
+            res = []
+        by_id = {entry.get('id'): entry.get('result') for entry in res}
+        results += [by_id.get(j) for j in range(len(payload))]
+    return results
+
+
+def send_pipelined(txs, tx_params, max_pending=MAX_PENDING_TXS):
+    """Send transactions without waiting for each one to be mined
+
+    Transactions are sent in order from the same account so the nonce
+    ordering preserves their dependencies (e.g. approve before transfer).
+
+    Args:
+        txs ([(str, contract, str, [])]): step name, contract,
+            function name and args of each transaction
+        tx_params (dict): brownie transaction params, gas_limit is required
+            as gas can not be estimated for dependent transactions
+        max_pending (int): maximum number of unconfirmed transactions
+
+    Returns:
+        [(str, TransactionReceipt)]: step name and receipt of each tx
+    """
+    params = dict(tx_params, required_confs=0)
+    pending = []
+    receipts = []
+    for name, contract_obj, func_name, args in txs:
+        print(f'Sending: {func_name}() -> {contract_obj.address}')
+        tx = getattr(contract_obj, func_name)(*args, params)
+        pending.append((name, tx))
+        if len(pending) >= max_pending:
+            name, tx = pending.pop(0)
+            tx.wait(1)
+            receipts.append((name, tx))
+    for name, tx in pending:
+        tx.wait(1)
+        receipts.append((name, tx))
+    for name, tx in receipts:
+        if tx.status == 0:
+            print(f'Transaction reverted: {name} {tx.txid}')
+    return receipts
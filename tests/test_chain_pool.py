@@ -0,0 +1,117 @@
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer
+)
+from scripts import chain_pool
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+NUM_LESSEES = 8
+STALE_CHECK_DELAY = 0.05
+
+
+class Rpc_handler(BaseHTTPRequestHandler):
+    """Minimal evm_snapshot/evm_revert endpoint counting the reverts"""
+
+    def do_POST(self):
+        req = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server = self.server
+        with server.lock:
+            if req['method'] == 'evm_snapshot':
+                server.snapshots += 1
+                result = hex(server.snapshots)
+            else:
+                if req['method'] == 'evm_revert':
+                    server.reverts += 1
+                result = True
+        body = json.dumps({'jsonrpc': '2.0', 'id': 1, 'result': result})
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def rpc_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Rpc_handler)
+    server.lock = threading.Lock()
+    server.snapshots = 0
+    server.reverts = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+
+
+def _get_dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def _lessee(state_dir, start, done, results):
+    # Widen the window between the stale check and the takeover.
+    is_alive = chain_pool._is_alive
+
+    def slow_is_alive(pid):
+        time.sleep(STALE_CHECK_DELAY)
+        return is_alive(pid)
+
+    chain_pool._is_alive = slow_is_alive
+    start.wait()
+    try:
+        lease = chain_pool.acquire(state_dir, timeout=1)
+        results.put(lease.port)
+    except TimeoutError:
+        results.put(None)
+    # The lease has to outlive the race, a dead lessee is stale again.
+    done.wait()
+
+
+def test_stale_lock_taken_over_once(tmp_path, rpc_server):
+    state_dir = str(tmp_path)
+    pool_dir = os.path.join(state_dir, 'pool')
+    os.makedirs(pool_dir)
+    port = 1
+    rpc_url = f'http://127.0.0.1:{rpc_server.server_port}'
+    with open(os.path.join(state_dir, 'manifest.json'), 'w') as manifest:
+        json.dump({'addresses': {}}, manifest)
+    chain_pool._write_json(
+        os.path.join(pool_dir, 'pool.json'),
+        {'pid': os.getpid(), 'ports': [port]}
+    )
+    chain_pool._snapshot(state_dir, port, rpc_url)
+    chain_pool._write_json(
+        chain_pool._get_lock_path(state_dir, port),
+        _get_dead_pid()
+    )
+
+    ctx = multiprocessing.get_context('fork')
+    start = ctx.Event()
+    done = ctx.Event()
+    results = ctx.Queue()
+    lessees = [
+        ctx.Process(target=_lessee, args=(state_dir, start, done, results))
+        for _ in range(NUM_LESSEES)
+    ]
+    for lessee in lessees:
+        lessee.start()
+    start.set()
+    leases = [results.get(timeout=30) for _ in lessees]
+    done.set()
+    for lessee in lessees:
+        lessee.join()
+
+    assert leases.count(port) == 1
+    assert leases.count(None) == NUM_LESSEES - 1
+    # The stale chain is recycled once, by the lessee taking it over.
+    assert rpc_server.reverts == 1
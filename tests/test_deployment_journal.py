@@ -0,0 +1,212 @@
+from types import SimpleNamespace
+import eth_utils
+import json
+
+import pytest
+
+deploy_and_upgrade = pytest.importorskip(
+    'scripts.deploy_and_upgrade',
+    reason='needs the brownie project'
+)
+from scripts.utils import Deployment_journal  # noqa: E402
+
+DEPLOYER = '0x6ac7ea33f8831ea9dcc53393aaa88b25a785dbf0'
+HEADER = {'step': 'Journal_header', 'state': 'done', 'deployer': DEPLOYER}
+IMPL = '0x0000000000000000000000000000000000001111'
+
+
+class Fake_eth():
+    """Chain state of the journaled transactions"""
+
+    def __init__(self, receipts, code):
+        self.receipts = receipts
+        self.code = code
+
+    def get_transaction_receipt(self, tx_hash):
+        return self.receipts.get(tx_hash)
+
+    def get_code(self, address):
+        return self.code.get(eth_utils.to_checksum_address(address), b'')
+
+
+@pytest.fixture
+def journal(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    journal = Deployment_journal('Test')
+    journal.append(HEADER)
+    return journal
+
+
+def _chain(monkeypatch, receipts={}, code={}):
+    monkeypatch.setattr(
+        deploy_and_upgrade,
+        'web3',
+        SimpleNamespace(
+            eth=Fake_eth(receipts, code),
+            keccak=eth_utils.keccak
+        )
+    )
+
+
+def _started(step, nonce, deploy):
+    return {'step': step, 'state': 'started', 'nonce': nonce, 'deploy': deploy}
+
+
+def _done(step, tx_hash, address=None):
+    return {
+        'step': step,
+        'state': 'done',
+        'tx_hash': tx_hash,
+        'address': address,
+        'value': None,
+        'tx_info': {'step': step, 'tx_hash': tx_hash}
+    }
+
+
+def _steps(journal):
+    return [(entry['step'], entry['state']) for entry in journal.entries]
+
+
+def test_create_address(monkeypatch):
+    _chain(monkeypatch)
+    assert deploy_and_upgrade._get_create_address(DEPLOYER, 0) == \
+        eth_utils.to_checksum_address(
+            '0xcd234a471b72ba2f1ccf0a70fcaba648a5eecd8d'
+        )
+
+
+def test_torn_last_entry_is_dropped(journal):
+    journal.append(_started('Implementation_deployment', 0, True))
+    with open(journal.path, 'a') as journal_file:
+        journal_file.write('{"step": "Implementation_depl')
+    reloaded = Deployment_journal('Test')
+    assert _steps(reloaded) == [
+        ('Journal_header', 'done'),
+        ('Implementation_deployment', 'started')
+    ]
+    with open(reloaded.path) as journal_file:
+        lines = journal_file.read().splitlines()
+    assert [json.loads(line) for line in lines] == reloaded.entries
+
+
+def test_run_journaled_reuses_done_steps(journal, monkeypatch):
+    monkeypatch.setattr(
+        deploy_and_upgrade,
+        'get_tx_info',
+        lambda name, tx: {'step': name, 'tx_hash': tx.txid}
+    )
+    deployer = SimpleNamespace(address=DEPLOYER, nonce=5)
+    sent = []
+
+    def func():
+        sent.append(1)
+        return SimpleNamespace(txid='0xaa'), IMPL, 7
+
+    tx_list = []
+    res = deploy_and_upgrade._run_journaled(
+        journal, 'Impl', 'Impl_tx', deployer, True, func, tx_list
+    )
+    assert res == (IMPL, 7)
+    assert journal.entries[1] == _started('Impl', 5, True)
+    assert journal.entries[2]['tx_hash'] == '0xaa'
+
+    resumed = Deployment_journal('Test')
+    tx_list = []
+    res = deploy_and_upgrade._run_journaled(
+        resumed, 'Impl', 'Impl_tx', deployer, True, func, tx_list
+    )
+    assert res == (IMPL, 7)
+    assert len(sent) == 1
+    assert tx_list == [{'step': 'Impl_tx', 'tx_hash': '0xaa'}]
+
+
+def test_verify_keeps_confirmed_steps(journal, monkeypatch):
+    journal.append(_started('Impl', 0, True))
+    journal.append(_done('Impl', '0x01', IMPL))
+    journal.append(_started('Call', 1, False))
+    journal.append(_done('Call', '0x02'))
+    _chain(
+        monkeypatch,
+        {'0x01': SimpleNamespace(status=1), '0x02': SimpleNamespace(status=1)},
+        {eth_utils.to_checksum_address(IMPL): b'\x01'}
+    )
+    deploy_and_upgrade.verify_journal(
+        journal,
+        SimpleNamespace(address=DEPLOYER, nonce=2)
+    )
+    assert len(journal.entries) == 5
+
+
+def test_verify_drops_from_the_first_unconfirmed_step(journal, monkeypatch):
+    journal.append(_started('Impl', 0, True))
+    journal.append(_done('Impl', '0x01', IMPL))
+    journal.append(_started('Call', 1, False))
+    journal.append(_done('Call', '0x02'))
+    # The call was reorged out, the implementation is still deployed.
+    _chain(
+        monkeypatch,
+        {'0x01': SimpleNamespace(status=1)},
+        {eth_utils.to_checksum_address(IMPL): b'\x01'}
+    )
+    deploy_and_upgrade.verify_journal(
+        journal,
+        SimpleNamespace(address=DEPLOYER, nonce=2)
+    )
+    assert _steps(journal) == [
+        ('Journal_header', 'done'),
+        ('Impl', 'started'),
+        ('Impl', 'done')
+    ]
+    assert _steps(Deployment_journal('Test')) == _steps(journal)
+
+
+def test_verify_recovers_a_mined_deployment(journal, monkeypatch):
+    journal.append(_started('Impl', 0, True))
+    _chain(monkeypatch)
+    address = deploy_and_upgrade._get_create_address(DEPLOYER, 0)
+    _chain(monkeypatch, code={address: b'\x01'})
+    deploy_and_upgrade.verify_journal(
+        journal,
+        SimpleNamespace(address=DEPLOYER, nonce=1)
+    )
+    # The started entry is replaced by the recovered completion.
+    assert _steps(journal) == [
+        ('Journal_header', 'done'),
+        ('Impl', 'done')
+    ]
+    assert journal.get_done('Impl')['address'] == address
+
+
+def test_verify_drops_a_reverted_deployment(journal, monkeypatch):
+    journal.append(_started('Impl', 0, True))
+    _chain(monkeypatch)
+    deploy_and_upgrade.verify_journal(
+        journal,
+        SimpleNamespace(address=DEPLOYER, nonce=1)
+    )
+    assert _steps(journal) == [('Journal_header', 'done')]
+
+
+def test_verify_drops_an_unmined_step(journal, monkeypatch):
+    journal.append(_started('Impl', 3, True))
+    _chain(monkeypatch)
+    deploy_and_upgrade.verify_journal(
+        journal,
+        SimpleNamespace(address=DEPLOYER, nonce=3)
+    )
+    assert _steps(journal) == [('Journal_header', 'done')]
+
+
+@pytest.mark.parametrize('answer, recovered', [('y', True), ('n', False)])
+def test_verify_asks_for_a_mined_call(journal, monkeypatch, answer,
+                                      recovered):
+    journal.append(_started('Call', 0, False))
+    _chain(monkeypatch)
+    monkeypatch.setattr(deploy_and_upgrade, '_getYorN', lambda msg: answer)
+    deploy_and_upgrade.verify_journal(
+        journal,
+        SimpleNamespace(address=DEPLOYER, nonce=1)
+    )
+    assert (journal.get_done('Call') is not None) == recovered
+    assert len(journal.entries) == (2 if recovered else 1)
+    assert _steps(Deployment_journal('Test')) == _steps(journal)
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+exit_forecast = pytest.importorskip(
+    'scripts.exit_forecast',
+    reason='needs the brownie project'
+)
+
+ONE_DAY = exit_forecast.ONE_DAY
+NOW = 1700000000
+
+
+def _curves(deposits, num_farms, horizon, cooldown_rate):
+    return exit_forecast.get_exit_curves(
+        exit_forecast.Deposit_arrays(*zip(*deposits)),
+        num_farms,
+        NOW,
+        horizon,
+        cooldown_rate
+    )
+
+
+def _brute_force(deposits, num_farms, horizon, cooldown_rate):
+    initiations = np.zeros((num_farms, horizon))
+    unlocks = np.zeros((num_farms, horizon))
+    for farm_id, liquidity, expiry_date, cooldown_period in deposits:
+        if cooldown_period == 0:
+            if expiry_date <= NOW:
+                continue
+            day = -(-(expiry_date - NOW) // ONE_DAY)
+            if day <= horizon:
+                unlocks[farm_id, day - 1] += liquidity
+            continue
+        cooldown_days = -(-cooldown_period // ONE_DAY)
+        for day in range(1, horizon + 1):
+            share = cooldown_rate * (1 - cooldown_rate) ** (day - 1)
+            initiations[farm_id, day - 1] += liquidity * share
+            if day + cooldown_days <= horizon:
+                unlocks[farm_id, day + cooldown_days - 1] += liquidity * share
+    return initiations, unlocks
+
+
+def test_cooling_deposits_unlock_on_their_expiry_day():
+    deposits = [
+        (0, 100, NOW + 1, 0),
+        (0, 200, NOW + ONE_DAY, 0),
+        (0, 400, NOW + ONE_DAY + 1, 0),
+        (1, 800, NOW + 3 * ONE_DAY, 0),
+        # Beyond the horizon and already unlocked deposits do not exit.
+        (1, 1600, NOW + 10 * ONE_DAY, 0),
+        (1, 3200, NOW, 0)
+    ]
+    initiations, unlocks = _curves(deposits, 2, 5, 0.1)
+    assert initiations.tolist() == [[0] * 5, [0] * 5]
+    assert unlocks.tolist() == [
+        [300, 400, 0, 0, 0],
+        [0, 0, 800, 0, 0]
+    ]
+
+
+def test_locked_deposits_unlock_a_cooldown_after_initiation():
+    # 7 day cooldown, half of the locked liquidity initiates every day.
+    deposits = [(0, 1000, 0, 7 * ONE_DAY)]
+    initiations, unlocks = _curves(deposits, 1, 10, 0.5)
+    assert initiations[0].tolist() == [
+        500, 250, 125, 62.5, 31.25, 15.625, 7.8125, 3.90625, 1.953125,
+        0.9765625
+    ]
+    assert unlocks[0].tolist() == [0] * 7 + [500, 250, 125]
+
+
+def test_without_cooldown_rate_locked_deposits_stay():
+    deposits = [(0, 1000, 0, ONE_DAY), (0, 10, NOW + 1, 0)]
+    initiations, unlocks = _curves(deposits, 1, 3, 0)
+    assert initiations[0].tolist() == [0, 0, 0]
+    assert unlocks[0].tolist() == [10, 0, 0]
+
+
+def test_curves_match_brute_force():
+    rng = np.random.default_rng(0)
+    num_farms = 4
+    horizon = 60
+    deposits = []
+    for _ in range(300):
+        if rng.random() < 0.5:
+            deposits.append((
+                int(rng.integers(num_farms)),
+                float(rng.integers(1, 10**6)),
+                0,
+                int(rng.integers(1, 31)) * ONE_DAY
+            ))
+        else:
+            deposits.append((
+                int(rng.integers(num_farms)),
+                float(rng.integers(1, 10**6)),
+                NOW + int(rng.integers(-10, 90 * ONE_DAY)),
+                0
+            ))
+    initiations, unlocks = _curves(deposits, num_farms, horizon, 0.03)
+    expected_initiations, expected_unlocks = _brute_force(
+        deposits,
+        num_farms,
+        horizon,
+        0.03
+    )
+    np.testing.assert_allclose(initiations, expected_initiations)
+    np.testing.assert_allclose(unlocks, expected_unlocks)
+
+
+def test_no_deposits():
+    initiations, unlocks = exit_forecast.get_exit_curves(
+        exit_forecast.Deposit_arrays([], [], [], []),
+        2,
+        NOW,
+        3,
+        0.1
+    )
+    assert initiations.shape == (2, 3)
+    assert not unlocks.any()
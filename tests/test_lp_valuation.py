@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+lp_valuation = pytest.importorskip(
+    'scripts.lp_valuation',
+    reason='needs the brownie project'
+)
+
+UINT112_MAX = 2**112 - 1
+UINT256_MAX = 2**256 - 1
+
+
+def _get_amounts(liquidity, pool_ids, balances, supplies):
+    return lp_valuation.get_lp_amounts(
+        np.array(liquidity, dtype=object),
+        np.array(pool_ids, dtype=np.int64),
+        np.array(balances, dtype=object),
+        np.array(supplies, dtype=object)
+    ).tolist()
+
+
+def test_amounts_floor_like_solidity():
+    # 10 * 7 // 3 = 23 and 10 * 5 // 3 = 16, as uint256 division.
+    assert _get_amounts([10], [0], [[7, 5]], [3]) == [[23, 16]]
+
+
+def test_amounts_exact_beyond_float_precision():
+    liquidity = 2**200 + 12345
+    reserve_0 = UINT112_MAX
+    reserve_1 = 2**111 + 1
+    supply = 2**201 + 7
+    amounts = _get_amounts(
+        [liquidity],
+        [0],
+        [[reserve_0, reserve_1]],
+        [supply]
+    )
+    assert amounts == [[
+        liquidity * reserve_0 // supply,
+        liquidity * reserve_1 // supply
+    ]]
+    # Intermediate products above uint256 must not overflow.
+    assert liquidity * reserve_0 > UINT256_MAX
+
+
+def test_amounts_of_several_pools_and_deposits():
+    balances = [
+        [1000, 3000, 0],
+        [10**18, 2 * 10**18, 3 * 10**18]
+    ]
+    supplies = [400, 6 * 10**18]
+    liquidity = [100, 3 * 10**18, 1, 399]
+    pool_ids = [0, 1, 1, 0]
+    assert _get_amounts(liquidity, pool_ids, balances, supplies) == [
+        [250, 750, 0],
+        [5 * 10**17, 10**18, 15 * 10**17],
+        [0, 0, 0],
+        [997, 2992, 0]
+    ]
+
+
+def test_empty_pool_has_no_amounts():
+    assert _get_amounts([0, 5], [0, 0], [[0, 0]], [0]) == [[0, 0], [0, 0]]
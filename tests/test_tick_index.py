@@ -0,0 +1,156 @@
+from scripts.tick_index import (
+    MAX_TICK,
+    MIN_TICK,
+    Fenwick_tree,
+    Tick_index
+)
+import random
+
+import pytest
+
+NUM_POSITIONS = 500
+NUM_QUERIES = 300
+
+
+def _random_positions(rng, num_positions, first_id=1):
+    positions = []
+    for deposit_id in range(first_id, first_id + num_positions):
+        # Mix of narrow and wide ranges, some at the tick bounds.
+        width = rng.choice([1, 2, 3, 10, 60, 1000, 2**15, 2**19])
+        width = rng.randint(1, width)
+        tick_lower = rng.randint(MIN_TICK, MAX_TICK - width)
+        if rng.random() < 0.02:
+            tick_lower = MIN_TICK
+        positions.append((
+            deposit_id,
+            tick_lower,
+            tick_lower + width,
+            rng.randint(1, 10**24)
+        ))
+    return positions
+
+
+def _random_range(rng, positions):
+    # Queries around existing ticks hit the class bounds exactly.
+    _, tick_lower, tick_upper, _ = rng.choice(positions)
+    tick_a = rng.choice([
+        tick_lower - 1,
+        tick_lower,
+        tick_upper - 1,
+        tick_upper,
+        rng.randint(MIN_TICK, MAX_TICK)
+    ])
+    tick_b = tick_a + rng.choice([0, 0, 1, 5, 100, 2**16])
+    return max(tick_a, MIN_TICK), min(tick_b, MAX_TICK)
+
+
+def _in_range(positions, tick_a, tick_b):
+    return sorted(
+        deposit_id
+        for deposit_id, (tick_lower, tick_upper, _) in positions.items()
+        if tick_lower <= tick_b and tick_upper > tick_a
+    )
+
+
+def _liquidity(positions, tick_a, tick_b):
+    return sum(
+        liquidity
+        for tick_lower, tick_upper, liquidity in positions.values()
+        if tick_lower <= tick_b and tick_upper > tick_a
+    )
+
+
+def _check(index, positions, rng):
+    position_list = [(id_, *position) for id_, position in positions.items()]
+    for _ in range(NUM_QUERIES):
+        tick_a, tick_b = _random_range(rng, position_list)
+        expected = _in_range(positions, tick_a, tick_b)
+        assert sorted(index.deposits_in_range(tick_a, tick_b)) == expected
+        assert index.liquidity_in_range(tick_a, tick_b) == \
+            _liquidity(positions, tick_a, tick_b)
+    assert index.total_liquidity == sum(
+        liquidity for _, _, liquidity in positions.values()
+    )
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_load_matches_add_and_brute_force(seed):
+    rng = random.Random(seed)
+    positions = _random_positions(rng, NUM_POSITIONS)
+    loaded = Tick_index()
+    loaded.load(positions)
+    added = Tick_index()
+    for position in positions:
+        added.add(*position)
+
+    assert loaded.classes == added.classes
+    assert {
+        i: v for i, v in loaded.by_lower.tree.items() if v
+    } == {i: v for i, v in added.by_lower.tree.items() if v}
+    assert {
+        i: v for i, v in loaded.by_upper.tree.items() if v
+    } == {i: v for i, v in added.by_upper.tree.items() if v}
+    expected = {
+        deposit_id: [tick_lower, tick_upper, liquidity]
+        for deposit_id, tick_lower, tick_upper, liquidity in positions
+    }
+    _check(loaded, expected, rng)
+    _check(added, expected, rng)
+
+
+def test_updates_after_load_match_brute_force():
+    rng = random.Random(3)
+    positions = _random_positions(rng, NUM_POSITIONS)
+    index = Tick_index()
+    index.load(positions)
+    expected = {
+        deposit_id: [tick_lower, tick_upper, liquidity]
+        for deposit_id, tick_lower, tick_upper, liquidity in positions
+    }
+    for deposit_id in rng.sample(sorted(expected), 100):
+        index.remove(deposit_id)
+        del expected[deposit_id]
+    for deposit_id in rng.sample(sorted(expected), 100):
+        delta = rng.randint(-expected[deposit_id][2] + 1, 10**20)
+        index.update_liquidity(deposit_id, delta)
+        expected[deposit_id][2] += delta
+    # Loading a non empty index adds the positions one by one, a known
+    # deposit id replaces its position.
+    new_positions = _random_positions(rng, 50, NUM_POSITIONS + 1)
+    moved = _random_positions(rng, 1)[0]
+    moved = (sorted(expected)[0],) + moved[1:]
+    index.load(new_positions + [moved])
+    for deposit_id, tick_lower, tick_upper, liquidity in \
+            new_positions + [moved]:
+        expected[deposit_id] = [tick_lower, tick_upper, liquidity]
+    assert len(index) == len(expected)
+    _check(index, expected, rng)
+
+
+def test_load_keeps_the_last_duplicate():
+    index = Tick_index()
+    index.load([(1, 0, 10, 5), (2, 5, 6, 7), (1, 20, 30, 9)])
+    assert index.positions == {1: [20, 30, 9], 2: [5, 6, 7]}
+    assert index.deposits_in_range(25) == [1]
+    assert index.liquidity_in_range(0, 100) == 16
+
+
+def test_fenwick_build_matches_add():
+    rng = random.Random(4)
+    values = {
+        rng.randint(MIN_TICK, MAX_TICK): rng.randint(-10**6, 10**6)
+        for _ in range(1000)
+    }
+    values[MIN_TICK] = 3
+    values[MAX_TICK] = 4
+    built = Fenwick_tree()
+    built.build(values)
+    added = Fenwick_tree()
+    for tick, value in values.items():
+        added.add(tick, value)
+    assert built.tree == added.tree
+    ticks = sorted(values)
+    for tick in rng.sample(ticks, 100) + [MIN_TICK, MAX_TICK]:
+        assert built.prefix_sum(tick) == sum(
+            value for t, value in values.items() if t <= tick
+        )